@@ -0,0 +1,113 @@
+"""
+Microbenchmark for the float coercion done while parsing GSM documents
+
+Collects every text and attribute value that getSampleMetadata tries to turn
+into a float from a directory of cached GSM MINiML documents, then times the
+original try/except coercion against geoMetadata.miniml.toFloat and checks
+that both give exactly the same typed output.
+
+Usage:
+    python benchmarks/benchFloatCoercion.py <directory of GSM*.xml files>
+
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+import lxml.etree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    os.pardir))
+
+from geoMetadata.miniml import toFloat
+
+def tryFloat(value):
+    """
+    The coercion getSampleMetadata used before toFloat
+
+    Input:
+        value: Text or attribute value pulled from a MINiML element
+    Return:
+        The value as a float if float() accepts it, otherwise the value
+
+    """
+
+    try:
+        return(float(value))
+    except:
+        return(value)
+
+def getCoercedValues(directory):
+    """
+    Collect the values getSampleMetadata coerces from cached documents
+
+    Input:
+        directory: Folder holding cached GSM MINiML documents
+    Return:
+        List of every value that is passed through the float coercion
+
+    """
+
+    values = []
+
+    for filename in sorted(os.listdir(directory)):
+        if(not filename.endswith('.xml')):
+            continue
+
+        root = ET.parse(os.path.join(directory, filename)).getroot()
+        sampleElement = root.find('{http://www.ncbi.nlm.nih.gov/geo/'\
+            'info/MINiML}Sample')
+        if(sampleElement is None):
+            continue
+
+        # Only elements with attributes are coerced. The text is coerced if
+        # it remains after stripping, otherwise the last attribute value is
+        for child in sampleElement.iter():
+            attrib = child.attrib
+            if(not attrib):
+                continue
+
+            text = child.text
+            if(text):
+                text = text.replace('\n', '').rstrip()
+            if(text):
+                values.append(text)
+            else:
+                values.append(attrib.get(list(attrib.keys())[-1]))
+
+    return(values)
+
+def main():
+    parser = argparse.ArgumentParser(description='Time float coercion '\
+        'over cached GSM documents')
+    parser.add_argument('directory', help='Folder of cached GSM xml files')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+        help='Number of timing repeats')
+    parser.add_argument('-n', '--number', type=int, default=100,
+        help='Passes over the values per repeat')
+    args = parser.parse_args()
+
+    values = getCoercedValues(args.directory)
+    if(not values):
+        sys.exit('No coerced values found in %s' % args.directory)
+
+    # Typed output has to be identical, including str vs float
+    baseline = [tryFloat(value) for value in values]
+    current = [toFloat(value) for value in values]
+    for old, new in zip(baseline, current):
+        if(type(old) is not type(new) or old != new and old == old):
+            sys.exit('Mismatch: %r became %r' % (old, new))
+
+    numeric = sum(1 for value in baseline if type(value) is float)
+    print('%d values (%d numeric)' % (len(values), numeric))
+
+    for name, function in (('try/except', tryFloat), ('toFloat', toFloat)):
+        times = timeit.repeat(lambda: [function(value) for value in values],
+            repeat=args.repeat, number=args.number)
+        perValue = min(times) / (args.number * len(values)) * 1e9
+        print('%-10s %8.1f ns/value' % (name, perValue))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Startup time benchmark for every entry point
+
+Imports each entry point in a fresh interpreter with python -X importtime and
+records the total import time, the slowest imported modules and whether any
+heavy dependency (pandas, lxml, Bio, synapseclient) was loaded. Results are
+appended as one JSON line per entry point so they can be tracked between
+versions.
+
+Usage:
+    python benchmarks/benchStartup.py [-o results file] [-r repeats]
+
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Repository root, added to the path of every child interpreter
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# Default file the results are appended to
+RESULTS_FILENAME = os.path.join(ROOT, 'benchmarks', 'results',
+    'startup.jsonl')
+
+# Modules that should only load once a run actually needs them
+HEAVY_MODULES = ['pandas', 'lxml', 'Bio', 'synapseclient']
+
+# Name of each entry point -> code importing it the way a run starts
+ENTRY_POINTS = [
+    ('getGeoMetadata.py', 'import getGeoMetadata'),
+    ('getGeoMetadataSingle.py', 'import getGeoMetadataSingle'),
+    ('getGeoMetadataBySample.py', 'import getGeoMetadataBySample'),
+    ('uploadToSynapse.py', 'import uploadToSynapse'),
+    ('geoMetadata', 'import geoMetadata'),
+    ('python -m geoMetadata', 'import geoMetadata.cli; '\
+        'geoMetadata.cli.getParser()'),
+]
+
+def parseImportTime(stderr):
+    """
+    Parse the output of python -X importtime
+
+    Input:
+        stderr: Standard error of the child interpreter
+    Return:
+        Dictionary mapping each top level imported module to its cumulative
+        import time in microseconds
+
+    """
+
+    modules = {}
+
+    for line in stderr.splitlines():
+        if(not line.startswith('import time:') or 'cumulative' in line):
+            continue
+
+        # Lines look like 'import time: self | cumulative | name'
+        fields = line.split(':', 1)[1].split('|')
+        name = fields[2].rstrip()
+
+        # Only top level imports are counted so nothing is added twice
+        if(name.startswith(' ') and name.strip() and
+                not name[1:].startswith(' ')):
+            modules[name.strip()] = int(fields[1])
+
+    return(modules)
+
+def timeEntryPoint(code):
+    """
+    Import an entry point in a fresh interpreter
+
+    Input:
+        code: Python code importing the entry point
+    Return:
+        Tuple of the wall time in seconds and the parsed import times
+
+    """
+
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = ROOT
+
+    start = time.time()
+    child = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, env=environment, stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE, universal_newlines=True)
+    stdout, stderr = child.communicate()
+    wallTime = time.time() - start
+
+    if(child.returncode != 0):
+        raise RuntimeError('Importing failed: %s\n%s' % (code, stderr))
+
+    return(wallTime, parseImportTime(stderr))
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the startup of '\
+        'every entry point')
+    parser.add_argument('-o', '--output', default=RESULTS_FILENAME,
+        help='File to append the JSON results to')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+        help='Fresh interpreters started per entry point')
+    parser.add_argument('-t', '--top', type=int, default=5,
+        help='Number of slowest modules to record')
+    args = parser.parse_args()
+
+    results = []
+
+    for name, code in ENTRY_POINTS:
+        runs = [timeEntryPoint(code) for i in range(args.repeat)]
+
+        # The fastest run has the least noise from the rest of the machine
+        wallTime, modules = min(runs, key=lambda run: run[0])
+        slowest = sorted(modules.items(), key=lambda item: -item[1])
+
+        results.append({
+            'entryPoint': name,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'wallSeconds': round(wallTime, 4),
+            'importMicroseconds': sum(modules.values()),
+            'slowestModules': slowest[:args.top],
+            'heavyModules': [module for module in HEAVY_MODULES
+                if any(imported == module or imported.startswith(module + '.')
+                for imported in modules)],
+        })
+
+        print('%-26s %8.1f ms wall %8.1f ms import  heavy: %s' % (name,
+            wallTime * 1000, results[-1]['importMicroseconds'] / 1000.0,
+            ', '.join(results[-1]['heavyModules']) or '-'))
+
+    directory = os.path.dirname(args.output)
+    if(directory and not os.path.exists(directory)):
+        os.makedirs(directory)
+
+    with open(args.output, 'a') as f:
+        for result in results:
+            f.write('%s\n' % json.dumps(result))
+
+if __name__ == "__main__":
+    main()
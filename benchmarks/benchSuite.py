@@ -0,0 +1,246 @@
+"""
+Offline benchmark suite for the parse, write and merge stages
+
+Generates synthetic corpora with benchmarks/syntheticGEO.py and times:
+    parse: lxml parsing plus MINiMLParser.parseSample for every sample
+    writeLong: writers.writeLong for every series (one row per characteristic)
+    writeWide: writers.writeWide for every series (one row per sample)
+    writeMerged: synapse.writeMerged, the aligned merged file and column
+        measurements made before an upload. Named apart from the merge
+        stage of earlier results, which only timed the in memory concat of
+        the frames, so the two are never compared
+
+Each result is appended to benchmarks/results/suite.jsonl and compared with
+the last saved result of the same scenario, so regressions between versions
+show up as soon as the suite is run.
+
+Usage:
+    python benchmarks/benchSuite.py [scenario ...] [-r repeats]
+        [--threshold 0.1] [--fail-on-regression]
+
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, ROOT)
+
+from syntheticGEO import CorpusSettings, makeCorpus
+
+# Default file the results are appended to
+RESULTS_FILENAME = os.path.join(ROOT, 'benchmarks', 'results', 'suite.jsonl')
+
+# Name -> shape of each corpus the suite runs on
+SCENARIOS = {
+    'baseline': CorpusSettings(samples=500, series=10),
+    'wideKeys': CorpusSettings(samples=500, series=10, keys=500,
+        keysPerSample=20),
+    'twoChannel': CorpusSettings(samples=500, series=10,
+        twoChannelFraction=0.5),
+    'largeText': CorpusSettings(samples=200, series=10, textSize=20000),
+}
+
+def getRevision():
+    """
+    Get the git revision of the tree being benchmarked
+
+    Return:
+        Short revision hash, with + appended for uncommitted changes, or
+        None outside a git checkout
+
+    """
+
+    try:
+        revision = subprocess.check_output(['git', 'rev-parse', '--short',
+            'HEAD'], cwd=ROOT, stderr=subprocess.STDOUT).decode().strip()
+        changes = subprocess.check_output(['git', 'status', '--porcelain',
+            '--untracked-files=no'], cwd=ROOT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return(None)
+
+    if(changes):
+        revision += '+'
+
+    return(revision)
+
+def best(function, repeat):
+    """
+    Time a function
+
+    Input:
+        function: Function to time
+        repeat: Number of times to run it
+    Return:
+        Tuple of the fastest time in seconds and the last return value
+
+    """
+
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        result = function()
+        times.append(time.time() - start)
+
+    return(min(times), result)
+
+def runScenario(settings, repeat):
+    """
+    Time every stage on one corpus
+
+    Input:
+        settings: CorpusSettings of the corpus
+        repeat: Number of runs of each stage, the fastest is kept
+    Return:
+        Dictionary of stage -> seconds
+
+    """
+
+    import lxml.etree as ET
+
+    from geoMetadata.miniml import MINiMLParser
+    from geoMetadata.schema import SchemaRegistry
+    from geoMetadata.synapse import writeMerged
+    from geoMetadata.writers import writeLong, writeWide
+
+    samples, series = makeCorpus(settings)
+    parser = MINiMLParser()
+    timings = {}
+
+    def parse():
+        return(dict((sampleID, parser.parseSample(ET.fromstring(document)))
+            for sampleID, document in samples.items()))
+
+    timings['parse'], records = best(parse, repeat)
+
+    # Group the records the way a run hands them to the writers
+    metadataBySeries = dict((seriesID, [records[sampleID]
+        for sampleID in sampleIDs]) for seriesID, sampleIDs in series.items())
+
+    directory = tempfile.mkdtemp()
+    try:
+        def writeAllLong():
+            return([writeLong(metadata, seriesID, directory)
+                for seriesID, metadata in sorted(metadataBySeries.items())])
+
+        def writeAllWide():
+            for seriesID, metadata in sorted(metadataBySeries.items()):
+                writeWide(metadata, seriesID, directory)
+
+        def writeAllMerged():
+            schema = SchemaRegistry()
+            for frame in frames:
+                schema.addFrame(frame)
+            return(writeMerged(os.path.join(directory, 'allData.csv'),
+                schema, frames))
+
+        timings['writeLong'], frames = best(writeAllLong, repeat)
+        timings['writeWide'] = best(writeAllWide, repeat)[0]
+        timings['writeMerged'] = best(writeAllMerged, repeat)[0]
+    finally:
+        shutil.rmtree(directory)
+
+    return(timings)
+
+def getPreviousResult(filename, scenario, settings):
+    """
+    Find the last saved result of a scenario with the same settings
+
+    Input:
+        filename: File the results are saved in
+        scenario: Name of the scenario
+        settings: Dictionary of the corpus settings
+    Return:
+        The saved result, or None if there is none
+
+    """
+
+    if(not os.path.exists(filename)):
+        return(None)
+
+    previous = None
+    with open(filename, 'r') as f:
+        for line in f:
+            result = json.loads(line)
+            if(result['scenario'] == scenario and
+                    result['settings'] == settings):
+                previous = result
+
+    return(previous)
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the parse, write '\
+        'and merge stages on synthetic corpora')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+        help='Scenarios to run: %s (default: all)' %
+        ', '.join(sorted(SCENARIOS)))
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+        help='Runs of each stage, the fastest is kept (default: '\
+        '%(default)s)')
+    parser.add_argument('-o', '--output', default=RESULTS_FILENAME,
+        help='File to append the JSON results to')
+    parser.add_argument('--threshold', type=float, default=0.1,
+        help='Slowdown against the previous result reported as a '\
+        'regression (default: %(default)s)')
+    parser.add_argument('--fail-on-regression', dest='failOnRegression',
+        action='store_true', help='Exit with an error if any stage '\
+        'regressed')
+    args = parser.parse_args()
+
+    scenarios = args.scenarios or sorted(SCENARIOS)
+    for scenario in scenarios:
+        if(scenario not in SCENARIOS):
+            parser.error('Unknown scenario: %s' % scenario)
+
+    import lxml.etree
+    import pandas
+
+    revision = getRevision()
+    regressions = []
+    results = []
+
+    for scenario in scenarios:
+        settings = SCENARIOS[scenario].toDict()
+        timings = runScenario(SCENARIOS[scenario], args.repeat)
+        previous = getPreviousResult(args.output, scenario, settings)
+
+        print('%s (%d samples)' % (scenario, settings['samples']))
+        for stage in sorted(timings):
+            line = '  %-11s %9.1f ms' % (stage, timings[stage] * 1000)
+
+            if(previous and stage in previous['timings']):
+                change = timings[stage] / previous['timings'][stage] - 1
+                line += '  %+6.1f%% vs %s' % (change * 100,
+                    previous['revision'])
+                if(change > args.threshold):
+                    line += '  REGRESSION'
+                    regressions.append('%s %s' % (scenario, stage))
+
+            print(line)
+
+        results.append({'scenario': scenario, 'settings': settings,
+            'timings': timings, 'revision': revision,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'pandas': pandas.__version__,
+            'lxml': '.'.join(str(part) for part in lxml.etree.LXML_VERSION)})
+
+    directory = os.path.dirname(args.output)
+    if(directory and not os.path.exists(directory)):
+        os.makedirs(directory)
+
+    with open(args.output, 'a') as f:
+        for result in results:
+            f.write('%s\n' % json.dumps(result, sort_keys=True))
+
+    if(regressions and args.failOnRegression):
+        sys.exit('Regressions: %s' % ', '.join(regressions))
+
+if __name__ == "__main__":
+    main()
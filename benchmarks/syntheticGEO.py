@@ -0,0 +1,328 @@
+"""
+Generator for synthetic GEO MINiML documents
+
+Builds sample (GSM) and series (GSE) documents shaped like the brief MINiML
+view GEO returns, so the parse and write code can be benchmarked and tested
+without any network. Every document is generated from a seed, so the same
+settings always give the same corpus.
+
+Usage:
+    python benchmarks/syntheticGEO.py <directory> [-s samples] [-k keys] ...
+
+The directory gets one GSM<n>.xml per sample and one GSE<n>.xml per series,
+named the way --cache-dir names its files.
+
+"""
+
+import argparse
+import os
+import random
+
+from xml.sax.saxutils import escape, quoteattr
+
+# Namespace of every element in a MINiML document
+MINIML_NAMESPACE = 'http://www.ncbi.nlm.nih.gov/geo/info/MINiML'
+
+# Words the free text fields are built from
+WORDS = ['total', 'RNA', 'was', 'extracted', 'from', 'frozen', 'tissue',
+    'using', 'the', 'kit', 'according', 'to', 'manufacturer', 'protocol',
+    'samples', 'were', 'hybridized', 'scanned', 'normalized', 'with', 'RMA',
+    'cells', 'treated', 'control', 'patient', 'biopsy', 'array', 'labeled']
+
+# Values given to text characteristics
+TEXT_VALUES = ['male', 'female', 'Male', 'F', 'M', 'kidney', 'liver', 'lung',
+    'tumor', 'normal', 'treated', 'untreated', 'wild type', 'knockout']
+
+class CorpusSettings(object):
+    """
+    Shape of a synthetic corpus
+
+    """
+
+    def __init__(self, samples=100, series=1, keys=20, keysPerSample=8,
+            twoChannelFraction=0.0, textSize=200, seed=0):
+        # Number of sample documents
+        self.samples = samples
+
+        # Number of series the samples are spread across
+        self.series = series
+
+        # Distinct characteristic keys across the whole corpus
+        self.keys = keys
+
+        # Characteristics given to each channel of a sample
+        self.keysPerSample = min(keysPerSample, keys)
+
+        # Fraction of samples with two channels
+        self.twoChannelFraction = twoChannelFraction
+
+        # Characters in each large free text field
+        self.textSize = textSize
+
+        # Seed of the random number generator
+        self.seed = seed
+
+    def toDict(self):
+        return(dict(self.__dict__))
+
+def makeText(generator, size):
+    """
+    Build free text of about the given size
+
+    Input:
+        generator: random.Random used for the corpus
+        size: Number of characters wanted
+    Return:
+        The text
+
+    """
+
+    words = []
+    length = 0
+    while(length < size):
+        word = generator.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+
+    return(' '.join(words))
+
+def makeChannel(generator, settings, position):
+    """
+    Build the Channel element of a sample
+
+    Input:
+        generator: random.Random used for the corpus
+        settings: CorpusSettings of the corpus
+        position: Position of the channel, starting at 1
+    Return:
+        The element as text
+
+    """
+
+    lines = ['    <Channel position="%d">' % position,
+        '      <Source>%s</Source>' % escape(makeText(generator, 20)),
+        '      <Organism taxid="9606">Homo sapiens</Organism>']
+
+    for key in generator.sample(range(settings.keys),
+            settings.keysPerSample):
+        # Mix numeric and text values, with the padding GEO puts around
+        # characteristic values
+        if(key % 3 == 0):
+            value = '%d' % generator.randint(1, 90)
+        elif(key % 3 == 1):
+            value = '%.2f' % generator.uniform(0, 100)
+        else:
+            value = generator.choice(TEXT_VALUES)
+
+        lines.append('      <Characteristics tag=%s>\n%s\n      '\
+            '</Characteristics>' % (quoteattr('key%d' % key), escape(value)))
+
+    lines.extend(['      <Molecule>total RNA</Molecule>',
+        '      <Extract-Protocol>\n%s\n      </Extract-Protocol>' %
+        escape(makeText(generator, settings.textSize)),
+        '      <Label>%s</Label>' % ('Cy3' if position == 1 else 'Cy5'),
+        '    </Channel>'])
+
+    return('\n'.join(lines))
+
+def makeSampleDocument(sampleID, generator, settings):
+    """
+    Build the brief MINiML document of a sample
+
+    Input:
+        sampleID: GSM accession number of the sample
+        generator: random.Random used for the corpus
+        settings: CorpusSettings of the corpus
+    Return:
+        The document as UTF-8 bytes
+
+    """
+
+    channelCount = 1
+    if(generator.random() < settings.twoChannelFraction):
+        channelCount = 2
+
+    channels = [makeChannel(generator, settings, position)
+        for position in range(1, channelCount + 1)]
+
+    document = '''<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<MINiML xmlns="%(namespace)s" version="0.5.0">
+  <Contributor iid="contrib1">
+    <Person><First>Jane</First><Last>Doe</Last></Person>
+  </Contributor>
+  <Sample iid="%(sampleID)s">
+    <Status database="GEO">
+      <Submission-Date>2010-01-%(day)02d</Submission-Date>
+      <Release-Date>2010-02-%(day)02d</Release-Date>
+      <Last-Update-Date>2011-03-%(day)02d</Last-Update-Date>
+    </Status>
+    <Title>%(title)s</Title>
+    <Accession database="GEO">%(sampleID)s</Accession>
+    <Type>RNA</Type>
+    <Channel-Count>%(channelCount)d</Channel-Count>
+%(channels)s
+    <Hybridization-Protocol>
+%(hybridization)s
+    </Hybridization-Protocol>
+    <Description>
+%(description)s
+    </Description>
+    <Data-Processing>
+%(processing)s
+    </Data-Processing>
+    <Platform-Ref ref="GPL570" />
+    <Contact-Ref ref="contrib1" />
+    <Supplementary-Data type="CEL">
+ftp://ftp.ncbi.nlm.nih.gov/geo/samples/%(sampleID)s.CEL.gz
+    </Supplementary-Data>
+  </Sample>
+</MINiML>
+''' % {'namespace': MINIML_NAMESPACE, 'sampleID': sampleID,
+        'day': generator.randint(1, 28),
+        'title': escape(makeText(generator, 30)),
+        'channelCount': channelCount, 'channels': '\n'.join(channels),
+        'hybridization': escape(makeText(generator, settings.textSize)),
+        'description': escape(makeText(generator, settings.textSize)),
+        'processing': escape(makeText(generator, settings.textSize))}
+
+    return(document.encode('utf-8'))
+
+def makeSeriesDocument(seriesID, sampleIDs, subSeriesIDs=()):
+    """
+    Build the brief MINiML document of a series
+
+    Input:
+        seriesID: GSE accession number of the series
+        sampleIDs: GSM accession numbers of the samples in the series
+        subSeriesIDs: GSE accession numbers of the SubSeries, to build a
+            SuperSeries
+    Return:
+        The document as UTF-8 bytes
+
+    """
+
+    relations = ''.join('\n    <Relation type="SuperSeries of" '\
+        'target="%s" />' % subSeriesID for subSeriesID in subSeriesIDs)
+
+    samples = '\n'.join('  <Sample iid="%s">\n    <Accession database='\
+        '"GEO">%s</Accession>\n  </Sample>' % (sampleID, sampleID)
+        for sampleID in sampleIDs)
+
+    document = '''<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<MINiML xmlns="%s" version="0.5.0">
+  <Series iid="%s">
+    <Status database="GEO">
+      <Last-Update-Date>2011-03-01</Last-Update-Date>
+    </Status>
+    <Title>Synthetic series</Title>
+    <Accession database="GEO">%s</Accession>%s
+  </Series>
+%s
+</MINiML>
+''' % (MINIML_NAMESPACE, seriesID, seriesID, relations, samples)
+
+    return(document.encode('utf-8'))
+
+def makeCorpus(settings):
+    """
+    Build every document of a corpus
+
+    Input:
+        settings: CorpusSettings of the corpus
+    Return:
+        Tuple of a dictionary of GSM ID -> sample document and a dictionary
+        of GSE ID -> list of its GSM IDs
+
+    """
+
+    generator = random.Random(settings.seed)
+
+    samples = {}
+    series = {}
+
+    for i in range(settings.samples):
+        sampleID = 'GSM%d' % (i + 1)
+        samples[sampleID] = makeSampleDocument(sampleID, generator, settings)
+
+        # Deal the samples out to the series in order
+        seriesID = 'GSE%d' % (i * settings.series // settings.samples + 1)
+        series.setdefault(seriesID, []).append(sampleID)
+
+    return(samples, series)
+
+def writeCorpus(directory, settings):
+    """
+    Write a corpus to a folder
+
+    Input:
+        directory: Folder to write the documents to
+        settings: CorpusSettings of the corpus
+    Return:
+        Dictionary of GSE ID -> list of its GSM IDs
+
+    """
+
+    samples, series = makeCorpus(settings)
+
+    if(not os.path.exists(directory)):
+        os.makedirs(directory)
+
+    for accessionID, document in samples.items():
+        with open(os.path.join(directory, '%s.xml' % accessionID), 'wb') as f:
+            f.write(document)
+
+    for seriesID, sampleIDs in series.items():
+        with open(os.path.join(directory, '%s.xml' % seriesID), 'wb') as f:
+            f.write(makeSeriesDocument(seriesID, sampleIDs))
+
+    return(series)
+
+def addCorpusArguments(parser):
+    """
+    Add the CorpusSettings options to an argument parser
+
+    """
+
+    defaults = CorpusSettings()
+    parser.add_argument('-s', '--samples', type=int, default=defaults.samples,
+        help='Number of samples (default: %(default)s)')
+    parser.add_argument('--series', type=int, default=defaults.series,
+        help='Number of series (default: %(default)s)')
+    parser.add_argument('-k', '--keys', type=int, default=defaults.keys,
+        help='Distinct characteristic keys (default: %(default)s)')
+    parser.add_argument('--keys-per-sample', dest='keysPerSample', type=int,
+        default=defaults.keysPerSample, help='Characteristics per channel '\
+        '(default: %(default)s)')
+    parser.add_argument('--two-channel', dest='twoChannelFraction',
+        type=float, default=defaults.twoChannelFraction, help='Fraction of '\
+        'two channel samples (default: %(default)s)')
+    parser.add_argument('--text-size', dest='textSize', type=int,
+        default=defaults.textSize, help='Characters in each large text '\
+        'field (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=defaults.seed,
+        help='Random seed (default: %(default)s)')
+
+def getCorpusSettings(args):
+    """
+    Build CorpusSettings from parsed arguments
+
+    """
+
+    return(CorpusSettings(samples=args.samples, series=args.series,
+        keys=args.keys, keysPerSample=args.keysPerSample,
+        twoChannelFraction=args.twoChannelFraction, textSize=args.textSize,
+        seed=args.seed))
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic GEO '\
+        'corpus')
+    parser.add_argument('directory', help='Folder to write the documents to')
+    addCorpusArguments(parser)
+    args = parser.parse_args()
+
+    series = writeCorpus(args.directory, getCorpusSettings(args))
+    print('Wrote %d samples in %d series to %s' % (args.samples, len(series),
+        args.directory))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+"""
+Shared core of the getGeoMetadata scripts
+
+Fetching, parsing and writing of GEO metadata lives here so that every entry
+point (getGeoMetadata.py, getGeoMetadataSingle.py, getGeoMetadataBySample.py,
+uploadToSynapse.py and python -m geoMetadata) runs the same code.
+
+"""
+
+from geoMetadata.fetch import (getGDSMetadata, getSampleMetadata,
+    getSamples, getSamplesFromGDS, getSamplesFromOthers)
+from geoMetadata.miniml import MINiMLParser, toFloat
+from geoMetadata.pipeline import (getAccessionIDsFromFile,
+    getAccessionMetadata, runBatch, runBySample, runSingle)
+from geoMetadata.writers import writeLong, writeWide
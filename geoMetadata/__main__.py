@@ -0,0 +1,4 @@
+from geoMetadata.cli import main
+
+if __name__ == "__main__":
+    main()
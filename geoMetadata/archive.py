@@ -0,0 +1,254 @@
+"""
+Read sample metadata from local GEO MINiML family archives
+
+A family archive (GSExxx_family.xml.tgz, from the GEO FTP site) holds the
+full MINiML document of a series with every one of its samples, so a
+backfill can be read without a request per sample. Each archive is memory
+mapped and its members are decompressed and fed to the lxml parser as a
+stream, so nothing is extracted to disk and only one Sample element is held
+at a time. Every sample gives the same record getSampleMetadata builds from
+the sample's own document.
+
+Folders of thousands of archives are read by a pool of processes, as parsing
+holds the GIL.
+
+"""
+
+import mmap
+import os
+import tarfile
+import time
+
+from functools import partial
+from multiprocessing import Pool
+
+from geoMetadata import fetch
+from geoMetadata.fetch import getParser
+from geoMetadata.miniml import MINIML_NAMESPACE
+from geoMetadata.profiling import profiled
+
+# File name endings of the archives and documents that are read. Plain
+# .xml files are family documents that were already extracted
+ARCHIVE_SUFFIXES = ('.tgz', '.tar.gz', '.tar', '.xml')
+
+# Qualified tag of the data table description in a family document. The
+# brief document of a sample has no data table, so it is left out to give
+# the same record
+DATA_TABLE_TAG = '{%s}Data-Table' % MINIML_NAMESPACE
+
+class ArchiveError(Exception):
+    """
+    Failure to read one archive, as handed back from a worker process
+
+    Only the text of the original error is kept, as not every exception
+    survives being sent between processes.
+
+    """
+
+def isArchive(filename):
+    """
+    Check whether a file is a family archive or document
+
+    """
+
+    return(filename.endswith(ARCHIVE_SUFFIXES))
+
+def findArchives(paths):
+    """
+    Get the family archives in a list of files and folders
+
+    Input:
+        paths: Archive files, or folders whose archives are all read
+    Return:
+        Sorted list of archive file names, each given once
+
+    """
+
+    filenames = set()
+
+    for path in paths:
+        if(os.path.isdir(path)):
+            for filename in os.listdir(path):
+                if(isArchive(filename)):
+                    filenames.add(os.path.join(path, filename))
+        else:
+            filenames.add(path)
+
+    return(sorted(filenames))
+
+def getAccessionID(filename):
+    """
+    Get the accession number of the series an archive holds
+
+    Input:
+        filename: Name of a family archive, e.g. GSE1234_family.xml.tgz
+    Return:
+        The accession number, e.g. GSE1234
+
+    """
+
+    return(os.path.basename(filename).split('_')[0].split('.')[0])
+
+def iterSampleElements(f):
+    """
+    Get the Sample elements of a MINiML document as they are parsed
+
+    Each element is cleared once the caller moves on, along with everything
+    parsed before it, so memory does not grow with the document.
+
+    Input:
+        f: Open binary file holding a MINiML document
+    Return:
+        Iterator of Sample elements
+
+    """
+
+    import lxml.etree as ET
+
+    # Family documents of large series are bigger than lxml allows by
+    # default
+    for event, element in ET.iterparse(f, tag=getParser().sampleTag,
+            huge_tree=True):
+        yield(element)
+
+        element.clear()
+        while(element.getprevious() is not None):
+            del element.getparent()[0]
+
+def parseDocument(f, fields=None):
+    """
+    Parse the metadata of every sample in a MINiML document
+
+    Input:
+        f: Open binary file holding a MINiML document
+        fields: Short tags kept in each record. None keeps every tag
+    Return:
+        List with a dictionary containing the metadata for each sample, in
+        the order of the document
+
+    """
+
+    parser = getParser()
+    metadata = []
+
+    for sample in iterSampleElements(f):
+        for dataTable in sample.findall(DATA_TABLE_TAG):
+            sample.remove(dataTable)
+
+        metadata.append(parser.parseSampleElement(sample, fields))
+
+    return(metadata)
+
+def readMapped(mapped, filename, fields=None):
+    """
+    Parse every MINiML document in a memory mapped archive
+
+    Input:
+        mapped: mmap of the archive or document
+        filename: Name of the file, to tell documents from archives
+        fields: Short tags kept in each record. None keeps every tag
+    Return:
+        List with a dictionary containing the metadata for each sample
+
+    """
+
+    if(filename.endswith('.xml')):
+        return(parseDocument(mapped, fields))
+
+    metadata = []
+
+    # Stream mode reads the members in order without seeking, so each one
+    # goes straight from the decompressor to the parser
+    with tarfile.open(fileobj=mapped, mode='r|*') as archive:
+        for member in archive:
+            if(member.isfile() and member.name.endswith('.xml')):
+                metadata.extend(parseDocument(archive.extractfile(member),
+                    fields))
+
+    return(metadata)
+
+def readArchive(filename, fields=None):
+    """
+    Get the metadata for every sample in a family archive
+
+    Input:
+        filename: Name of a family archive or document
+        fields: Short tags kept in each record. None keeps every tag
+    Return:
+        Tuple of the accession number, a list with a dictionary containing
+        the metadata for each sample, and the seconds it took
+
+    """
+
+    start = time.time()
+
+    with open(filename, 'rb') as f:
+        # Empty files can not be mapped and hold no samples
+        if(not os.fstat(f.fileno()).st_size):
+            return(getAccessionID(filename), [], time.time() - start)
+
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            with profiled():
+                metadata = readMapped(mapped, filename, fields)
+        finally:
+            mapped.close()
+
+    return(getAccessionID(filename), metadata, time.time() - start)
+
+def tryReadArchive(filename, fields=None):
+    """
+    Get the metadata for every sample in a family archive, handing back the
+    error if it fails
+
+    Input:
+        filename: Name of a family archive or document
+        fields: Short tags kept in each record. None keeps every tag
+    Return:
+        The readArchive tuple, with an ArchiveError in place of the metadata
+        if the archive could not be read
+
+    """
+
+    start = time.time()
+
+    try:
+        return(readArchive(filename, fields))
+    except Exception as error:
+        return(getAccessionID(filename), ArchiveError('%s: %s' % (
+            error.__class__.__name__, error)), time.time() - start)
+
+def iterArchives(filenames, workers=1, isolate=False):
+    """
+    Read many family archives, with up to workers processes
+
+    Input:
+        filenames: Names of the archives
+        workers: Processes reading archives at the same time
+        isolate: Hand back an ArchiveError in place of the metadata of an
+            archive that fails instead of raising it
+    Return:
+        Iterator of the readArchive tuple of each archive, in the order of
+        filenames
+
+    """
+
+    # The worker processes may not share this process's settings, so the
+    # fields are handed to them
+    read = partial(tryReadArchive if isolate else readArchive,
+        fields=fetch.fields)
+
+    if(workers <= 1 or len(filenames) <= 1):
+        for filename in filenames:
+            yield(read(filename))
+        return
+
+    pool = Pool(min(workers, len(filenames)))
+    try:
+        # Results are handed over one at a time, so only a few parsed
+        # archives wait in memory
+        for result in pool.imap(read, filenames):
+            yield(result)
+    finally:
+        pool.terminate()
+        pool.join()
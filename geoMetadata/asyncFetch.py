@@ -0,0 +1,565 @@
+"""
+Asyncio fetch engine for very large accessions
+
+Keeps hundreds of requests to the GEO and Entrez servers in flight on one
+thread instead of one thread per request. Every request still waits for one
+shared rate limiter and is retried like the threaded requests in fetch, and
+every document is handed to the same parse step as soon as it arrives.
+Parsing and the cache files are handled on worker threads, so they never hold
+up the requests in flight. The fetch settings (URLs, retries, timeout,
+rateLimit, cacheDir and the lookup memo) apply as they do to the threaded
+engine, and workers is the number of requests in flight.
+
+Requests do not go through the proxies of the http_proxy and https_proxy
+environment variables, see getProxy.
+
+Needs Python 3.7 or later, so it is only imported for async runs. Used by the
+command line with --engine async, or from async code with
+
+    from geoMetadata.asyncFetch import fetchSeriesMetadata
+    metadata = await fetchSeriesMetadata('GSE1234', concurrency=200)
+
+"""
+
+import asyncio
+import http.client
+import io
+import ssl
+import time
+
+from urllib.parse import urljoin, urlsplit
+from urllib.request import getproxies, proxy_bypass
+
+from geoMetadata import fetch
+from geoMetadata.compat import HTTPError
+
+# Responses that send the client to another URL, e.g. http to https on NCBI
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Redirects followed before a request gives up
+MAX_REDIRECTS = 5
+
+# Failures of the raw client worth retrying, on top of those of
+# fetch.isTransient: the request timing out, or the connection closing
+# before the whole response arrived
+TRANSIENT_ERRORS = (asyncio.TimeoutError, asyncio.IncompleteReadError)
+
+# Rate limiter shared by every async request. Created by getRateLimiter
+rateLimiter = None
+
+# TLS settings for https URLs. Created on first use by getSSLContext
+sslContext = None
+
+class AsyncRateLimiter(object):
+    """
+    Spread requests out so no more than a set number start each second
+
+    Safe to share between the tasks of any event loop.
+
+    """
+
+    def __init__(self, rate):
+        # Requests per second, kept to notice when the setting changes
+        self.rate = rate
+
+        # Seconds that must pass between the start of two requests
+        self.interval = 1.0 / rate if rate else 0
+
+        # Time the next request is allowed to start
+        self.nextTime = 0
+
+    async def wait(self):
+        """
+        Wait until another request is allowed to start
+
+        """
+
+        if(not self.interval):
+            return
+
+        # Tasks only switch at an await, so no lock is needed to book the
+        # next start time
+        now = time.time()
+        waitTime = self.nextTime - now
+        self.nextTime = max(now, self.nextTime) + self.interval
+
+        if(waitTime > 0):
+            await asyncio.sleep(waitTime)
+
+def getRateLimiter():
+    """
+    Get the rate limiter shared by every async request
+
+    Return:
+        The AsyncRateLimiter, rebuilt if fetch.rateLimit changed
+
+    """
+
+    global rateLimiter
+
+    if(rateLimiter is None or rateLimiter.rate != fetch.rateLimit):
+        rateLimiter = AsyncRateLimiter(fetch.rateLimit)
+
+    return(rateLimiter)
+
+def getSSLContext():
+    """
+    Get the TLS settings used for https URLs, creating them on first use
+
+    """
+
+    global sslContext
+
+    if(sslContext is None):
+        sslContext = ssl.create_default_context()
+
+    return(sslContext)
+
+def getProxy(url):
+    """
+    Get the proxy urlopen would send a request through
+
+    The raw client here always connects straight to the server, so a run
+    needing the proxy set by http_proxy or https_proxy has to use the
+    threaded engine.
+
+    Input:
+        url: URL to be requested
+    Return:
+        URL of the proxy, or None if the request goes straight to the server
+
+    """
+
+    parts = urlsplit(url)
+    proxy = getproxies().get(parts.scheme)
+    if(not proxy or proxy_bypass(parts.hostname or '')):
+        return(None)
+
+    return(proxy)
+
+async def readBody(reader, headers):
+    """
+    Read the body of a response
+
+    Input:
+        reader: asyncio.StreamReader positioned after the headers
+        headers: Headers of the response
+    Return:
+        The body as bytes
+
+    """
+
+    if('chunked' in headers.get('Transfer-Encoding', '').lower()):
+        chunks = []
+        while(True):
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if(not size):
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+        # Skip any trailers up to the blank line ending the response
+        while((await reader.readline()).strip()):
+            pass
+
+        return(b''.join(chunks))
+
+    length = headers.get('Content-Length')
+    if(length is not None):
+        return(await reader.readexactly(int(length)))
+
+    # No length given, so the body runs until the server closes
+    return(await reader.read())
+
+async def request(url):
+    """
+    Make one GET request
+
+    Input:
+        url: http or https URL to request
+    Return:
+        Tuple of the status code, reason, headers and body
+
+    """
+
+    parts = urlsplit(url)
+    secure = parts.scheme == 'https'
+    port = parts.port or (443 if secure else 80)
+    path = parts.path or '/'
+    if(parts.query):
+        path = '%s?%s' % (path, parts.query)
+
+    reader, writer = await asyncio.open_connection(parts.hostname, port,
+        ssl=getSSLContext() if secure else None)
+    try:
+        writer.write(('GET %s HTTP/1.1\r\nHost: %s\r\n'\
+            'User-Agent: getGeoMetadata\r\nAccept-Encoding: identity\r\n'\
+            'Connection: close\r\n\r\n' % (path, parts.netloc)).encode(
+            'latin-1'))
+        await writer.drain()
+
+        statusLine = (await reader.readline()).decode('latin-1').split(None, 2)
+        if(len(statusLine) < 2):
+            raise http.client.BadStatusLine(' '.join(statusLine))
+        status = int(statusLine[1])
+        reason = statusLine[2].strip() if len(statusLine) > 2 else ''
+
+        headerLines = []
+        while(True):
+            line = await reader.readline()
+            headerLines.append(line)
+            if(not line.strip()):
+                break
+        headers = http.client.parse_headers(io.BytesIO(b''.join(headerLines)))
+
+        body = await readBody(reader, headers)
+    finally:
+        writer.close()
+
+    return(status, reason, headers, body)
+
+async def get(url):
+    """
+    Download a URL, following redirects
+
+    Input:
+        url: URL to download
+    Return:
+        The response body as bytes
+
+    """
+
+    for redirect in range(MAX_REDIRECTS + 1):
+        status, reason, headers, body = await request(url)
+
+        if(status in REDIRECT_STATUSES and headers.get('Location')):
+            url = urljoin(url, headers['Location'])
+            continue
+
+        # Fail the way urlopen does, so the retries and Retry-After handling
+        # of fetch apply unchanged
+        if(status >= 400):
+            raise HTTPError(url, status, reason, headers, None)
+
+        return(body)
+
+    raise HTTPError(url, status, 'Too many redirects', headers, None)
+
+async def runBlocking(function, *args):
+    """
+    Run a blocking call on a worker thread so the event loop is not held
+
+    Parsing a document and reading or writing the cache take long enough to
+    stall every request in flight if they ran on the loop itself.
+
+    Input:
+        function: Function to call
+        *args: Arguments of the call
+    Return:
+        What the function returns
+
+    """
+
+    return(await asyncio.get_running_loop().run_in_executor(None, function,
+        *args))
+
+class AsyncFetcher(object):
+    """
+    Download and parse the documents of one or more accessions
+
+    Create it inside the event loop that will run it.
+
+    """
+
+    def __init__(self, concurrency=None, isolate=False, refresh=False):
+        """
+        Input:
+            concurrency: Most requests in flight at once. Defaults to
+                fetch.workers
+            isolate: Hand back the exception of a sample that fails in place
+                of its metadata instead of raising it
+            refresh: Download the documents of samples even when they are
+                cached, and replace the cached copies
+
+        """
+
+        self.concurrency = concurrency or fetch.workers
+        self.isolate = isolate
+        self.refresh = refresh
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def download(self, url):
+        """
+        Download a URL, retrying failed requests
+
+        Every attempt waits for a free slot and the shared rate limiter.
+        Attempts failing in a way that may pass are retried up to
+        fetch.retries times, waiting longer before each one without holding
+        a slot. Other failures are raised at once.
+
+        Input:
+            url: URL to download
+        Return:
+            The response body as bytes
+
+        """
+
+        attempt = 0
+
+        while(True):
+            async with self.semaphore:
+                await getRateLimiter().wait()
+                start = time.time()
+                try:
+                    document = await asyncio.wait_for(get(url),
+                        fetch.timeout)
+                except Exception as error:
+                    if(attempt >= fetch.retries or not (fetch.isTransient(
+                            error) or isinstance(error, TRANSIENT_ERRORS))):
+                        raise
+                    failure = error
+                else:
+                    break
+
+            attempt += 1
+            await asyncio.sleep(fetch.reportRetry(failure, attempt))
+
+        fetch.recordDownload(start, document)
+
+        return(document)
+
+    async def getMINiML(self, accessionID, refresh=False):
+        """
+        Download and parse the MINiML document for an accession
+
+        Input:
+            accessionID: GEO accession number of a series, sample or dataset
+            refresh: Download the document even when it is cached
+        Return:
+            Root element of the MINiML document
+
+        """
+
+        root = None
+        if(not refresh):
+            root = await runBlocking(fetch.readCachedMINiML, accessionID)
+        if(root is None):
+            document = await self.download(fetch.getAccessionURL(accessionID))
+            root = await runBlocking(fetch.parseMINiML, accessionID, document)
+
+        return(root)
+
+    async def getSamples(self, accessionID):
+        """
+        Get the sample names of any GEO accession
+
+        Input:
+            accessionID: The ID of the dataset or series
+        Return:
+            A list of all samples for the accession
+
+        """
+
+        if(accessionID.startswith('GDS')):
+            return(fetch.getSamplesFromGDS(await self.getGDSMetadata(
+                accessionID.split('GDS')[1])))
+
+        # Uses the same memo as the threaded lookups
+        key = ('samples', accessionID)
+        samples = fetch.lookupMemo.get(key)
+        if(samples is not None):
+            return(list(samples))
+
+        # Walk the SubSeries of a SuperSeries one level at a time, with
+        # every document of a level requested at once
+        expansion = fetch.SeriesExpansion(accessionID)
+        pending = expansion.add(await self.getMINiML(accessionID))
+
+        while(pending):
+            roots = await asyncio.gather(*[self.getMINiML(seriesID)
+                for seriesID in pending])
+            pending = [seriesID for root in roots
+                for seriesID in expansion.add(root)]
+
+        fetch.lookupMemo.add(key, expansion.samples)
+
+        return(list(expansion.samples))
+
+    async def getGDSMetadata(self, gdsID):
+        """
+        Get the GDS metadata for a dataset
+
+        Input:
+            gdsID: GDS accession number without the GDS prefix
+        Return:
+            Dictionary containing the metadata for the entire dataset
+
+        """
+
+        key = ('esummary', gdsID)
+        metadata = fetch.lookupMemo.get(key)
+        if(metadata is None):
+            metadata = fetch.readGDSMetadata(await self.download(
+                fetch.getESummaryURL(gdsID)))
+            fetch.lookupMemo.add(key, metadata)
+
+        return(metadata)
+
+    async def getSample(self, position, sample):
+        """
+        Get the metadata for one sample
+
+        Input:
+            position: Position of the sample in the list being fetched
+            sample: GSM accession number of the sample
+        Return:
+            Tuple of the position and the sample's metadata, or the
+            exception raised when isolating failures
+
+        """
+
+        try:
+            root = await self.getMINiML(sample, self.refresh)
+
+            return(position, await runBlocking(fetch.parseSample, root))
+        except asyncio.CancelledError:
+            # Before Python 3.8 cancelling is an Exception too
+            raise
+        except Exception as error:
+            if(not self.isolate):
+                raise
+            return(position, error)
+
+    async def iterSampleMetadata(self, samples):
+        """
+        Get the metadata for all samples as each one arrives
+
+        Only a few more tasks than requests in flight are created at once,
+        so series of any size use the same memory.
+
+        Input:
+            samples: A list of sample IDs
+        Return:
+            Async iterator of (position in samples, metadata) tuples in the
+            order the samples finish
+
+        """
+
+        queue = iter(enumerate(samples))
+        window = self.concurrency * 2
+        pending = set()
+
+        try:
+            while(True):
+                # Keep the window full so a slot never waits for a task
+                for position, sample in queue:
+                    pending.add(asyncio.ensure_future(self.getSample(
+                        position, sample)))
+                    if(len(pending) >= window):
+                        break
+
+                if(not pending):
+                    break
+
+                done, pending = await asyncio.wait(pending,
+                    return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield(task.result())
+        finally:
+            # Stop the remaining downloads if a sample failed or the caller
+            # stopped early
+            for task in pending:
+                task.cancel()
+
+    async def getSampleMetadata(self, samples):
+        """
+        Get the metadata for all samples
+
+        Input:
+            samples: A list of sample IDs
+        Return:
+            List with a dictionary containing the metadata for each sample,
+            in the order of samples
+
+        """
+
+        metadata = [None] * len(samples)
+        async for position, person in self.iterSampleMetadata(samples):
+            metadata[position] = person
+
+        return(metadata)
+
+async def fetchSampleMetadata(samples, concurrency=None, isolate=False,
+        refresh=False):
+    """
+    Get the metadata for a list of samples
+
+    Input:
+        samples: A list of sample IDs
+        concurrency: Most requests in flight at once. Defaults to
+            fetch.workers
+        isolate: Hand back the exception of a sample that fails in place of
+            its metadata instead of raising it
+        refresh: Download the documents even when they are cached
+    Return:
+        List with a dictionary containing the metadata for each sample
+
+    """
+
+    return(await AsyncFetcher(concurrency, isolate, refresh).
+        getSampleMetadata(samples))
+
+async def fetchSeriesMetadata(accessionID, concurrency=None):
+    """
+    Get the metadata for every sample of an accession
+
+    Input:
+        accessionID: GEO accession number of a series or dataset
+        concurrency: Most requests in flight at once. Defaults to
+            fetch.workers
+    Return:
+        List with a dictionary containing the metadata for each sample
+
+    """
+
+    fetcher = AsyncFetcher(concurrency)
+    samples = await fetcher.getSamples(accessionID)
+
+    return(await fetcher.getSampleMetadata(samples))
+
+async def iterSeriesMetadata(accessionID, concurrency=None):
+    """
+    Get the metadata for every sample of an accession as each one arrives
+
+    Input:
+        accessionID: GEO accession number of a series or dataset
+        concurrency: Most requests in flight at once. Defaults to
+            fetch.workers
+    Return:
+        Async iterator of (sample ID, metadata) tuples in the order the
+        samples finish
+
+    """
+
+    fetcher = AsyncFetcher(concurrency)
+    samples = await fetcher.getSamples(accessionID)
+
+    async for position, person in fetcher.iterSampleMetadata(samples):
+        yield(samples[position], person)
+
+def runSampleMetadata(samples, isolate=False, refresh=False):
+    """
+    Get the metadata for a list of samples from code that is not async
+
+    Input:
+        samples: A list of sample IDs
+        isolate: Hand back the exception of a sample that fails in place of
+            its metadata instead of raising it
+        refresh: Download the documents even when they are cached
+    Return:
+        List with a dictionary containing the metadata for each sample
+
+    """
+
+    return(asyncio.run(fetchSampleMetadata(samples, isolate=isolate,
+        refresh=refresh)))
@@ -0,0 +1,665 @@
+"""
+Command line interface for downloading GEO metadata
+
+Usage:
+    python -m geoMetadata single <accessionID> [-d directory]
+    python -m geoMetadata by-sample <accessionID> [-d directory]
+    python -m geoMetadata batch [accessionID ...] [-i file] [-d directory]
+        [--schedule] [--retry-failed] [--skip-unchanged] [--shard I/N]
+        [--stream]
+        [--syn-id synID --syn-name synName]
+    python -m geoMetadata archive <path ...> [-d directory] [-w workers]
+        [--shard I/N] [--stream] [--syn-id synID --syn-name synName]
+    python -m geoMetadata merge <directory ...> [-d directory]
+        [-f csv|parquet|sqlite] [--syn-id synID --syn-name synName]
+    python -m geoMetadata upload <directory> <synID> <synName>
+    python -m geoMetadata profile <cacheDir> [--repeat n] [--wide]
+        [--fields tags]
+
+Every command that downloads also takes the fetch options --engine,
+--workers, --rate-limit, --cache-dir, --batch-size, --no-sub-series,
+--retries, --retry-delay, --timeout, --geo-url and --entrez-url, every
+command that writes files takes the output options --fields, --normalize,
+--vocabulary, --compression, --compression-level and --compression-threads,
+and every command takes the metrics options --metrics, --metrics-format and
+--report-interval and the profiling options --profile and --profile-top.
+Run a command with --help for the details.
+
+"""
+
+import argparse
+import os
+import sys
+
+from geoMetadata import compression, fetch, normalize, pipeline, profiling
+from geoMetadata.metrics import Reporter, metrics
+from geoMetadata.schema import SchemaRegistry
+
+def configureFetch(args):
+    """
+    Apply the fetch options of a command
+
+    """
+
+    fetch.configure(engine=args.engine, workers=args.workers,
+        rateLimit=args.rateLimit, expandSubSeries=args.expandSubSeries,
+        cacheDir=args.cacheDir, batchSize=args.batchSize, geoURL=args.geoURL,
+        entrezURL=args.entrezURL, retries=args.retries,
+        retryDelay=args.retryDelay, timeout=args.timeout)
+
+def configureOutput(args):
+    """
+    Apply the output field, normalization and compression options of a
+    command
+
+    """
+
+    # Tags that are not wanted are skipped by the parser, so the field
+    # selection is a fetch setting
+    fetch.configure(fields=args.fields)
+    normalize.configure(enabled=args.normalize or bool(args.vocabularies),
+        vocabularies=args.vocabularies)
+    compression.configure(compression=args.compression,
+        level=args.compressionLevel, threads=args.compressionThreads)
+
+def single(args):
+    """
+    Download one accession and save it as a csv file
+
+    """
+
+    configureFetch(args)
+    configureOutput(args)
+    pipeline.runSingle(args.accessionID, args.directory, args.fileFormat)
+
+def bySample(args):
+    """
+    Download one accession and save it with one row per sample
+
+    """
+
+    configureFetch(args)
+    configureOutput(args)
+    pipeline.runBySample(args.accessionID, args.directory)
+
+def batch(args):
+    """
+    Download many accessions and optionally upload them to Synapse
+
+    """
+
+    configureFetch(args)
+    configureOutput(args)
+
+    # Accessions given as arguments come first, then those from the file.
+    # Standard input is read when neither is given
+    accessionIDs = list(args.accessionIDs)
+    if(args.retryFailed):
+        accessionIDs = pipeline.getFailedAccessionIDs(args.directory)
+        print('Retrying %d accessions that failed' % len(accessionIDs))
+    elif(args.input):
+        accessionIDs.extend(pipeline.getAccessionIDsFromFile(args.input))
+    elif(not accessionIDs):
+        accessionIDs = pipeline.getAccessionIDsFromFile('-')
+
+    if(args.shard):
+        accessionIDs = getShard(accessionIDs, args.shard)
+
+    # Columns of every accession, collected as they are written
+    schema = SchemaRegistry()
+
+    # Accessions and samples that fail are listed and the rest go on
+    failures = pipeline.FailureLog(args.directory)
+
+    updates = None
+    if(args.skipUnchanged):
+        updates = pipeline.UpdateLog(args.directory)
+
+    if(args.schedule):
+        dataFrameList = pipeline.runScheduled(accessionIDs, args.directory,
+            args.fileFormat, args.stream, schema, failures, updates)
+    else:
+        dataFrameList = pipeline.runBatch(accessionIDs, args.directory,
+            args.fileFormat, args.stream, schema, failures, updates)
+
+    if(failures):
+        print('%d accessions had failures, listed in %s. Run again with '\
+            '--retry-failed to fetch only them' % (
+            len(failures.getAccessionIDs()), failures.filename))
+
+    uploadRun(args, schema, dataFrameList)
+
+def archive(args):
+    """
+    Read local family archives and optionally upload them to Synapse
+
+    """
+
+    configureOutput(args)
+
+    # Only load the archive code for runs that read archives
+    from geoMetadata.archive import findArchives, getAccessionID
+
+    filenames = findArchives(args.paths)
+    if(args.shard):
+        filenames = getShard(filenames, args.shard, getAccessionID)
+    print('Reading %d archives' % len(filenames))
+
+    schema = SchemaRegistry()
+    failures = pipeline.FailureLog(args.directory)
+    dataFrameList = pipeline.runArchives(filenames, args.directory,
+        args.fileFormat, args.stream, schema, args.workers, failures)
+
+    if(failures):
+        print('%d archives could not be read, listed in %s' % (
+            len(failures), failures.filename))
+
+    uploadRun(args, schema, dataFrameList)
+
+def getShard(items, shard, getAccessionID=None):
+    """
+    Keep the accessions of the shard a run was given
+
+    Input:
+        items: Accession numbers, or archive file names
+        shard: (shard number, number of shards) tuple of --shard
+        getAccessionID: Gets the accession number of an item. None when
+            the items are accession numbers
+    Return:
+        The items of the shard, in their original order
+
+    """
+
+    index, count = shard
+
+    if(getAccessionID is None):
+        selected = pipeline.getShard(items, index, count)
+    else:
+        selected = [item for item in items if pipeline.getShardIndex(
+            getAccessionID(item), count) == index]
+
+    print('Shard %d of %d: %d of %d accessions' % (index, count,
+        len(selected), len(items)))
+
+    return(selected)
+
+def merge(args):
+    """
+    Combine the output folders of sharded runs and optionally upload them
+
+    """
+
+    from geoMetadata.merge import getShardFrames, mergeShards
+
+    schema = SchemaRegistry()
+
+    # The upload writes its merged file to the folder without creating it
+    if(args.directory and not os.path.exists(args.directory)):
+        os.makedirs(args.directory)
+
+    # A csv merge is exactly the file the upload writes, so it is written
+    # once by the upload
+    if(args.synID and args.outputFormat == 'csv'):
+        from geoMetadata import synapse
+
+        print('Uploading the data to Synapse')
+        synapse.upload(args.directory, args.synID, args.synName, schema,
+            getShardFrames(args.directories, schema))
+        return
+
+    filename, count = mergeShards(args.directories, args.directory, schema,
+        args.outputFormat)
+    print('Wrote %d rows with %d columns to %s' % (count, len(schema),
+        filename))
+
+    if(args.synID):
+        from geoMetadata import synapse
+
+        print('Uploading the data to Synapse')
+        schema = SchemaRegistry()
+        synapse.upload(args.directory, args.synID, args.synName, schema,
+            getShardFrames(args.directories, schema))
+
+def uploadRun(args, schema, dataFrameList):
+    """
+    Upload the accessions written by a batch or archive run, if asked to
+
+    Accessions that failed are not in the upload. A run retrying them, or
+    skipping unchanged accessions, uploads every file of the folder, so the
+    table holds the accessions of the earlier runs as well.
+
+    Input:
+        args: Parsed arguments of the run
+        schema: SchemaRegistry with the columns of every accession
+        dataFrameList: Dataframes of the accessions. Empty for streaming runs
+
+    """
+
+    if(not args.synID):
+        return
+
+    # Only load the Synapse code for runs that upload
+    from geoMetadata import synapse
+
+    if(getattr(args, 'retryFailed', False) or
+            getattr(args, 'skipUnchanged', False)):
+        schema = SchemaRegistry()
+        dataFrameList = synapse.getFileFrames(args.directory, schema)
+    # Streaming runs kept nothing in memory, so read the merged file
+    elif(args.stream):
+        dataFrameList = synapse.getStreamFrames(args.directory)
+
+    # Upload to synapse
+    print('Uploading the data to Synapse')
+    synapse.upload(args.directory, args.synID, args.synName, schema,
+        dataFrameList)
+
+def upload(args):
+    """
+    Upload a folder of previously downloaded files to Synapse
+
+    """
+
+    from geoMetadata import synapse
+
+    # Only the headers are read up front, the rows as they are merged
+    schema = SchemaRegistry()
+    dataFrameList = synapse.getFileFrames(args.directory, schema)
+
+    # Upload to synapse
+    print('Uploading the data to Synapse')
+    synapse.upload(args.directory, args.synID, args.synName, schema,
+        dataFrameList)
+
+def profile(args):
+    """
+    Profile parsing and writing a folder of cached sample documents
+
+    """
+
+    count = profiling.profileCached(args.cacheDir, args.repeat, args.wide,
+        args.fields)
+    print('Parsed and wrote %d samples' % count)
+
+def positiveInteger(value):
+    """
+    Argument type for options that must be at least 1
+
+    """
+
+    number = int(value)
+    if(number < 1):
+        raise argparse.ArgumentTypeError('must be at least 1')
+
+    return(number)
+
+def shardSpec(value):
+    """
+    Argument type for --shard, e.g. 2/8 for the second of eight shards
+
+    """
+
+    try:
+        index, count = [int(part) for part in value.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('must look like 2/8')
+
+    if(count < 1 or not 1 <= index <= count):
+        raise argparse.ArgumentTypeError('must be from 1/N to N/N')
+
+    return(index, count)
+
+def tagList(value):
+    """
+    Argument type for comma separated lists of MINiML tags
+
+    """
+
+    tags = [tag.strip() for tag in value.split(',') if tag.strip()]
+    if(not tags):
+        raise argparse.ArgumentTypeError('must name at least one tag')
+
+    return(tags)
+
+def getFetchParser():
+    """
+    Build the parser holding the options shared by every downloading command
+
+    Return:
+        Parent argument parser with the fetch options
+
+    """
+
+    parser = argparse.ArgumentParser(add_help=False)
+    group = parser.add_argument_group('fetch options')
+    group.add_argument('--engine', default=fetch.engine,
+        choices=['threads', 'async'], help='Download samples with --workers '\
+        'threads, or with up to --workers requests in flight on one thread '\
+        'with asyncio (Python 3.7+). Use async with a few hundred workers '\
+        'for very large series (default: %(default)s)')
+    group.add_argument('-w', '--workers', type=positiveInteger,
+        default=fetch.workers, help='Samples downloaded and parsed at the '\
+        'same time (default: %(default)s)')
+    group.add_argument('--rate-limit', dest='rateLimit', type=float,
+        default=fetch.rateLimit, help='Most requests started per second, '\
+        '0 for no limit (default: %(default)s)')
+    group.add_argument('--cache-dir', dest='cacheDir', default=fetch.cacheDir,
+        help='Folder where downloaded MINiML documents are kept and reused')
+    group.add_argument('--batch-size', dest='batchSize', type=positiveInteger,
+        default=fetch.batchSize, help='Samples handed to the workers at a '\
+        'time (default: %(default)s)')
+    group.add_argument('--no-sub-series', dest='expandSubSeries',
+        action='store_false', default=fetch.expandSubSeries,
+        help='Only take the samples a SuperSeries lists itself instead of '\
+        'also walking its SubSeries')
+    group.add_argument('--retries', type=int, default=fetch.retries,
+        help='Times a request is retried after throttling, a server '\
+        'error or a network failure. Other failures, e.g. an unknown '\
+        'accession, are not retried (default: %(default)s)')
+    group.add_argument('--retry-delay', dest='retryDelay', type=float,
+        default=fetch.retryDelay, help='Seconds before the first retry, '\
+        'doubled for each further one (default: %(default)s)')
+    group.add_argument('--timeout', type=float, default=fetch.timeout,
+        help='Seconds to wait for a server to answer (default: '\
+        '%(default)s)')
+    group.add_argument('--geo-url', dest='geoURL', default=fetch.geoURL,
+        help='URL of the GEO accession display (default: %(default)s)')
+    group.add_argument('--entrez-url', dest='entrezURL',
+        default=fetch.entrezURL, help='URL of the Entrez esummary utility '\
+        '(default: %(default)s)')
+
+    return(parser)
+
+def getMetricsParser():
+    """
+    Build the parser holding the instrumentation options of every command
+
+    Return:
+        Parent argument parser with the metrics options
+
+    """
+
+    parser = argparse.ArgumentParser(add_help=False)
+    group = parser.add_argument_group('metrics options')
+    group.add_argument('--metrics', help='File to write the timers and '\
+        'counters of the run to')
+    group.add_argument('--metrics-format', dest='metricsFormat',
+        choices=['json', 'prometheus'], help='Format of the metrics file '\
+        '(default: prometheus for .prom files, json otherwise)')
+    group.add_argument('--report-interval', dest='reportInterval',
+        type=float, help='Print the metrics to standard error every this '\
+        'many seconds while running')
+
+    return(parser)
+
+def getProfileParser(directory=None):
+    """
+    Build the parser holding the profiling options of every command
+
+    Input:
+        directory: Default folder for the profile output. Profiling is off
+            by default when not given
+    Return:
+        Parent argument parser with the profiling options
+
+    """
+
+    parser = argparse.ArgumentParser(add_help=False)
+    group = parser.add_argument_group('profiling options')
+    group.add_argument('--profile', default=directory, help='Profile the '\
+        'parse and write stages with cProfile and write the dump and a '\
+        'summary of the hottest functions to this folder')
+    group.add_argument('--profile-top', dest='profileTop',
+        type=positiveInteger, default=25, help='Functions listed in the '\
+        'profile summary (default: %(default)s)')
+
+    return(parser)
+
+def addOutputArguments(parser, formats=True):
+    """
+    Add the output folder, format, field and compression options to a
+    parser
+
+    """
+
+    parser.add_argument('-d', '--directory', default='.',
+        help='Folder to output the data to (default: %(default)s)')
+    if(formats):
+        parser.add_argument('-f', '--format', dest='fileFormat',
+            default='csv', choices=['csv', 'tsv'],
+            help='Format of the output files (default: %(default)s)')
+    parser.add_argument('--fields', type=tagList, help='Comma separated '\
+        'MINiML tags to keep, e.g. Characteristics,Organism,Source. Other '\
+        'tags are skipped when parsing and get no column (default: every '\
+        'tag)')
+    parser.add_argument('--normalize', action='store_true',
+        help='Normalize characteristic values before they are written, '\
+        'e.g. M and Male to male and 45 yrs to 45. Each distinct value is '\
+        'normalized once per run')
+    parser.add_argument('--vocabulary', dest='vocabularies',
+        action='append', default=[], metavar='FILE', help='JSON file '\
+        'mapping characteristic names to tables of value -> normalized '\
+        'value, used on top of the built in tables. May be given more '\
+        'than once, and implies --normalize')
+    parser.add_argument('-c', '--compression',
+        choices=sorted(compression.EXTENSIONS), help='Compress the output '\
+        'files, adding .gz or .zst to their names. zstd needs the '\
+        'zstandard package')
+    parser.add_argument('--compression-level', dest='compressionLevel',
+        type=int, help='Compression level (default: 6 for gzip, 3 for zstd)')
+    parser.add_argument('--compression-threads', dest='compressionThreads',
+        type=positiveInteger, default=compression.threads, help='Threads '\
+        'compressing at the same time (default: %(default)s)')
+
+def addRunArguments(parser):
+    """
+    Add the sharding, streaming and upload options of a many accession run
+    to a parser
+
+    """
+
+    parser.add_argument('--shard', type=shardSpec, help='Only process '\
+        'shard I of N, e.g. 2/8. Every accession belongs to one shard, '\
+        'chosen from its accession number, so N runs given the same list '\
+        'on any nodes split it between them. Combine their folders with '\
+        'the merge command')
+    parser.add_argument('--stream', action='store_true',
+        help='Append the rows of each accession to allData.jsonl in the '\
+        'output folder as soon as they are written, instead of keeping '\
+        'every accession in memory until the upload')
+    addUploadArguments(parser)
+
+def addUploadArguments(parser):
+    """
+    Add the optional Synapse upload options to a parser
+
+    """
+
+    parser.add_argument('--syn-id', dest='synID', help='Synapse ID for '\
+        'the project where the table will be saved. Nothing is uploaded '\
+        'without it')
+    parser.add_argument('--syn-name', dest='synName', help='Name to '\
+        'give the table')
+
+def getParser():
+    """
+    Build the argument parser with one subcommand per entry point
+
+    Return:
+        The argument parser
+
+    """
+
+    parser = argparse.ArgumentParser(prog='geoMetadata',
+        description='Download metadata for GEO datasets and series')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    # Options shared by every downloading command
+    metricsParsers = [getMetricsParser(), getProfileParser()]
+    parents = [getFetchParser()] + metricsParsers
+
+    singleParser = subparsers.add_parser('single', parents=parents,
+        help='Save one accession with one row per characteristic')
+    singleParser.add_argument('accessionID', help='GEO accession number '\
+        'for the dataset of interest')
+    addOutputArguments(singleParser)
+    singleParser.set_defaults(function=single)
+
+    bySampleParser = subparsers.add_parser('by-sample', parents=parents,
+        help='Save one accession as a tsv file with one row per sample')
+    bySampleParser.add_argument('accessionID', help='GEO accession number '\
+        'for the dataset of interest')
+    addOutputArguments(bySampleParser, formats=False)
+    bySampleParser.set_defaults(function=bySample)
+
+    batchParser = subparsers.add_parser('batch', parents=parents,
+        help='Save many accessions and optionally upload them to one '\
+        'Synapse table')
+    batchParser.add_argument('accessionIDs', nargs='*', metavar='accessionID',
+        help='GEO accession numbers. Read from standard input when neither '\
+        'these nor --input are given')
+    batchParser.add_argument('-i', '--input', help='File holding a list of '\
+        'GEO accession numbers, one per line, or - for standard input')
+    addOutputArguments(batchParser)
+    batchParser.add_argument('--schedule', action='store_true',
+        help='Find the samples of every accession first, then fetch the '\
+        'largest accessions first with their samples spread over all '\
+        'workers, so one huge series does not leave workers idle. Files '\
+        'are written largest first')
+    batchParser.add_argument('--retry-failed', dest='retryFailed',
+        action='store_true', help='Only fetch the accessions listed in '\
+        'failed.jsonl of the output folder by an earlier run, instead of '\
+        'the given ones. Accessions and samples that fail are always '\
+        'listed there while the rest of the run goes on')
+    batchParser.add_argument('--skip-unchanged', dest='skipUnchanged',
+        action='store_true', help='Look up when each accession was last '\
+        'updated on GEO, which only requests its series documents, and '\
+        'skip those not updated since an earlier run with this option '\
+        'wrote them to the output folder')
+    addRunArguments(batchParser)
+    batchParser.set_defaults(function=batch)
+
+    archiveParser = subparsers.add_parser('archive', parents=metricsParsers,
+        help='Save the accessions of local MINiML family archives and '\
+        'optionally upload them to one Synapse table')
+    archiveParser.add_argument('paths', nargs='+', metavar='path',
+        help='Family archives (GSExxx_family.xml.tgz), or folders whose '\
+        'archives are all read')
+    archiveParser.add_argument('-w', '--workers', type=positiveInteger,
+        default=1, help='Archives read at the same time, each in its own '\
+        'process (default: %(default)s)')
+    addOutputArguments(archiveParser)
+    addRunArguments(archiveParser)
+    archiveParser.set_defaults(function=archive)
+
+    mergeParser = subparsers.add_parser('merge', parents=metricsParsers,
+        help='Combine the output folders of sharded runs and optionally '\
+        'upload them to one Synapse table')
+    mergeParser.add_argument('directories', nargs='+', metavar='directory',
+        help='Output folders of the shards')
+    mergeParser.add_argument('-d', '--directory', default='.',
+        help='Folder to write the merged file to (default: %(default)s)')
+    mergeParser.add_argument('-f', '--format', dest='outputFormat',
+        default='csv', choices=['csv', 'parquet', 'sqlite'],
+        help='Format of the merged file, allData.<format>. parquet needs '\
+        'the pyarrow package (default: %(default)s)')
+    addUploadArguments(mergeParser)
+    mergeParser.set_defaults(function=merge)
+
+    uploadParser = subparsers.add_parser('upload', parents=metricsParsers,
+        help='Upload a folder of downloaded files to one Synapse table')
+    uploadParser.add_argument('directory', help='Folder holding the data '\
+        'to be uploaded')
+    uploadParser.add_argument('synID', help='Synapse ID for the project '\
+        'where the table will be saved')
+    uploadParser.add_argument('synName', help='Name to give the table')
+    uploadParser.set_defaults(function=upload)
+
+    profileParser = subparsers.add_parser('profile',
+        parents=[getMetricsParser(), getProfileParser('profiles')],
+        help='Profile parsing and writing cached sample documents without '\
+        'any network')
+    profileParser.add_argument('cacheDir', help='Folder of cached GSM '\
+        'documents, as written by --cache-dir')
+    profileParser.add_argument('-r', '--repeat', type=positiveInteger,
+        default=1, help='Passes over the documents (default: %(default)s)')
+    profileParser.add_argument('--wide', action='store_true',
+        help='Write with the by-sample writer instead of the long one')
+    profileParser.add_argument('--fields', type=tagList, help='Comma '\
+        'separated MINiML tags to keep, as for the downloading commands '\
+        '(default: every tag)')
+    profileParser.set_defaults(function=profile)
+
+    return(parser)
+
+def main(argv=None):
+    parser = getParser()
+    args = parser.parse_args(argv)
+
+    if(args.command in ('batch', 'archive', 'merge') and
+            bool(args.synID) != bool(args.synName)):
+        parser.error('--syn-id and --syn-name must be given together')
+
+    if(getattr(args, 'retryFailed', False) and (args.accessionIDs or
+            args.input)):
+        parser.error('--retry-failed reads the accessions from the output '\
+            'folder, do not give any')
+
+    if(getattr(args, 'engine', None) == 'async' and sys.version_info < (3, 7)):
+        parser.error('--engine async needs Python 3.7 or later')
+
+    # The async engine connects straight to the servers, which fails or
+    # leaks requests where they have to go through a proxy
+    if(getattr(args, 'engine', None) == 'async'):
+        from geoMetadata.asyncFetch import getProxy
+
+        proxy = getProxy(args.geoURL) or getProxy(args.entrezURL)
+        if(proxy):
+            parser.error('--engine async does not use proxies, and %s is set '\
+                'as one. Use --engine threads' % proxy)
+
+    if(getattr(args, 'compression', None) == 'zstd'):
+        try:
+            compression.getZstandard()
+        except ImportError as error:
+            parser.error(str(error))
+
+    for filename in getattr(args, 'vocabularies', None) or ():
+        try:
+            normalize.readVocabulary(filename)
+        except (IOError, ValueError) as error:
+            parser.error('Can not read vocabulary %s: %s' % (filename, error))
+
+    if(getattr(args, 'outputFormat', None) == 'parquet'):
+        try:
+            import pyarrow
+        except ImportError:
+            parser.error('parquet output needs the pyarrow package '\
+                '(pip install pyarrow)')
+
+    if(args.profile):
+        # cProfile can not follow several worker threads on every Python
+        # version, so profiled runs fetch one sample at a time
+        if(getattr(args, 'workers', 1) > 1):
+            print('Profiling with 1 worker instead of %d' % args.workers)
+            args.workers = 1
+        profiling.start()
+
+    reporter = None
+    if(args.reportInterval):
+        reporter = Reporter(metrics, args.reportInterval)
+        reporter.start()
+
+    try:
+        args.function(args)
+    finally:
+        if(reporter):
+            reporter.stop()
+
+        # Write whatever was recorded, even if the run failed part way
+        if(args.metrics):
+            metrics.write(args.metrics, args.metricsFormat)
+
+        if(args.profile):
+            profiling.finish(args.profile, args.command, args.profileTop)
@@ -0,0 +1,94 @@
+"""
+Python 2 and 3 compatibility helpers
+
+"""
+
+import sys
+
+PY2 = sys.version_info[0] == 2
+
+if(PY2):
+    from urllib2 import urlopen, HTTPError, URLError
+    from urllib import urlencode
+    from httplib import HTTPException
+
+    stringTypes = (str, unicode)
+    textType = unicode
+
+else:
+    from urllib.request import urlopen
+    from urllib.error import HTTPError, URLError
+    from urllib.parse import urlencode
+    from http.client import HTTPException
+
+    stringTypes = (str,)
+    textType = str
+
+def encodeText(value):
+    """
+    Encode text for writing to a byte oriented file
+
+    Input:
+        value: Value to be written
+    Return:
+        UTF-8 encoded value on Python 2 if it is unicode, otherwise the value
+
+    """
+
+    if(PY2 and type(value) == unicode):
+        return(value.encode('utf-8'))
+
+    return(value)
+
+def decodeText(value):
+    """
+    Get any value as text
+
+    Input:
+        value: Value to be written, text, UTF-8 bytes or anything else
+    Return:
+        The value as unicode on Python 2 and str on Python 3
+
+    """
+
+    if(isinstance(value, textType)):
+        return(value)
+
+    if(PY2 and isinstance(value, str)):
+        return(value.decode('utf-8'))
+
+    return(textType(value))
+
+def openText(filename, mode='r'):
+    """
+    Open a text file the same way on Python 2 and 3
+
+    Input:
+        filename: Name of the file to open
+        mode: Mode to open the file with
+    Return:
+        Open file object that reads and writes UTF-8 text
+
+    """
+
+    if(PY2):
+        return(open(filename, mode))
+
+    return(open(filename, mode, encoding='utf-8'))
+
+def openCSV(filename, mode='r'):
+    """
+    Open a file for the csv module the same way on Python 2 and 3
+
+    Input:
+        filename: Name of the file to open
+        mode: Mode to open the file with, without b
+    Return:
+        Open file object the csv module can read and write UTF-8 rows with
+
+    """
+
+    if(PY2):
+        return(open(filename, mode + 'b'))
+
+    return(open(filename, mode, encoding='utf-8', newline=''))
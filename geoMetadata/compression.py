@@ -0,0 +1,273 @@
+"""
+Compressed output and transparent reading of compressed files
+
+gzip output is cut into blocks that are compressed on a pool of threads
+(zlib releases the GIL while it works) and written in order as separate gzip
+members. Together they form one valid .gz file that gzip, pandas and every
+other reader decompress as a whole. zstd output uses the worker threads of
+the zstandard package, which is only needed when zstd is chosen.
+
+"""
+
+import io
+import zlib
+
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+from geoMetadata.compat import PY2, openCSV
+
+# Compression -> file name extension
+EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+# Compression used when none is given. gzip's own default level is slow for
+# little gain on text, zstd's default is already fast
+DEFAULT_LEVELS = {'gzip': 6, 'zstd': 3}
+
+#############################Output Settings#################################
+# Changed through configure, usually from the command line
+
+# Compression of the files written: None, 'gzip' or 'zstd'
+compression = None
+
+# Compression level. None for the default of the compression
+level = None
+
+# Threads compressing at the same time
+threads = 4
+
+# Bytes of output compressed as one gzip block
+blockSize = 1 << 20
+##############################################################################
+
+# Names of the settings configure accepts
+SETTINGS = ('compression', 'level', 'threads', 'blockSize')
+
+def configure(**settings):
+    """
+    Change the output settings
+
+    Input:
+        settings: New values for any of compression, level, threads or
+            blockSize
+
+    """
+
+    for name, value in settings.items():
+        if(name not in SETTINGS):
+            raise TypeError('Unknown output setting: %s' % name)
+        globals()[name] = value
+
+def getFilename(filename):
+    """
+    Add the extension of the configured compression to a file name
+
+    Input:
+        filename: Name of the uncompressed file
+    Return:
+        Name of the file that is written
+
+    """
+
+    return(filename + EXTENSIONS.get(compression, ''))
+
+def stripExtension(filename):
+    """
+    Remove a compression extension from a file name
+
+    Input:
+        filename: Name of a possibly compressed file
+    Return:
+        The name without .gz or .zst
+
+    """
+
+    for extension in EXTENSIONS.values():
+        if(filename.endswith(extension)):
+            return(filename[:-len(extension)])
+
+    return(filename)
+
+def getLevel():
+    """
+    Get the compression level to use for the configured compression
+
+    """
+
+    if(level is None):
+        return(DEFAULT_LEVELS[compression])
+
+    return(level)
+
+class BlockGzipWriter(io.RawIOBase):
+    """
+    Binary file that compresses each block of output on a pool of threads
+
+    Only a few blocks per thread are held in memory at once.
+
+    """
+
+    def __init__(self, filename, mode='wb', level=6, threads=4,
+            blockSize=1 << 20):
+        """
+        Input:
+            filename: Name of the file to write
+            mode: wb to replace the file or ab to append a new member to it
+            level: zlib compression level
+            threads: Threads compressing at the same time
+            blockSize: Bytes of output compressed as one block
+
+        """
+
+        io.RawIOBase.__init__(self)
+
+        self.file = open(filename, mode)
+        self.level = level
+        self.threads = threads
+        self.blockSize = blockSize
+
+        self.pool = ThreadPool(threads) if threads > 1 else None
+
+        # Compressed blocks not written yet, in order
+        self.pending = deque()
+
+        # Output not compressed yet
+        self.buffer = []
+        self.size = 0
+
+    def writable(self):
+        return(True)
+
+    def compress(self, block):
+        """
+        Compress one block as a complete gzip member
+
+        """
+
+        # wbits of 31 writes the gzip header and trailer
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+        return(compressor.compress(block) + compressor.flush())
+
+    def write(self, data):
+        data = bytes(data)
+        self.buffer.append(data)
+        self.size += len(data)
+
+        if(self.size >= self.blockSize):
+            self.submit()
+
+        return(len(data))
+
+    def submit(self):
+        """
+        Hand the buffered output to the pool as one block
+
+        """
+
+        block = b''.join(self.buffer)
+        self.buffer = []
+        self.size = 0
+
+        if(self.pool is None):
+            self.file.write(self.compress(block))
+            return
+
+        self.pending.append(self.pool.apply_async(self.compress, (block,)))
+
+        # Write finished blocks so only a few wait in memory
+        while(len(self.pending) > self.threads * 2 or
+                (self.pending and self.pending[0].ready())):
+            self.file.write(self.pending.popleft().get())
+
+    def close(self):
+        if(self.closed):
+            return
+
+        try:
+            if(self.size):
+                self.submit()
+            while(self.pending):
+                self.file.write(self.pending.popleft().get())
+        finally:
+            if(self.pool is not None):
+                self.pool.close()
+                self.pool.join()
+            self.file.close()
+            io.RawIOBase.close(self)
+
+def getZstandard():
+    """
+    Import the zstandard package, which zstd files need
+
+    """
+
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('zstd files need the zstandard package '\
+            '(pip install zstandard)')
+
+    return(zstandard)
+
+def openOutput(filename, append=False):
+    """
+    Open a file for writing text, compressed with the configured compression
+
+    Input:
+        filename: Name of the file, as returned by getFilename
+        append: Add to the end of the file instead of replacing it
+    Return:
+        Open file object the csv module and pandas can write UTF-8 rows to
+
+    """
+
+    mode = 'ab' if append else 'wb'
+
+    if(compression is None):
+        return(openCSV(filename, mode[0]))
+
+    if(compression == 'gzip'):
+        binary = BlockGzipWriter(filename, mode, getLevel(), threads,
+            blockSize)
+    else:
+        zstandard = getZstandard()
+        compressor = zstandard.ZstdCompressor(level=getLevel(),
+            threads=threads if threads > 1 else 0)
+        binary = compressor.stream_writer(open(filename, mode))
+
+    # Python 2 writes bytes straight to the compressor
+    if(PY2):
+        return(binary)
+
+    return(io.TextIOWrapper(binary, encoding='utf-8', newline=''))
+
+def openInput(filename):
+    """
+    Open a file for reading text, decompressing .gz and .zst files
+
+    Input:
+        filename: Name of a possibly compressed file
+    Return:
+        Open file object the csv module and pandas can read UTF-8 rows from
+
+    """
+
+    if(filename.endswith(EXTENSIONS['gzip'])):
+        import gzip
+
+        # Appended files hold several gzip members, which gzip reads as one
+        binary = gzip.open(filename, 'rb')
+    elif(filename.endswith(EXTENSIONS['zstd'])):
+        zstandard = getZstandard()
+
+        # Appended files hold several zstd frames
+        binary = zstandard.ZstdDecompressor().stream_reader(
+            open(filename, 'rb'), read_across_frames=True)
+    else:
+        return(openCSV(filename, 'r'))
+
+    if(PY2):
+        return(binary)
+
+    return(io.TextIOWrapper(binary, encoding='utf-8', newline=''))
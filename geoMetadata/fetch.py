@@ -0,0 +1,1064 @@
+"""
+Download accession and sample metadata from GEO
+
+"""
+
+import os
+import socket
+import threading
+import time
+
+from collections import OrderedDict
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
+# lxml and Bio are imported where they are used so that importing this
+# module, and starting the command line, does not load them
+from geoMetadata.compat import HTTPError, HTTPException, URLError, \
+    urlencode, urlopen
+from geoMetadata.metrics import metrics
+from geoMetadata.miniml import MINiMLParser
+from geoMetadata.profiling import profiled
+
+# Registered email address with Entrez
+ENTREZ_EMAIL = 'rkweku@udel.edu'
+
+# HTTP status codes NCBI answers with when a client sends too many requests
+THROTTLE_STATUSES = (429, 503)
+
+# Failures of a request that may pass when it is made again: the server not
+# being reached, the connection dropping or timing out, or a broken
+# response. Error statuses are told apart by isTransient
+TRANSIENT_ERRORS = (URLError, socket.timeout, socket.error, HTTPException)
+
+##############################Fetch Settings#################################
+# Changed through configure, usually from the command line
+
+# URL of the GEO accession display
+geoURL = 'http://www.ncbi.nlm.nih.gov/geo/query/acc.cgi'
+
+# URL of the Entrez esummary utility
+entrezURL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi'
+
+# Times a failed request is retried before giving up
+retries = 1
+
+# Seconds to wait before the first retry of a failed request. Doubled for
+# every further retry unless the server sends Retry-After
+retryDelay = 10
+
+# Seconds to wait for a server to answer
+timeout = 60
+
+# How samples are downloaded: 'threads' runs workers threads, 'async' keeps
+# up to workers requests in flight on one thread (Python 3.7 or later)
+engine = 'threads'
+
+# Number of samples downloaded and parsed at the same time
+workers = 1
+
+# Most requests started per second across all workers. NCBI allows 3 per
+# second without an API key. 0 or None disables the limit
+rateLimit = 3
+
+# Folder where downloaded MINiML documents are kept and reused. None
+# disables the cache
+cacheDir = None
+
+# Number of samples handed to the workers at a time
+batchSize = 100
+
+# Also collect the samples of every SubSeries of a SuperSeries
+expandSubSeries = True
+
+# Short tags kept in each sample's record, e.g. ('Characteristics',
+# 'Organism', 'Source'). Other tags are skipped by the parser so they never
+# become columns. None keeps every tag
+fields = None
+
+# Most accession lookups (samples of an accession, esummary of a GDS) kept in
+# memory for repeated calls. 0 disables the memo
+memoSize = 1024
+
+# Seconds a remembered lookup is used before it is fetched again. None keeps
+# it until it is evicted
+memoTTL = 3600
+##############################################################################
+
+# Parser holding the compiled XPath expressions and tag names. Created on
+# first use by getParser
+minimlParser = None
+
+class RateLimiter(object):
+    """
+    Spread requests out so no more than a set number start each second
+
+    Safe to share between threads.
+
+    """
+
+    def __init__(self, rate):
+        # Seconds that must pass between the start of two requests
+        self.interval = 1.0 / rate if rate else 0
+
+        # Time the next request is allowed to start
+        self.nextTime = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block until another request is allowed to start
+
+        """
+
+        if(not self.interval):
+            return
+
+        with self.lock:
+            now = time.time()
+            waitTime = self.nextTime - now
+            self.nextTime = max(now, self.nextTime) + self.interval
+
+        if(waitTime > 0):
+            time.sleep(waitTime)
+
+# Limiter shared by every request
+rateLimiter = RateLimiter(rateLimit)
+
+class SampleRegistry(object):
+    """
+    Records of the samples fetched during a run
+
+    The same sample often belongs to several accessions of a run, e.g. a
+    SuperSeries and its SubSeries or a GDS and the GSE it was built from.
+    With a registry each sample is fetched and parsed once and the same
+    record is written for every accession it belongs to.
+
+    """
+
+    def __init__(self, maxSize=None):
+        """
+        Input:
+            maxSize: Most records kept, the least recently used going first.
+                A sample whose record was dropped is fetched again if
+                another accession needs it. None keeps every record
+
+        """
+
+        self.maxSize = maxSize
+
+        # Sample ID -> parsed record, least recently used first
+        self.records = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, sampleID):
+        return(sampleID in self.records)
+
+    def __len__(self):
+        return(len(self.records))
+
+    def get(self, sampleID):
+        with self.lock:
+            record = self.records.pop(sampleID, None)
+            if(record is not None):
+                self.records[sampleID] = record
+
+        return(record)
+
+    def add(self, sampleID, record):
+        with self.lock:
+            self.records.pop(sampleID, None)
+            self.records[sampleID] = record
+
+            if(self.maxSize is not None):
+                while(len(self.records) > self.maxSize):
+                    self.records.popitem(last=False)
+
+    def remove(self, sampleID):
+        """
+        Drop the record of a sample no longer needed by the run
+
+        Input:
+            sampleID: Sample ID, which does not have to be in the registry
+
+        """
+
+        with self.lock:
+            self.records.pop(sampleID, None)
+
+    def getMissing(self, samples):
+        """
+        Get the samples that still have to be fetched
+
+        Input:
+            samples: A list of sample IDs
+        Return:
+            The samples not in the registry, without duplicates and in
+            their original order
+
+        """
+
+        missing = []
+        seen = set()
+        with self.lock:
+            for sample in samples:
+                if(sample not in self.records and sample not in seen):
+                    seen.add(sample)
+                    missing.append(sample)
+
+        return(missing)
+
+class LookupMemo(object):
+    """
+    Least recently used memo of accession lookups, each kept for a time
+
+    Libraries and notebooks often resolve the same accession again soon
+    after, so the samples of an accession and the esummary of a GDS are
+    remembered instead of asking NCBI each time. Safe to share between
+    threads. Two threads missing the same lookup at once both fetch it.
+
+    """
+
+    def __init__(self, maxSize, ttl=None):
+        """
+        Input:
+            maxSize: Most lookups kept. 0 keeps none
+            ttl: Seconds a lookup is kept. None keeps it until it is
+                evicted
+
+        """
+
+        self.maxSize = maxSize
+        self.ttl = ttl
+
+        # Key -> (time it expires, value), least recently used first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return(len(self.entries))
+
+    def get(self, key):
+        """
+        Get a remembered lookup
+
+        Input:
+            key: Key of the lookup, e.g. ('samples', 'GSE1234')
+        Return:
+            The remembered value, or None if it is missing or expired
+
+        """
+
+        with self.lock:
+            entry = self.entries.pop(key, None)
+
+            if(entry is not None and entry[0] is not None and
+                    entry[0] <= time.time()):
+                self.expirations += 1
+                entry = None
+
+            if(entry is None):
+                self.misses += 1
+                metrics.count('memoMisses')
+                return(None)
+
+            # Put it back as the most recently used
+            self.entries[key] = entry
+            self.hits += 1
+
+        metrics.count('memoHits')
+
+        return(entry[1])
+
+    def add(self, key, value):
+        """
+        Remember a lookup, evicting the least recently used ones if full
+
+        Input:
+            key: Key of the lookup
+            value: Result of the lookup
+
+        """
+
+        if(self.maxSize <= 0):
+            return
+
+        expires = None
+        if(self.ttl is not None):
+            expires = time.time() + self.ttl
+
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (expires, value)
+
+            while(len(self.entries) > self.maxSize):
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Forget every lookup, keeping the statistics
+
+        """
+
+        with self.lock:
+            self.entries.clear()
+
+    def getStats(self):
+        """
+        Get the hit and miss statistics
+
+        Return:
+            Dictionary with the hits, misses, hitRatio, evictions,
+            expirations, size, maxSize and ttl
+
+        """
+
+        with self.lock:
+            lookups = self.hits + self.misses
+            return({'hits': self.hits, 'misses': self.misses,
+                'hitRatio': float(self.hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations, 'size': len(self.entries),
+                'maxSize': self.maxSize, 'ttl': self.ttl})
+
+# Memo shared by every lookup
+lookupMemo = LookupMemo(memoSize, memoTTL)
+
+# Names of the settings configure accepts
+SETTINGS = ('geoURL', 'entrezURL', 'retries', 'retryDelay', 'timeout',
+    'engine', 'workers', 'rateLimit', 'cacheDir', 'batchSize',
+    'expandSubSeries', 'fields', 'memoSize', 'memoTTL')
+
+# Settings that change the answer of a lookup or the memo itself. Changing
+# any of them starts a new, empty memo
+MEMO_SETTINGS = ('geoURL', 'entrezURL', 'expandSubSeries', 'memoSize',
+    'memoTTL')
+
+def configure(**settings):
+    """
+    Change the fetch settings
+
+    Input:
+        settings: New values for any of the fetch settings, e.g. engine,
+            workers, rateLimit, cacheDir, batchSize, expandSubSeries,
+            fields, memoSize, memoTTL, geoURL, entrezURL, retries,
+            retryDelay or timeout
+
+    """
+
+    global rateLimiter, lookupMemo, fields
+
+    for name, value in settings.items():
+        if(name not in SETTINGS):
+            raise TypeError('Unknown fetch setting: %s' % name)
+        globals()[name] = value
+
+    rateLimiter = RateLimiter(rateLimit)
+
+    # Tags are looked up once per element, so keep them as a set
+    if(fields is not None):
+        fields = frozenset(fields)
+
+    if(any(name in MEMO_SETTINGS for name in settings)):
+        lookupMemo = LookupMemo(memoSize, memoTTL)
+
+def getMemoStats():
+    """
+    Get the hit and miss statistics of the accession lookup memo
+
+    Return:
+        Dictionary as returned by LookupMemo.getStats
+
+    """
+
+    return(lookupMemo.getStats())
+
+def clearMemo():
+    """
+    Forget every remembered accession lookup, e.g. to see new samples
+
+    """
+
+    lookupMemo.clear()
+
+def getParser():
+    """
+    Get the shared MINiML parser, creating it on first use
+
+    Return:
+        The MINiMLParser shared by all fetches
+
+    """
+
+    global minimlParser
+
+    if(minimlParser is None):
+        minimlParser = MINiMLParser()
+
+    return(minimlParser)
+
+def getAccessionURL(accessionID):
+    """
+    Build the URL of the brief MINiML document for an accession
+
+    Input:
+        accessionID: GEO accession number of a series, sample or dataset
+    Return:
+        URL of the MINiML document
+
+    """
+
+    # Complete the URL by adding the accession and then the URL cap
+    return('%s?acc=%s%s' % (geoURL, accessionID,
+        '&targ=self&form=xml&view=brief'))
+
+def getCacheFilename(accessionID):
+    """
+    Get the name of the cached MINiML document for an accession
+
+    Input:
+        accessionID: GEO accession number of a series, sample or dataset
+    Return:
+        Name of the cache file, or None if caching is disabled
+
+    """
+
+    if(not cacheDir):
+        return(None)
+
+    return(os.path.join(cacheDir, '%s.xml' % accessionID))
+
+def getRetryDelay(error, attempt):
+    """
+    Get how long to wait before retrying a failed request
+
+    Input:
+        error: Exception the request failed with
+        attempt: Number of the retry about to be made, starting at 1
+    Return:
+        Seconds to wait
+
+    """
+
+    # Throttled requests may say when to come back
+    if(isinstance(error, HTTPError) and error.code in THROTTLE_STATUSES):
+        retryAfter = error.headers.get('Retry-After') if error.headers \
+            else None
+        if(retryAfter):
+            try:
+                return(float(retryAfter))
+            except ValueError:
+                pass
+
+    return(retryDelay * 2 ** (attempt - 1))
+
+def isTransient(error):
+    """
+    Tell whether a failed request is worth making again
+
+    Throttling (429) and server errors (5xx) are, as are network failures.
+    Any other error status, e.g. 404 for an accession that does not exist,
+    and errors such as a malformed URL fail the same way every time.
+
+    Input:
+        error: Exception the request failed with
+    Return:
+        True if the request should be retried
+
+    """
+
+    if(isinstance(error, HTTPError)):
+        return(error.code == 429 or error.code >= 500)
+
+    return(isinstance(error, TRANSIENT_ERRORS))
+
+def reportRetry(error, attempt):
+    """
+    Report a failed request that is about to be retried
+
+    Input:
+        error: Exception the request failed with
+        attempt: Number of the retry about to be made, starting at 1
+    Return:
+        Seconds to wait before the retry
+
+    """
+
+    delay = getRetryDelay(error, attempt)
+    if(isinstance(error, HTTPError) and error.code in THROTTLE_STATUSES):
+        print("Throttled. Sleeping for %s seconds" % delay)
+        metrics.count('throttled')
+    else:
+        print("Request failed (%s). Sleeping for %s seconds" %
+            (str(error) or error.__class__.__name__, delay))
+    metrics.count('retries')
+
+    return(delay)
+
+def recordDownload(start, document):
+    """
+    Record the time and size of a finished request
+
+    Input:
+        start: Time the successful attempt started
+        document: The response body
+
+    """
+
+    metrics.record('http', time.time() - start)
+    metrics.count('requests')
+    metrics.count('bytesFetched', len(document))
+
+def download(url):
+    """
+    Download a URL, retrying failed requests
+
+    Every attempt waits for the rate limiter. Attempts failing in a way that
+    may pass (see isTransient) are retried up to retries times, waiting
+    longer before each one. Other failures are raised at once.
+
+    Input:
+        url: URL to download
+    Return:
+        The response body as bytes
+
+    """
+
+    attempt = 0
+
+    while(True):
+        rateLimiter.wait()
+        start = time.time()
+        try:
+            usock = urlopen(url, timeout=timeout)
+            try:
+                document = usock.read()
+            finally:
+                usock.close()
+            break
+        except Exception as error:
+            if(attempt >= retries or not isTransient(error)):
+                raise
+
+            attempt += 1
+            time.sleep(reportRetry(error, attempt))
+
+    recordDownload(start, document)
+
+    return(document)
+
+def downloadMINiML(accessionID):
+    """
+    Download the MINiML document for an accession
+
+    Input:
+        accessionID: GEO accession number of a series, sample or dataset
+    Return:
+        The document as bytes
+
+    """
+
+    return(download(getAccessionURL(accessionID)))
+
+def readCachedMINiML(accessionID):
+    """
+    Parse the cached MINiML document for an accession
+
+    Input:
+        accessionID: GEO accession number of a series, sample or dataset
+    Return:
+        Root element of the document, or None if it is not cached
+
+    """
+
+    import lxml.etree as ET
+
+    filename = getCacheFilename(accessionID)
+    if(not filename or not os.path.exists(filename)):
+        return(None)
+
+    metrics.count('cacheHits')
+    with metrics.timer('xml'), profiled():
+        return(ET.parse(filename).getroot())
+
+def parseMINiML(accessionID, document):
+    """
+    Parse a downloaded MINiML document and add it to the cache
+
+    Input:
+        accessionID: GEO accession number of a series, sample or dataset
+        document: The downloaded document as bytes
+    Return:
+        Root element of the document
+
+    """
+
+    import lxml.etree as ET
+
+    with metrics.timer('xml'), profiled():
+        root = ET.fromstring(document)
+
+    # Only cache documents that parsed. Write to a temporary file first so
+    # another worker never reads a partial document
+    filename = getCacheFilename(accessionID)
+    if(filename):
+        if(not os.path.exists(cacheDir)):
+            try:
+                os.makedirs(cacheDir)
+            except OSError:
+                pass
+
+        temporaryFilename = '%s.%s.tmp' % (filename,
+            threading.current_thread().ident)
+        with open(temporaryFilename, 'wb') as f:
+            f.write(document)
+        os.rename(temporaryFilename, filename)
+
+    return(root)
+
+def getMINiML(accessionID):
+    """
+    Download and parse the MINiML document for an accession
+
+    The cached copy is used instead when the cache is enabled and already
+    holds the document.
+
+    Input:
+        accessionID: GEO accession number of a series, sample or dataset
+    Return:
+        Root element of the MINiML document
+
+    """
+
+    root = readCachedMINiML(accessionID)
+    if(root is None):
+        root = parseMINiML(accessionID, downloadMINiML(accessionID))
+
+    return(root)
+
+def refreshMINiML(accessionID):
+    """
+    Download and parse the MINiML document for an accession, even when the
+    cache holds it, and replace the cached copy
+
+    Input:
+        accessionID: GEO accession number of a series, sample or dataset
+    Return:
+        Root element of the MINiML document
+
+    """
+
+    return(parseMINiML(accessionID, downloadMINiML(accessionID)))
+
+def getESummaryURL(gdsID):
+    """
+    Build the URL of the Entrez esummary of a GEO dataset
+
+    Input:
+        gdsID: GDS accession number without the GDS prefix
+    Return:
+        URL of the esummary
+
+    """
+
+    return('%s?%s' % (entrezURL, urlencode({'db': 'gds', 'id': gdsID,
+        'email': ENTREZ_EMAIL, 'tool': 'getGeoMetadata'})))
+
+def readGDSMetadata(document):
+    """
+    Read the GDS metadata out of a downloaded esummary
+
+    Input:
+        document: The esummary response as bytes
+    Return:
+        Dictionary containing the metadata for the entire dataset
+
+    """
+
+    import io
+
+    from Bio import Entrez
+
+    return(Entrez.read(io.BytesIO(document))[0])
+
+def getGDSMetadata(gdsID):
+    """
+    Get the GDS metadata for the datset of interest
+
+    Input:
+        gdsID: GDS accession number of the dataset of interest
+    Return:
+        Dictionary containing the metadata for the entire dataset
+
+    """
+
+    # Datasets looked up recently are not requested again
+    key = ('esummary', gdsID)
+    metadata = lookupMemo.get(key)
+    if(metadata is not None):
+        return(metadata)
+
+    # Get the metadata for the GEO dataset. The request is made here rather
+    # than with Entrez.esummary so it shares the rate limit, retries and
+    # configurable URL of every other request
+    metadata = readGDSMetadata(download(getESummaryURL(gdsID)))
+    lookupMemo.add(key, metadata)
+
+    return(metadata)
+
+def getSamplesFromGDS(geoMetadata):
+    """
+    Get all sample IDs from the GEO metadata
+
+    Input:
+        getMetadata: Dictionary with the entire metadata
+    Return:
+        List of all GSM accession numbers
+
+    """
+
+    # Initialize samples list to store all GSM accession numbers
+    samples = []
+
+    for sample in geoMetadata['Samples']:
+        samples.append(sample['Accession'])
+
+    return(samples)
+
+def getSeriesFromGDS(geoMetadata):
+    """
+    Get the series a GDS was curated from
+
+    Input:
+        geoMetadata: Dictionary with the entire metadata of the GDS
+    Return:
+        List of GSE accession numbers, empty if the esummary names none
+
+    """
+
+    # Listed by number, several of them separated by semicolons
+    return(['GSE%s' % seriesID.strip() for seriesID in
+        str(geoMetadata.get('GSE', '')).split(';') if seriesID.strip()])
+
+class SeriesExpansion(object):
+    """
+    Samples of a series and, for a SuperSeries, of every SubSeries below it
+
+    Each series document is added once. Samples listed by several of them
+    are only kept the first time.
+
+    """
+
+    def __init__(self, accessionID):
+        # Sample IDs in the order they were found
+        self.samples = []
+        self.sampleIDs = set()
+
+        # Series already added or about to be
+        self.seriesIDs = set([accessionID])
+
+        # Latest Last-Update-Date of the series added, as YYYY-MM-DD
+        self.lastUpdate = ''
+
+    def add(self, root):
+        """
+        Add the samples of a series document
+
+        Input:
+            root: Root element of a GSE MINiML document
+        Return:
+            The SubSeries it lists that still have to be added
+
+        """
+
+        parser = getParser()
+
+        self.lastUpdate = max(self.lastUpdate, parser.getLastUpdate(root))
+
+        # Get the sample IDs from the xml file
+        for sample in parser.getSampleIDs(root):
+            if(sample not in self.sampleIDs):
+                self.sampleIDs.add(sample)
+                self.samples.append(sample)
+
+        subSeries = []
+        if(expandSubSeries):
+            for seriesID in parser.getSubSeriesIDs(root):
+                if(seriesID not in self.seriesIDs):
+                    self.seriesIDs.add(seriesID)
+                    subSeries.append(seriesID)
+
+        return(subSeries)
+
+def expandSeries(accessionID, getDocument=getMINiML):
+    """
+    Walk a series and, for a SuperSeries, every SubSeries below it
+
+    The SubSeries are walked one level at a time, with the documents of
+    each level downloaded at the same time.
+
+    Input:
+        accessionID: GSE accession number of the series
+        getDocument: Function returning the root element of the MINiML
+            document of a series
+    Return:
+        The SeriesExpansion of the series
+
+    """
+
+    expansion = SeriesExpansion(accessionID)
+    pending = expansion.add(getDocument(accessionID))
+
+    while(pending):
+        roots = mapWorkers(getDocument, pending)
+        pending = [seriesID for root in roots
+            for seriesID in expansion.add(root)]
+
+    return(expansion)
+
+def getSamplesFromOthers(accessionID):
+    """
+    Get the sample names from non GDS datasets
+
+    The samples of every SubSeries of a SuperSeries are included.
+
+    Input:
+        accessionID: The ID of the dataset
+    Return:
+        A list of all samples for a given dataset
+
+    """
+
+    # Accessions looked up recently are not requested again. A copy is
+    # returned so callers can not change the remembered list
+    key = ('samples', accessionID)
+    samples = lookupMemo.get(key)
+    if(samples is not None):
+        return(list(samples))
+
+    expansion = expandSeries(accessionID)
+    lookupMemo.add(key, expansion.samples)
+
+    return(list(expansion.samples))
+
+def getSamples(accessionID):
+    """
+    Get the sample names of any GEO accession
+
+    Input:
+        accessionID: The ID of the dataset or series
+    Return:
+        A list of all samples for the accession
+
+    """
+
+    # If the dataset is GDS, use the GDS parsing functions
+    if(accessionID.startswith('GDS')):
+        # Get the GDS metadata for the given GEO ID (without 'GDS')
+        gdsMetadata = getGDSMetadata(accessionID.split('GDS')[1])
+
+        # Get all samples from the GEO
+        return(getSamplesFromGDS(gdsMetadata))
+
+    return(getSamplesFromOthers(accessionID))
+
+def getLastUpdate(accessionID):
+    """
+    Look up when an accession was last updated on GEO
+
+    For a series this is the latest Last-Update-Date of its document and of
+    the document of every SubSeries below it, which are downloaded even when
+    they are cached. The publication date of a GDS never changes, so for a
+    GDS it is that date followed by the update date of each series the GDS
+    was curated from, found the same way. A GDS whose esummary names no
+    series only counts as updated when its number of samples changes. The
+    samples found on the way are remembered, so getSamples does not request
+    them again.
+
+    Input:
+        accessionID: GEO accession number of a dataset or series
+    Return:
+        Tuple of the date, and a list of all samples for the accession
+
+    """
+
+    if(accessionID.startswith('GDS')):
+        gdsMetadata = getGDSMetadata(accessionID.split('GDS')[1])
+
+        dates = [str(gdsMetadata.get('PDAT', ''))]
+        for seriesID in getSeriesFromGDS(gdsMetadata):
+            dates.append(expandSeries(seriesID, refreshMINiML).lastUpdate)
+
+        return(' '.join(dates), getSamplesFromGDS(gdsMetadata))
+
+    expansion = expandSeries(accessionID, refreshMINiML)
+    lookupMemo.add(('samples', accessionID), expansion.samples)
+
+    return(expansion.lastUpdate, list(expansion.samples))
+
+def parseSample(root):
+    """
+    Build the metadata of one sample from its MINiML document
+
+    Input:
+        root: Root element of the sample's MINiML document
+    Return:
+        Dictionary containing the metadata for the sample
+
+    """
+
+    with metrics.timer('parse'), profiled():
+        person = getParser().parseSample(root, fields)
+    metrics.count('samplesParsed')
+
+    return(person)
+
+def getSample(sample, refresh=False):
+    """
+    Get the metadata for one sample
+
+    Input:
+        sample: GSM accession number of the sample
+        refresh: Download the sample's document even when it is cached, and
+            replace the cached copy
+    Return:
+        Dictionary containing the metadata for the sample
+
+    """
+
+    if(refresh):
+        return(parseSample(refreshMINiML(sample)))
+
+    return(parseSample(getMINiML(sample)))
+
+def mapWorkers(function, items):
+    """
+    Call a function on every item with up to workers threads
+
+    Input:
+        function: Function taking one item
+        items: List of items, e.g. accession numbers
+    Return:
+        List of the results, in the order of items
+
+    """
+
+    results = []
+
+    if(workers <= 1 or len(items) <= 1):
+        # Go through all items one at a time. Append each result to the
+        # final list
+        for item in items:
+            results.append(function(item))
+
+        return(results)
+
+    # Hand the items to the workers one batch at a time so only a batch of
+    # documents is in flight at once. map keeps the order of the items
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        for start in range(0, len(items), batchSize):
+            results.extend(pool.map(function, items[start:start + batchSize]))
+    finally:
+        pool.close()
+        pool.join()
+
+    return(results)
+
+def tryGetSample(sample, refresh=False):
+    """
+    Get the metadata for one sample, handing back the error if it fails
+
+    Input:
+        sample: GSM accession number of the sample
+        refresh: Download the sample's document even when it is cached
+    Return:
+        Dictionary containing the metadata for the sample, or the exception
+        raised while getting it
+
+    """
+
+    try:
+        return(getSample(sample, refresh))
+    except Exception as error:
+        return(error)
+
+def downloadSampleMetadata(samples, isolate=False, refresh=False):
+    """
+    Download and parse the metadata for all samples
+
+    Input:
+        samples: A list of sample IDs
+        isolate: Hand back the exception of a sample that fails in place of
+            its metadata instead of raising it
+        refresh: Download the documents even when they are cached, and
+            replace the cached copies
+    Return:
+        List with a dictionary containing the metadata for each sample
+
+    """
+
+    if(engine == 'async'):
+        # Only loaded for async runs, it needs Python 3
+        from geoMetadata import asyncFetch
+
+        return(asyncFetch.runSampleMetadata(samples, isolate, refresh))
+
+    return(mapWorkers(partial(tryGetSample if isolate else getSample,
+        refresh=refresh), samples))
+
+def getSampleMetadata(samples, registry=None, failures=None,
+        refresh=False):
+    """
+    Get the metadata for all samples
+
+    Input:
+        samples: A list of all sample IDs as pulled from the GEO dataset
+        registry: SampleRegistry of the run. Samples it already holds are
+            not fetched again, and newly fetched ones are added to it
+        failures: Dictionary of sample ID -> exception that samples which
+            fail are added to. Without it the first failure is raised
+        refresh: Download the documents of the samples not in the registry
+            even when they are cached, e.g. for an accession updated on GEO
+    Return:
+        List with a dictionary containing the metadata for each sample.
+        Samples that failed are left out
+
+    """
+
+    isolate = failures is not None
+
+    # Sample ID -> record of every sample returned. Records are taken from
+    # the registry before fetching, as a bounded one may drop them while
+    # the rest are added
+    records = {}
+    if(registry is None):
+        missing = samples
+    else:
+        for sample in samples:
+            record = registry.get(sample)
+            if(record is not None):
+                records[sample] = record
+        missing = registry.getMissing([sample for sample in samples
+            if sample not in records])
+        metrics.count('samplesReused', len(samples) - len(missing))
+
+    for sample, person in zip(missing, downloadSampleMetadata(missing,
+            isolate, refresh)):
+        # One bad sample does not cost the rest of its accession
+        if(isinstance(person, Exception)):
+            failures[sample] = person
+            metrics.count('samplesFailed')
+            continue
+
+        records[sample] = person
+        if(registry is not None):
+            registry.add(sample, person)
+
+    return([records[sample] for sample in samples if sample in records])
@@ -0,0 +1,176 @@
+"""
+Combine the output folders of sharded runs
+
+A full refresh is split over several nodes with batch --shard I/N, each
+writing its own folder. The per accession files of every folder are then
+combined here into one merged table, written as csv, Parquet or SQLite and
+uploaded to Synapse once.
+
+"""
+
+import os
+
+from geoMetadata.compression import stripExtension
+from geoMetadata.synapse import MERGED_FILENAME, alignFrame, findFiles, \
+    readFiles, writeMerged
+
+# Merged output formats and the file each one is written to
+OUTPUT_FILENAMES = {'csv': MERGED_FILENAME, 'parquet': 'allData.parquet',
+    'sqlite': 'allData.sqlite'}
+
+# Name of the table in SQLite output
+SQLITE_TABLE = 'metadata'
+
+def getShardFrames(directories, schema):
+    """
+    Read the per accession files of every shard folder
+
+    An accession found in more than one folder, e.g. after a shard was run
+    again elsewhere, is only read from the first.
+
+    Input:
+        directories: Output folders of the shards
+        schema: SchemaRegistry the columns of every file are added to
+    Return:
+        Iterator of dataframes of up to CHUNK_ROWS rows, all as text
+
+    """
+
+    files = []
+    seen = set()
+
+    for directory in directories:
+        for filename, separator in findFiles(directory, schema):
+            # GSE1.csv and GSE1.csv.gz hold the same accession
+            name = os.path.splitext(stripExtension(
+                os.path.basename(filename)))[0]
+            if(name in seen):
+                print('Skipping %s, %s was already read' % (filename, name))
+                continue
+            seen.add(name)
+            files.append((filename, separator))
+
+    return(readFiles(files))
+
+def getAlignedRows(df, schema):
+    """
+    Get the rows of a dataframe in the column order of the merged table
+
+    Input:
+        df: Dataframe whose columns are all in the schema
+        schema: SchemaRegistry of the merged table
+    Return:
+        List of the columns of the merged table, each a list of text values
+
+    """
+
+    empty = [''] * len(df)
+    columns = [empty] * len(schema)
+
+    for position, values in alignFrame(df, schema):
+        columns[position] = values.tolist()
+
+    return(columns)
+
+def writeSQLite(filename, schema, frames):
+    """
+    Write the merged table to a SQLite database
+
+    Input:
+        filename: Name of the database, replaced if it exists
+        schema: SchemaRegistry holding every column of the frames
+        frames: Iterable of dataframes
+    Return:
+        Number of rows written
+
+    """
+
+    import sqlite3
+
+    if(os.path.exists(filename)):
+        os.remove(filename)
+
+    # Column names are quoted, they hold spaces and dashes
+    names = ', '.join('"%s"' % column.replace('"', '""')
+        for column in schema.columns)
+    insert = 'INSERT INTO %s VALUES (%s)' % (SQLITE_TABLE,
+        ', '.join(['?'] * len(schema)))
+
+    count = 0
+    connection = sqlite3.connect(filename)
+    try:
+        connection.execute('CREATE TABLE %s (%s)' % (SQLITE_TABLE, names))
+        for df in frames:
+            connection.executemany(insert, zip(*getAlignedRows(df, schema)))
+            count += len(df)
+        connection.commit()
+    finally:
+        connection.close()
+
+    return(count)
+
+def writeParquet(filename, schema, frames):
+    """
+    Write the merged table to a Parquet file, one row group per frame
+
+    Input:
+        filename: Name of the file
+        schema: SchemaRegistry holding every column of the frames
+        frames: Iterable of dataframes
+    Return:
+        Number of rows written
+
+    """
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('Parquet output needs the pyarrow package '\
+            '(pip install pyarrow)')
+
+    # Every column is text, as in the csv output
+    tableSchema = pa.schema([(column, pa.string())
+        for column in schema.columns])
+
+    count = 0
+    writer = pq.ParquetWriter(filename, tableSchema)
+    try:
+        for df in frames:
+            writer.write_table(pa.Table.from_arrays([pa.array(values,
+                pa.string()) for values in getAlignedRows(df, schema)],
+                schema=tableSchema))
+            count += len(df)
+    finally:
+        writer.close()
+
+    return(count)
+
+def mergeShards(directories, directory, schema, outputFormat='csv'):
+    """
+    Combine the output folders of sharded runs into one merged file
+
+    Input:
+        directories: Output folders of the shards
+        directory: Folder to write the merged file to
+        schema: SchemaRegistry the columns of every file are added to
+        outputFormat: csv, parquet or sqlite
+    Return:
+        Tuple of the name of the merged file and the number of rows
+
+    """
+
+    if(directory and not os.path.exists(directory)):
+        os.makedirs(directory)
+
+    filename = os.path.join(directory, OUTPUT_FILENAMES[outputFormat])
+    frames = getShardFrames(directories, schema)
+
+    if(outputFormat == 'sqlite'):
+        count = writeSQLite(filename, schema, frames)
+    elif(outputFormat == 'parquet'):
+        count = writeParquet(filename, schema, frames)
+    else:
+        count = writeMerged(filename, schema, frames)[0]
+
+    return(filename, count)
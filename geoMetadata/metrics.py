@@ -0,0 +1,299 @@
+"""
+Timers and counters for each stage of a run
+
+Every stage records into the shared registry, metrics, which can be written
+as JSON or Prometheus text at the end of a run and printed periodically while
+it runs.
+
+Timers in use:
+    http: Latency of each request to GEO or Entrez
+    xml: Time for lxml to parse one MINiML document
+    parse: Time to build the record of one sample from its document
+    archive: Time to read and parse every sample of one family archive
+    write: Time to write one accession's file
+    merge: Time to write the aligned merged file before an upload
+    upload: Time to store the table on Synapse
+
+Counters in use:
+    requests, throttled, retries, bytesFetched, cacheHits, memoHits,
+    memoMisses, samplesParsed, samplesReused, samplesFailed,
+    accessionsFailed, accessionsUnchanged, rowsWritten, filesWritten,
+    columnsDropped, rowsUploaded
+
+"""
+
+import json
+import random
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+
+# Durations kept per timer to compute percentiles. Beyond this a random
+# sample of the durations is kept so memory stays bounded on long runs
+MAX_SAMPLES = 100000
+
+# Percentiles reported for every timer
+PERCENTILES = (0.5, 0.9, 0.99)
+
+class Timer(object):
+    """
+    Count, total and percentiles of the durations recorded for one stage
+
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.samples = []
+
+    def add(self, seconds):
+        """
+        Record one duration
+
+        Input:
+            seconds: Duration to record
+
+        """
+
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+
+        # Reservoir sampling keeps every duration equally likely to be kept
+        if(len(self.samples) < MAX_SAMPLES):
+            self.samples.append(seconds)
+        else:
+            index = random.randint(0, self.count - 1)
+            if(index < MAX_SAMPLES):
+                self.samples[index] = seconds
+
+    def summary(self):
+        """
+        Summarize the recorded durations
+
+        Return:
+            Dictionary with the count, total, mean, max and percentiles
+
+        """
+
+        ordered = sorted(self.samples)
+        summary = {'count': self.count, 'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.maximum}
+
+        for percentile in PERCENTILES:
+            key = 'p%g' % (percentile * 100)
+            if(ordered):
+                summary[key] = ordered[min(len(ordered) - 1,
+                    int(percentile * len(ordered)))]
+            else:
+                summary[key] = 0.0
+
+        return(summary)
+
+class Metrics(object):
+    """
+    Thread safe registry of timers and counters
+
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Forget everything recorded so far
+
+        """
+
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+            self.startTime = time.time()
+
+    def count(self, name, amount=1):
+        """
+        Add to a counter
+
+        Input:
+            name: Name of the counter
+            amount: Amount to add
+
+        """
+
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record(self, name, seconds):
+        """
+        Record a duration for a timer
+
+        Input:
+            name: Name of the timer
+            seconds: Duration to record
+
+        """
+
+        with self.lock:
+            if(name not in self.timers):
+                self.timers[name] = Timer()
+            self.timers[name].add(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Time the body of a with statement
+
+        Input:
+            name: Name of the timer
+
+        """
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - start)
+
+    def snapshot(self):
+        """
+        Get everything recorded so far
+
+        Return:
+            Dictionary with the elapsed time, counters and timer summaries
+
+        """
+
+        with self.lock:
+            return({'elapsed': time.time() - self.startTime,
+                'counters': dict(self.counters),
+                'timers': dict((name, timer.summary())
+                    for name, timer in self.timers.items())})
+
+    def toJSON(self):
+        """
+        Export the metrics as JSON
+
+        Return:
+            JSON text
+
+        """
+
+        return(json.dumps(self.snapshot(), indent=2, sort_keys=True))
+
+    def toPrometheus(self, prefix='geometadata'):
+        """
+        Export the metrics in the Prometheus text format
+
+        Input:
+            prefix: Prefix for every metric name
+        Return:
+            Prometheus exposition text
+
+        """
+
+        snapshot = self.snapshot()
+        lines = []
+
+        lines.append('# TYPE %s_elapsed_seconds gauge' % prefix)
+        lines.append('%s_elapsed_seconds %f' % (prefix, snapshot['elapsed']))
+
+        for name in sorted(snapshot['counters']):
+            metric = '%s_%s_total' % (prefix, name)
+            lines.append('# TYPE %s counter' % metric)
+            lines.append('%s %d' % (metric, snapshot['counters'][name]))
+
+        for name in sorted(snapshot['timers']):
+            summary = snapshot['timers'][name]
+            metric = '%s_%s_seconds' % (prefix, name)
+            lines.append('# TYPE %s summary' % metric)
+            for percentile in PERCENTILES:
+                lines.append('%s{quantile="%g"} %f' % (metric, percentile,
+                    summary['p%g' % (percentile * 100)]))
+            lines.append('%s_sum %f' % (metric, summary['total']))
+            lines.append('%s_count %d' % (metric, summary['count']))
+
+        return('\n'.join(lines) + '\n')
+
+    def format(self):
+        """
+        Summarize the metrics in a few human readable lines
+
+        Return:
+            Summary text
+
+        """
+
+        snapshot = self.snapshot()
+        lines = ['%.1fs elapsed' % snapshot['elapsed']]
+
+        for name in sorted(snapshot['counters']):
+            lines.append('  %-14s %d' % (name, snapshot['counters'][name]))
+
+        for name in sorted(snapshot['timers']):
+            summary = snapshot['timers'][name]
+            lines.append('  %-14s n=%d total=%.2fs p50=%.1fms p90=%.1fms '\
+                'p99=%.1fms' % (name, summary['count'], summary['total'],
+                summary['p50'] * 1000, summary['p90'] * 1000,
+                summary['p99'] * 1000))
+
+        return('\n'.join(lines))
+
+    def write(self, filename, metricsFormat=None):
+        """
+        Write the metrics to a file
+
+        Input:
+            filename: Name of the file to write
+            metricsFormat: json or prometheus. Taken from the file extension
+                when not given (.prom is Prometheus, anything else JSON)
+
+        """
+
+        if(metricsFormat is None):
+            if(filename.endswith('.prom')):
+                metricsFormat = 'prometheus'
+            else:
+                metricsFormat = 'json'
+
+        if(metricsFormat == 'prometheus'):
+            text = self.toPrometheus()
+        else:
+            text = self.toJSON()
+
+        with open(filename, 'w') as f:
+            f.write(text)
+
+class Reporter(object):
+    """
+    Print a summary of the metrics at a fixed interval on a daemon thread
+
+    """
+
+    def __init__(self, registry, interval, stream=None):
+        self.registry = registry
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def run(self):
+        # wait returns True once stop has been called
+        while(not self.stopped.wait(self.interval)):
+            self.stream.write('%s\n' % self.registry.format())
+            self.stream.flush()
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+# Registry shared by every stage
+metrics = Metrics()
@@ -0,0 +1,348 @@
+"""
+Helpers for parsing GEO MINiML documents
+
+"""
+
+# Namespace of every element in a MINiML document
+MINIML_NAMESPACE = 'http://www.ncbi.nlm.nih.gov/geo/info/MINiML'
+
+# Elements of a Sample that hold others -> every tag found below them,
+# from the MINiML schema. A subtree none of whose tags are wanted is never
+# walked. Elements not listed here are walked whatever the fields
+SAMPLE_CONTAINERS = {
+    'Status': ('Submission-Date', 'Release-Date', 'Last-Update-Date'),
+    'Channel': ('Source', 'Organism', 'Characteristics',
+        'Biomaterial-Provider', 'Treatment-Protocol', 'Growth-Protocol',
+        'Molecule', 'Extract-Protocol', 'Label', 'Label-Protocol'),
+    'Data-Table': ('Column', 'Name', 'Description', 'External-Data',
+        'Internal-Data'),
+    'Contact-Ref': (),
+    'Platform-Ref': (),
+    'Supplementary-Data': (),
+    'Relation': (),
+}
+
+# Characters a string accepted by float() can begin with once leading
+# whitespace is removed: digits, a sign, a decimal point or the first
+# letter of 'inf', 'infinity' and 'nan'
+FLOAT_START = frozenset('0123456789+-.iInN')
+
+def toFloat(value):
+    """
+    Convert a value to a float if float() accepts it
+
+    Nearly every value in a MINiML document is plain text, so trying
+    float() on each one raises and swallows an exception per value. Only
+    values that begin like a number are handed to float(), which keeps the
+    result identical while skipping the exception for everything else.
+
+    Input:
+        value: Text or attribute value pulled from a MINiML element
+    Return:
+        The value as a float if it is numeric, otherwise the value unchanged
+
+    """
+
+    if(not value):
+        return(value)
+
+    # Only the first non whitespace character is needed for the check.
+    # isdigit() covers the non ASCII digits that float() also accepts
+    first = value[0]
+    if(first.isspace()):
+        first = value.lstrip()[:1]
+
+    if(first in FLOAT_START or first.isdigit()):
+        try:
+            return(float(value))
+        except ValueError:
+            pass
+
+    return(value)
+
+class MINiMLParser(object):
+    """
+    Reusable parser for MINiML documents
+
+    Holds the compiled XPath expressions and a cache mapping qualified tags
+    to their short names so neither is rebuilt for every sample or element.
+
+    """
+
+    def __init__(self):
+        # lxml is only loaded once a parser is needed
+        import lxml.etree as ET
+
+        # Namespace used by every element in a MINiML document
+        self.namespaces = {'t': MINIML_NAMESPACE}
+
+        # Compiled XPath expressions
+        self.samplePath = ET.XPath('//t:Sample', namespaces=self.namespaces)
+        self.subSeriesPath = ET.XPath('//t:Series/t:Relation'\
+            '[@type="SuperSeries of"]/@target', namespaces=self.namespaces)
+        self.seriesUpdatePath = ET.XPath('//t:Series/t:Status/'\
+            't:Last-Update-Date/text()', namespaces=self.namespaces)
+
+        # Qualified tags of the Sample and Channel elements
+        self.sampleTag = '{%s}Sample' % MINIML_NAMESPACE
+        self.channelTag = '{%s}Channel' % MINIML_NAMESPACE
+
+        # Qualified tag -> short tag for every tag seen so far
+        self.tagNames = {}
+
+    def shortTag(self, tag):
+        """
+        Remove the MINiML namespace from a tag
+
+        Input:
+            tag: Qualified tag of an element
+        Return:
+            The tag without the MINiML namespace
+
+        """
+
+        try:
+            return(self.tagNames[tag])
+        except KeyError:
+            shortTag = tag.replace('{%s}' % MINIML_NAMESPACE, '')
+            self.tagNames[tag] = shortTag
+            return(shortTag)
+
+    def getChannelSuffix(self, element):
+        """
+        Get the suffix keeping the characteristic names of each channel apart
+
+        Input:
+            element: A Characteristics element of a sample
+        Return:
+            ' (chN)' for characteristics of channel N of a sample with more
+            than one channel, '' for channel 1 and anything outside a channel
+
+        """
+
+        parent = element.getparent()
+        if(parent is None or parent.tag != self.channelTag):
+            return('')
+
+        position = parent.get('position')
+        if(not position or position == '1'):
+            return('')
+
+        return(' (ch%s)' % position)
+
+    def getSampleIDs(self, root):
+        """
+        Get the sample accession numbers listed in a document
+
+        Input:
+            root: Root element of a MINiML document
+        Return:
+            List of all sample IDs in the document
+
+        """
+
+        return([element.attrib['iid'] for element in self.samplePath(root)])
+
+    def getSubSeriesIDs(self, root):
+        """
+        Get the SubSeries a SuperSeries document lists
+
+        Input:
+            root: Root element of a GSE MINiML document
+        Return:
+            List of the GSE accession numbers of the SubSeries, empty for
+            any other series
+
+        """
+
+        return([str(target) for target in self.subSeriesPath(root)])
+
+    def getLastUpdate(self, root):
+        """
+        Get the date a series was last updated on GEO
+
+        Input:
+            root: Root element of a GSE MINiML document
+        Return:
+            The Last-Update-Date of the series as YYYY-MM-DD, or '' if the
+            document has none
+
+        """
+
+        # ISO dates sort in date order
+        return(max([str(date).strip() for date in
+            self.seriesUpdatePath(root)] or ['']))
+
+    def getSampleElement(self, root):
+        """
+        Get the Sample element of a sample document
+
+        Input:
+            root: Root element of a GSM MINiML document
+        Return:
+            The Sample element
+
+        """
+
+        return(root.find(self.sampleTag))
+
+    def iterFields(self, sample, fields):
+        """
+        Get the elements of a sample whose tags are wanted
+
+        Only the children of the Sample element are looked at in Python.
+        Those that are wanted are kept, those in SAMPLE_CONTAINERS that can
+        not hold a wanted tag (e.g. Status or Data-Table for
+        Characteristics) are skipped with everything below them, and the
+        rest are searched for the wanted tags by lxml. The document is
+        still parsed in full by lxml before this, so only the walk and the
+        record building get cheaper.
+
+        Input:
+            sample: Sample element
+            fields: Set of the short tags wanted
+        Return:
+            Iterator of the Sample element and every wanted element below
+            it, in document order
+
+        """
+
+        tags = ['{%s}%s' % (MINIML_NAMESPACE, field) for field in fields]
+
+        # The Sample element itself always gives the sample ID
+        yield(sample)
+
+        for element in sample:
+            tag = self.shortTag(element.tag)
+            if(tag in fields):
+                yield(element)
+
+            if(not len(element)):
+                continue
+
+            container = SAMPLE_CONTAINERS.get(tag)
+            if(container is not None and fields.isdisjoint(container)):
+                continue
+
+            for descendant in element.iterdescendants(*tags):
+                yield(descendant)
+
+    def parseSample(self, root, fields=None):
+        """
+        Parse the metadata of a single sample
+
+        Input:
+            root: Root element of a GSM MINiML document
+            fields: Short tags to keep, e.g. Characteristics and Organism.
+                None keeps every tag
+        Return:
+            Dictionary mapping each tag of the sample to a list of its values
+
+        """
+
+        return(self.parseSampleElement(self.getSampleElement(root), fields))
+
+    def parseSampleElement(self, sample, fields=None):
+        """
+        Parse the metadata of a Sample element
+
+        Input:
+            sample: Sample element, from a GSM document or a family file
+            fields: Short tags to keep. None keeps every tag
+        Return:
+            Dictionary mapping each tag of the sample to a list of its values
+
+        """
+
+        person = {}
+
+        if(fields is None):
+            elements = sample.iter()
+        else:
+            elements = self.iterFields(sample, frozenset(fields))
+
+        # Traverse through all elements of the tree with sample information
+        # for parasing. Channels are handled in the same pass: the names of
+        # the characteristics of channel 2 onwards get a (chN) suffix, the
+        # way GEO names them _chN, so they do not overwrite those of
+        # channel 1. Their values are kept as they are
+        for child in elements:
+            # Save attribute, tag and text information
+            attrib = child.attrib
+            # Remove MINiML info from the tag
+            tag = self.shortTag(child.tag)
+            text = child.text
+
+            suffix = ''
+            if(tag == 'Characteristics'):
+                suffix = self.getChannelSuffix(child)
+
+            # If a tag doesn't exist for the person yet, create it
+            if(tag not in person):
+                person[tag] = []
+
+            # Attrib not guaranteed for each child so scheck if it exists
+            if(attrib):
+                # Text not guaranteed for each child so check if it exists
+                if(text):
+                    text = text.replace('\n', '').rstrip()
+                    # If after removing excess spaces, text still exists,
+                    # save tag, attrib and text as a dictionary
+                    if(text):
+                        # Set text to a float if it is numeric. Leave as
+                        # string otherwise
+                        text = toFloat(text)
+
+                        # Initialize dictIndex to -1
+                        dictIndex = -1
+                        # Flag to record if dicitonary exists
+                        dictionaryFlag = False
+
+                        # Go through all indices in person[tag] to find
+                        # if a dictionary exists
+                        for i in range(len(person[tag])):
+                            # If dictinary is found, set found flag to true
+                            # and set dictIndex to i
+                            if(type(person[tag][i]) is dict):
+                                dictionaryFlag = True
+                                dictIndex = i
+
+                        # If person[tag] does not exist yet, create
+                        # empty dictionary in the list
+                        if(not dictionaryFlag):
+                            dictIndex += len(person[tag]) + 1
+                            person[tag].append({})
+                            dictionaryFlag = True
+
+                        # Append to dictionary.
+                        person[tag][dictIndex][attrib.get(attrib.keys()\
+                            [len(attrib.keys())-1]) + suffix] = text
+
+                    # If text doesn't exist after replacing excess spaces,
+                    # save only tag and attrib
+                    else:
+                        # Get the value of the attribute dict
+                        attribValue = attrib.get(attrib.keys()[len(
+                            attrib.keys())-1])
+
+                        # Set attribValue to float if it is numeric
+                        attribValue = toFloat(attribValue)
+
+                        person[tag].append(attribValue)
+
+                # If text doesn't exist, just save the tag and attrib
+                else:
+                    # Get the value of the attribute dict
+                    attribValue = attrib.get(attrib.keys()[len(
+                        attrib.keys())-1])
+
+                    # Set attribValue to float if it is numeric
+                    attribValue = toFloat(attribValue)
+
+                    person[tag].append(attribValue)
+
+            # if no attrib and text, save the tag and attrib
+            elif(text):
+                person[tag].append(text.replace('\n','').rstrip())
+
+        return(person)
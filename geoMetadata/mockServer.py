@@ -0,0 +1,376 @@
+"""
+Local stand-in for the GEO and Entrez servers
+
+Serves MINiML documents and Entrez esummary responses from a fixture folder
+so the fetch code can be run, tested and load tested without any network.
+Latency, throttling (429 with Retry-After) and intermittent failures can be
+simulated to exercise the rate limiter and the retries.
+
+Fixture folder layout:
+    <accession>.xml: MINiML document served for acc=<accession>. A folder
+        written by --cache-dir or benchmarks/syntheticGEO.py works as is
+    GDS<id>.esummary.xml: esummary response served for id=<id>
+    GDS<id>.txt: Sample accessions of GDS<id>, one per line, and any GSE
+        accessions it was curated from. Used to build the esummary response
+        when there is no GDS<id>.esummary.xml
+
+Usage:
+    python -m geoMetadata.mockServer <fixtureDir> [--port 8000]
+        [--latency 0.05] [--throttle-rate 3] [--failure-rate 0.01]
+
+and point the fetch code at it with
+    --geo-url http://127.0.0.1:8000/geo/query/acc.cgi
+    --entrez-url http://127.0.0.1:8000/entrez/eutils/esummary.fcgi
+
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+
+from xml.sax.saxutils import escape
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+
+# Paths the stand-in answers on, matching the real servers
+GEO_PATH = '/geo/query/acc.cgi'
+ENTREZ_PATH = '/entrez/eutils/esummary.fcgi'
+STATS_PATH = '/stats'
+
+# Header of every generated esummary response
+ESUMMARY_HEADER = '<?xml version="1.0" encoding="UTF-8" ?>\n'\
+    '<!DOCTYPE eSummaryResult PUBLIC "-//NLM//DTD esummary v1 20041029//EN" '\
+    '"https://eutils.ncbi.nlm.nih.gov/eutils/dtd/20041029/esummary-v1.dtd">\n'
+
+class TokenBucket(object):
+    """
+    Allow a steady number of requests per second with short bursts
+
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.lastTime = time.time()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """
+        Take a token if one is available
+
+        Return:
+            True if the request is allowed
+
+        """
+
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst,
+                self.tokens + (now - self.lastTime) * self.rate)
+            self.lastTime = now
+
+            if(self.tokens >= 1):
+                self.tokens -= 1
+                return(True)
+
+        return(False)
+
+def makeESummary(gdsID, sampleIDs, seriesIDs=()):
+    """
+    Build an esummary response listing the samples of a GDS
+
+    Input:
+        gdsID: Numeric part of the GDS accession
+        sampleIDs: GSM accession numbers of the samples
+        seriesIDs: GSE accession numbers the GDS was curated from
+    Return:
+        The response as UTF-8 bytes
+
+    """
+
+    samples = ''.join('<Item Name="Sample" Type="Structure">'\
+        '<Item Name="Accession" Type="String">%s</Item></Item>\n' %
+        escape(sampleID) for sampleID in sampleIDs)
+
+    document = '%s<eSummaryResult>\n<DocSum>\n<Id>%s</Id>\n'\
+        '<Item Name="Accession" Type="String">GDS%s</Item>\n'\
+        '<Item Name="Samples" Type="List">\n%s</Item>\n'\
+        '<Item Name="GSE" Type="String">%s</Item>\n'\
+        '<Item Name="PDAT" Type="String">2011/03/01</Item>\n'\
+        '<Item Name="n_samples" Type="Integer">%d</Item>\n'\
+        '</DocSum>\n</eSummaryResult>\n' % (ESUMMARY_HEADER, escape(gdsID),
+        escape(gdsID), samples, escape(';'.join(seriesID[3:]
+        for seriesID in seriesIDs)), len(sampleIDs))
+
+    return(document.encode('utf-8'))
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answer one request from the fixture folder of the server
+
+    """
+
+    # Keep connections open between requests like the real servers
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if(self.server.verbose):
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def send(self, status, body, contentType='text/xml', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if(url.path == STATS_PATH):
+            self.send(200, json.dumps(server.getStats()).encode('utf-8'),
+                'application/json')
+            return
+
+        server.count('requests')
+
+        if(server.latency or server.jitter):
+            time.sleep(server.latency + server.random.random() * server.jitter)
+
+        if(server.bucket and not server.bucket.take()):
+            server.count('throttled')
+            self.send(429, b'Too Many Requests', 'text/plain',
+                {'Retry-After': '%g' % server.retryAfter})
+            return
+
+        if(server.failureRate and
+                server.random.random() < server.failureRate):
+            server.count('failed')
+            self.send(500, b'Internal Server Error', 'text/plain')
+            return
+
+        if(url.path == GEO_PATH):
+            body = server.getMINiML(query.get('acc', [''])[0])
+        elif(url.path == ENTREZ_PATH):
+            body = server.getESummary(query.get('id', [''])[0])
+        else:
+            body = None
+
+        if(body is None):
+            server.count('notFound')
+            self.send(404, b'Not Found', 'text/plain')
+            return
+
+        server.count('served')
+        self.send(200, body)
+
+class MockServer(ThreadingMixIn, HTTPServer):
+    """
+    Threaded HTTP server standing in for GEO and Entrez
+
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    # Accept hundreds of connections at once, as the async engine opens them.
+    # The default backlog of 5 makes clients wait on TCP retransmits
+    request_queue_size = 1024
+
+    def __init__(self, fixtureDir, host='127.0.0.1', port=0, latency=0,
+            jitter=0, throttleRate=None, burst=None, retryAfter=1,
+            failureRate=0, seed=None, verbose=False):
+        """
+        Input:
+            fixtureDir: Folder of fixtures, see the module documentation
+            host: Address to listen on
+            port: Port to listen on, 0 to pick a free one
+            latency: Seconds added to every response
+            jitter: Up to this many random seconds added on top of latency
+            throttleRate: Requests per second allowed before answering 429.
+                None for no throttling
+            burst: Requests allowed at once before throttling starts.
+                Defaults to throttleRate
+            retryAfter: Seconds sent in the Retry-After header of a 429
+            failureRate: Fraction of requests answered with a 500
+            seed: Seed for the simulated latency and failures
+            verbose: Log every request
+
+        """
+
+        HTTPServer.__init__(self, (host, port), MockRequestHandler)
+
+        self.fixtureDir = fixtureDir
+        self.latency = latency
+        self.jitter = jitter
+        self.retryAfter = retryAfter
+        self.failureRate = failureRate
+        self.random = random.Random(seed)
+        self.verbose = verbose
+
+        self.bucket = None
+        if(throttleRate):
+            self.bucket = TokenBucket(throttleRate, burst or throttleRate)
+
+        self.stats = {}
+        self.statsLock = threading.Lock()
+        self.thread = None
+
+    @property
+    def baseURL(self):
+        return('http://%s:%d' % self.server_address[:2])
+
+    @property
+    def geoURL(self):
+        return(self.baseURL + GEO_PATH)
+
+    @property
+    def entrezURL(self):
+        return(self.baseURL + ENTREZ_PATH)
+
+    def count(self, name):
+        with self.statsLock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def getStats(self):
+        """
+        Get the number of requests answered in each way
+
+        Return:
+            Dictionary with requests, served, throttled, failed and notFound
+
+        """
+
+        with self.statsLock:
+            return(dict(self.stats))
+
+    def readFixture(self, filename):
+        """
+        Read a fixture file
+
+        Input:
+            filename: Name of the file in the fixture folder
+        Return:
+            The file as bytes, or None if it does not exist
+
+        """
+
+        # Never serve anything outside the fixture folder
+        if(os.path.basename(filename) != filename or not filename.strip('.')):
+            return(None)
+
+        path = os.path.join(self.fixtureDir, filename)
+        if(not os.path.isfile(path)):
+            return(None)
+
+        with open(path, 'rb') as f:
+            return(f.read())
+
+    def getMINiML(self, accessionID):
+        return(self.readFixture('%s.xml' % accessionID))
+
+    def getESummary(self, gdsID):
+        body = self.readFixture('GDS%s.esummary.xml' % gdsID)
+        if(body is not None):
+            return(body)
+
+        accessionIDs = self.readFixture('GDS%s.txt' % gdsID)
+        if(accessionIDs is None):
+            return(None)
+
+        accessionIDs = accessionIDs.decode('utf-8').split()
+
+        return(makeESummary(gdsID, [accessionID for accessionID in
+            accessionIDs if not accessionID.startswith('GSE')],
+            [accessionID for accessionID in accessionIDs
+            if accessionID.startswith('GSE')]))
+
+    def start(self):
+        """
+        Serve requests on a daemon thread
+
+        Return:
+            The server, so it can be started where it is created
+
+        """
+
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        return(self)
+
+    def stop(self):
+        """
+        Stop serving and close the socket
+
+        """
+
+        self.shutdown()
+        self.server_close()
+        if(self.thread):
+            self.thread.join()
+
+    def __enter__(self):
+        return(self.start())
+
+    def __exit__(self, *exception):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve GEO and Entrez '\
+        'responses from a fixture folder')
+    parser.add_argument('fixtureDir', help='Folder of fixtures')
+    parser.add_argument('--host', default='127.0.0.1',
+        help='Address to listen on (default: %(default)s)')
+    parser.add_argument('-p', '--port', type=int, default=8000,
+        help='Port to listen on (default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0,
+        help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0,
+        help='Up to this many random seconds added on top of --latency')
+    parser.add_argument('--throttle-rate', dest='throttleRate', type=float,
+        help='Requests per second allowed before answering 429')
+    parser.add_argument('--burst', type=float, help='Requests allowed at '\
+        'once before throttling starts (default: --throttle-rate)')
+    parser.add_argument('--retry-after', dest='retryAfter', type=float,
+        default=1, help='Seconds sent in Retry-After (default: %(default)s)')
+    parser.add_argument('--failure-rate', dest='failureRate', type=float,
+        default=0, help='Fraction of requests answered with a 500')
+    parser.add_argument('--seed', type=int, help='Seed for the simulated '\
+        'latency and failures')
+    parser.add_argument('-v', '--verbose', action='store_true',
+        help='Log every request')
+    args = parser.parse_args()
+
+    server = MockServer(args.fixtureDir, args.host, args.port, args.latency,
+        args.jitter, args.throttleRate, args.burst, args.retryAfter,
+        args.failureRate, args.seed, args.verbose)
+
+    print('Serving %s' % args.fixtureDir)
+    print('  --geo-url %s' % server.geoURL)
+    print('  --entrez-url %s' % server.entrezURL)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Optional normalization of characteristic values
+
+Characteristic values are free text, so the same sex is written 'Male',
+'male' and 'M' and the same age '45 yrs' and 45. With normalization turned
+on, each value is mapped through the vocabulary table of its characteristic
+(chosen by the characteristic's name, without any (chN) suffix), or put
+through the function registered for it, before the files are written.
+Values with neither only have their whitespace tidied.
+
+Each distinct (characteristic, value) pair is normalized once per run and
+remembered, and the Value column of the long table is mapped from its
+distinct values with pandas, so the work grows with the number of distinct
+values rather than the number of cells.
+
+Extra tables are read from JSON files mapping characteristic names to
+tables of value -> normalized value, e.g.
+    {"tissue": {"liver tissue": "liver", "hepatic": "liver"}}
+Values are looked up without regard to case.
+
+"""
+
+import json
+import re
+
+from geoMetadata.compat import stringTypes
+from geoMetadata.miniml import toFloat
+
+# Suffix given to the characteristics of channel 2 onwards
+CHANNEL_SUFFIX = re.compile(r' \(ch\d+\)$')
+
+# Built in table for the sex of a sample
+SEX_TABLE = {'m': 'male', 'male': 'male', 'man': 'male', 'boy': 'male',
+    'f': 'female', 'female': 'female', 'woman': 'female', 'girl': 'female'}
+SEX_NAMES = ('sex', 'gender', 'sex/gender', 'donor sex', 'patient sex')
+
+# Ages given in years, e.g. '45', '45 yrs', '45 years old' or '45y'
+AGE_YEARS = re.compile(r'^([0-9]+(?:\.[0-9]+)?)\s*'\
+    r'(?:y|yo|yr|yrs|year|years)?(?:\s+old)?$', re.IGNORECASE)
+AGE_NAMES = ('age', 'age (years)', 'age (yrs)', 'age in years', 'age_years',
+    'age (y)', 'donor age', 'patient age')
+
+#############################Normalize Settings###############################
+# Changed through configure, usually from the command line
+
+# Normalize characteristic values before they are written
+enabled = False
+
+# JSON files holding extra vocabulary tables, added after the built in ones
+vocabularies = ()
+##############################################################################
+
+# Names of the settings configure accepts
+SETTINGS = ('enabled', 'vocabularies')
+
+# Normalizer of the run. None when normalization is off
+normalizer = None
+
+def normalizeAge(value):
+    """
+    Turn an age given in years into a number
+
+    Input:
+        value: Age as text or a number
+    Return:
+        The age in years as a float, or the value unchanged if it is not an
+        age in years
+
+    """
+
+    if(not isinstance(value, stringTypes)):
+        return(value)
+
+    match = AGE_YEARS.match(value)
+    if(match is None):
+        return(value)
+
+    return(float(match.group(1)))
+
+class Normalizer(object):
+    """
+    Vocabulary tables and functions for characteristic values, with every
+    distinct value normalized once
+
+    """
+
+    def __init__(self):
+        # Characteristic name -> table of lowercase value -> normalized value
+        self.tables = {}
+
+        # Characteristic name -> function normalizing one value
+        self.functions = {}
+
+        # (characteristic, value) -> normalized value, for every pair seen
+        self.memo = {}
+
+    def addTable(self, characteristics, table):
+        """
+        Map the values of some characteristics through a vocabulary table
+
+        Input:
+            characteristics: Names of the characteristics, in any case
+            table: Dictionary of value -> normalized value. Values are
+                matched in any case, and numeric ones, e.g. '1', also match
+                the values the parser read as numbers
+
+        """
+
+        lookup = {}
+        for key, value in table.items():
+            lookup[key.lower()] = value
+
+            number = toFloat(key)
+            if(isinstance(number, float)):
+                lookup[number] = value
+        table = lookup
+
+        for characteristic in characteristics:
+            self.tables.setdefault(characteristic.lower(), {}).update(table)
+
+        # Values normalized before no longer hold
+        self.memo.clear()
+
+    def addFunction(self, characteristics, function):
+        """
+        Put the values of some characteristics through a function
+
+        Input:
+            characteristics: Names of the characteristics, in any case
+            function: Function taking a value, text or number, and returning
+                its normalized value. Only called for values not found in
+                the characteristic's table
+
+        """
+
+        for characteristic in characteristics:
+            self.functions[characteristic.lower()] = function
+
+        self.memo.clear()
+
+    def normalize(self, name, value):
+        """
+        Normalize one value, without the memo
+
+        """
+
+        table = self.tables.get(name, {})
+
+        if(isinstance(value, stringTypes)):
+            # Collapse runs of whitespace, which free text is full of
+            value = ' '.join(value.split())
+
+            if(value.lower() in table):
+                return(table[value.lower()])
+        elif(value in table):
+            return(table[value])
+
+        function = self.functions.get(name)
+        if(function is not None):
+            return(function(value))
+
+        # Numbers written as text are written as numbers, like every value
+        # the parser reads
+        if(isinstance(value, stringTypes)):
+            return(toFloat(value))
+
+        return(value)
+
+    def normalizeValue(self, characteristic, value):
+        """
+        Normalize the value of one characteristic
+
+        Input:
+            characteristic: Name of the characteristic, with any (chN)
+                suffix
+            value: The value as parsed, text or a float
+        Return:
+            The normalized value
+
+        """
+
+        key = (characteristic, value)
+        try:
+            return(self.memo[key])
+        except KeyError:
+            pass
+
+        normalized = self.normalize(getName(characteristic), value)
+        self.memo[key] = normalized
+
+        return(normalized)
+
+    def normalizeFrame(self, df, characteristicColumn='Characteristics',
+            valueColumn='Value'):
+        """
+        Normalize the values of a long table in place
+
+        The rows of each characteristic are handled together: their values
+        are reduced to the distinct ones, each distinct value is normalized
+        once and the column is rebuilt from them.
+
+        Input:
+            df: Dataframe with one row per characteristic, as built by
+                writeLong
+            characteristicColumn: Column holding the characteristic names
+            valueColumn: Column holding the values
+
+        """
+
+        import numpy as np
+        import pandas as pd
+
+        if(not len(df) or characteristicColumn not in df.columns):
+            return
+
+        values = df[valueColumn].values.astype(object)
+        normalized = values.copy()
+
+        for characteristic, rows in df.groupby(characteristicColumn,
+                sort=False).indices.items():
+            # codes of -1 are missing values, which stay missing
+            codes, uniques = pd.factorize(values[rows])
+            mapped = np.empty(len(uniques) + 1, dtype=object)
+            mapped[:-1] = [self.normalizeValue(characteristic, value)
+                for value in uniques]
+            mapped[-1] = np.nan
+
+            normalized[rows] = mapped[codes]
+
+        df[valueColumn] = normalized
+
+def getName(characteristic):
+    """
+    Get the name a characteristic's table and function are found by
+
+    Input:
+        characteristic: Name of the characteristic, with any (chN) suffix
+    Return:
+        The name in lowercase, without the suffix
+
+    """
+
+    return(CHANNEL_SUFFIX.sub('', characteristic).strip().lower())
+
+def readVocabulary(filename):
+    """
+    Read a JSON file of vocabulary tables
+
+    Input:
+        filename: Name of a JSON file mapping characteristic names to
+            tables of value -> normalized value
+    Return:
+        Dictionary of characteristic name -> table
+
+    """
+
+    with open(filename, 'r') as f:
+        tables = json.load(f)
+
+    if(not isinstance(tables, dict) or not all(isinstance(table, dict)
+            for table in tables.values())):
+        raise ValueError('%s must hold an object of characteristic name '\
+            '-> {value: normalized value}' % filename)
+
+    return(tables)
+
+def getNormalizer(filenames=()):
+    """
+    Build a normalizer with the built in tables and functions
+
+    Input:
+        filenames: JSON files of extra vocabulary tables, see readVocabulary.
+            Their values are added to, and take the place of, the built in
+            ones
+    Return:
+        The Normalizer
+
+    """
+
+    normalizer = Normalizer()
+    normalizer.addTable(SEX_NAMES, SEX_TABLE)
+    normalizer.addFunction(AGE_NAMES, normalizeAge)
+
+    for filename in filenames:
+        for characteristic, table in readVocabulary(filename).items():
+            normalizer.addTable([characteristic], table)
+
+    return(normalizer)
+
+def configure(**settings):
+    """
+    Change the normalize settings
+
+    A new normalizer, with an empty memo, is built for the new settings.
+
+    Input:
+        settings: New values for any of enabled or vocabularies
+
+    """
+
+    global normalizer
+
+    for name, value in settings.items():
+        if(name not in SETTINGS):
+            raise TypeError('Unknown normalize setting: %s' % name)
+        globals()[name] = value
+
+    normalizer = getNormalizer(vocabularies or ()) if enabled else None
@@ -0,0 +1,781 @@
+"""
+Fetch, parse and write the metadata for whole accessions
+
+"""
+
+import csv
+import hashlib
+import json
+import os
+import sys
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+
+from geoMetadata import fetch
+from geoMetadata.fetch import SampleRegistry, getSampleMetadata, getSamples
+from geoMetadata.metrics import metrics
+from geoMetadata.profiling import profiled
+from geoMetadata.writers import appendStream, getLongFilename, \
+    startStream, writeLong, writeWide
+
+# Dead letter list of a run, written to its output folder
+FAILED_FILENAME = 'failed.jsonl'
+
+# Last update on GEO of every accession written to an output folder
+UPDATES_FILENAME = 'lastUpdates.jsonl'
+
+# Most sample records kept for later accessions when a batch run streams.
+# Only neighbouring accessions, e.g. a SuperSeries and its SubSeries, then
+# share records, and samples shared with ones further apart are fetched
+# again, from --cache-dir when it is set
+STREAM_REGISTRY_SIZE = 2000
+
+class FailureLog(object):
+    """
+    Dead letter list of the accessions and samples that failed in a run
+
+    Each failure is appended to FAILED_FILENAME in the output folder as it
+    happens, one JSON object per line, so the list is kept even if the run
+    is stopped. batch --retry-failed reads it back.
+
+    """
+
+    def __init__(self, directory=None):
+        """
+        Input:
+            directory: Output folder of the run. The list it holds from an
+                earlier run is replaced. None only keeps the list in memory
+
+        """
+
+        self.directory = directory
+        self.filename = None
+        if(directory is not None):
+            self.filename = os.path.join(directory, FAILED_FILENAME)
+            if(os.path.exists(self.filename)):
+                os.remove(self.filename)
+
+        # Dictionaries of accession, sample (None when the whole accession
+        # failed) and error, in the order they failed
+        self.failures = []
+
+    def __len__(self):
+        return(len(self.failures))
+
+    def add(self, accessionID, error, sampleID=None):
+        """
+        Record one failure
+
+        Input:
+            accessionID: GEO accession number that failed, or that the
+                sample belongs to
+            error: The exception raised
+            sampleID: GSM accession number of the sample that failed. None
+                when the whole accession failed
+
+        """
+
+        failure = OrderedDict([('accession', accessionID),
+            ('sample', sampleID),
+            ('error', '%s: %s' % (error.__class__.__name__, error))])
+        self.failures.append(failure)
+
+        if(sampleID is None):
+            metrics.count('accessionsFailed')
+            print('Skipping %s, it failed with %s' % (accessionID,
+                failure['error']))
+        else:
+            print('Skipping sample %s of %s, it failed with %s' % (sampleID,
+                accessionID, failure['error']))
+
+        if(self.filename is not None):
+            # Create the directory if it does not exist yet
+            if(self.directory and not os.path.exists(self.directory)):
+                os.makedirs(self.directory)
+
+            with open(self.filename, 'a') as f:
+                f.write(json.dumps(failure) + '\n')
+
+    def getAccessionIDs(self):
+        """
+        Get the accessions with at least one failure, each once
+
+        """
+
+        return(list(OrderedDict.fromkeys(failure['accession']
+            for failure in self.failures)))
+
+class UpdateLog(object):
+    """
+    Last update date on GEO of every accession written to an output folder
+
+    Each accession written is appended to UPDATES_FILENAME in the folder,
+    one JSON object per line, and the last line of an accession wins. A
+    later run compares these with GEO to skip the accessions that were not
+    updated since.
+
+    """
+
+    def __init__(self, directory):
+        """
+        Input:
+            directory: Output folder of the run. The dates written to it by
+                earlier runs are read
+
+        """
+
+        self.directory = directory
+        self.filename = os.path.join(directory, UPDATES_FILENAME)
+
+        # Accession -> (update date, number of samples) as last written
+        self.written = {}
+
+        # Accession -> (update date, number of samples) as found on GEO by
+        # this run
+        self.found = {}
+
+        if(os.path.exists(self.filename)):
+            with open(self.filename, 'r') as f:
+                for line in f:
+                    if(line.strip()):
+                        update = json.loads(line)
+                        self.written[update['accession']] = (
+                            update['lastUpdate'], update['samples'])
+
+    def check(self, accessionID, lastUpdate, samples, filename):
+        """
+        Check whether an accession is unchanged since it was written
+
+        Input:
+            accessionID: GEO accession number
+            lastUpdate: Date it was last updated on GEO, as returned by
+                fetch.getLastUpdate. '' if it is not known
+            samples: List of its samples on GEO
+            filename: Name of the file it is written to
+        Return:
+            True if it was written with the same update date and number of
+            samples and its file is still there
+
+        """
+
+        self.found[accessionID] = (lastUpdate, len(samples))
+
+        # Accessions without samples have no file
+        return(bool(lastUpdate) and self.written.get(accessionID) ==
+            self.found[accessionID] and (not samples or
+            os.path.exists(filename)))
+
+    def wasUpdated(self, accessionID):
+        """
+        Check whether an accession written before was updated on GEO since,
+        as found by check
+
+        Its samples may have been updated too, so their cached documents
+        should not be used. Accessions new to the folder, or only written
+        again because their file is gone, were not.
+
+        """
+
+        written = self.written.get(accessionID)
+
+        return(written is not None and written != self.found.get(accessionID))
+
+    def add(self, accessionID):
+        """
+        Record that an accession was written, with the update date found by
+        check
+
+        """
+
+        if(accessionID not in self.found):
+            return
+
+        self.written[accessionID] = self.found[accessionID]
+        lastUpdate, count = self.found[accessionID]
+
+        # Create the directory if it does not exist yet
+        if(self.directory and not os.path.exists(self.directory)):
+            os.makedirs(self.directory)
+
+        with open(self.filename, 'a') as f:
+            f.write(json.dumps(OrderedDict([('accession', accessionID),
+                ('lastUpdate', lastUpdate), ('samples', count)])) + '\n')
+
+def getFailedAccessionIDs(directory):
+    """
+    Read the accessions that failed in an earlier run from its dead letter
+    list
+
+    Input:
+        directory: Output folder of the earlier run
+    Return:
+        List of the accessions with at least one failure, each once. Empty
+        if nothing failed
+
+    """
+
+    filename = os.path.join(directory, FAILED_FILENAME)
+    if(not os.path.exists(filename)):
+        return([])
+
+    accessionIDs = OrderedDict()
+    with open(filename, 'r') as f:
+        for line in f:
+            if(line.strip()):
+                accessionIDs[json.loads(line)['accession']] = True
+
+    return(list(accessionIDs))
+
+@contextmanager
+def isolateFailure(failures, accessionID):
+    """
+    Record an exception of one accession in the dead letter list instead of
+    raising it, so the rest of the run goes on
+
+    Input:
+        failures: FailureLog of the run. None raises exceptions as usual
+        accessionID: GEO accession number being processed
+
+    """
+
+    if(failures is None):
+        yield
+        return
+
+    try:
+        yield
+    except Exception as error:
+        failures.add(accessionID, error)
+
+def tryCall(function, item):
+    """
+    Call a function on one item, handing back the error if it fails
+
+    Input:
+        function: Function taking one item
+        item: The item, e.g. an accession number
+    Return:
+        The result of the function, or the exception it raised
+
+    """
+
+    try:
+        return(function(item))
+    except Exception as error:
+        return(error)
+
+def getChanged(accessionIDs, updates, directory, fileFormat='csv',
+        failures=None):
+    """
+    Leave out the accessions that were not updated on GEO since they were
+    written to the folder
+
+    Only the series documents (or the esummary of a GDS) are requested, with
+    up to workers threads. The samples found are remembered, so they are not
+    requested again when the changed accessions are fetched.
+
+    Input:
+        accessionIDs: List of GEO accession numbers
+        updates: UpdateLog of the output folder
+        directory: Name of the folder the accessions are written to
+        fileFormat: Output format, either csv or tsv
+        failures: FailureLog accessions that can not be looked up are added
+            to. None raises the first failure
+    Return:
+        The accessions that are new or were updated, in their original
+        order
+
+    """
+
+    if(failures is None):
+        lookups = fetch.mapWorkers(fetch.getLastUpdate, accessionIDs)
+    else:
+        lookups = fetch.mapWorkers(partial(tryCall, fetch.getLastUpdate),
+            accessionIDs)
+
+    changed = []
+    for accessionID, lookup in zip(accessionIDs, lookups):
+        if(isinstance(lookup, Exception)):
+            failures.add(accessionID, lookup)
+            continue
+
+        lastUpdate, samples = lookup
+        if(updates.check(accessionID, lastUpdate, samples,
+                getLongFilename(accessionID, directory, fileFormat))):
+            metrics.count('accessionsUnchanged')
+            continue
+
+        changed.append(accessionID)
+
+    print('%d of %d accessions are new or were updated since they were '\
+        'written' % (len(changed), len(accessionIDs)))
+
+    return(changed)
+
+def getAccessionIDsFromFile(filename):
+    """
+    Open and read the accession IDs from the input file
+
+    Input:
+        filename: The name of the input file with the accession IDs, or -
+            to read them from standard input
+    Return:
+        List containing all of the accession IDs
+
+    """
+
+    if(filename == '-'):
+        return(readAccessionIDs(sys.stdin))
+
+    with open(filename, 'r') as f:
+        return(readAccessionIDs(f))
+
+def readAccessionIDs(f):
+    """
+    Read the accession IDs from an open file
+
+    Input:
+        f: Open file with one accession ID per line
+    Return:
+        List containing all of the accession IDs
+
+    """
+
+    # Create empty array to hold full csv file
+    accessionIDs = []
+
+    # loop through file using csv.reader and store in wholeFile
+    reader = csv.reader(f)
+    for row in reader:
+        # Row is a single element list as only accession IDs are
+        # in the file so use 0 index of row for just the name
+        if(row and row[0].strip()):
+            accessionIDs.append(row[0].strip())
+
+    return accessionIDs
+
+def getShardIndex(accessionID, count):
+    """
+    Get the shard an accession belongs to
+
+    The shard only depends on the accession number, so every node given the
+    same list, in any order, agrees on it.
+
+    Input:
+        accessionID: GEO accession number
+        count: Number of shards
+    Return:
+        Shard number from 1 to count
+
+    """
+
+    digest = hashlib.md5(accessionID.encode('utf-8')).hexdigest()
+
+    return(int(digest, 16) % count + 1)
+
+def getShard(accessionIDs, index, count):
+    """
+    Get the accessions of one shard
+
+    Input:
+        accessionIDs: List of GEO accession numbers
+        index: Shard number from 1 to count
+        count: Number of shards
+    Return:
+        The accessions of the shard, in their original order
+
+    """
+
+    return([accessionID for accessionID in accessionIDs
+        if getShardIndex(accessionID, count) == index])
+
+def getAccessionMetadata(accessionID, registry=None, failures=None,
+        refresh=False):
+    """
+    Get the metadata for every sample of an accession
+
+    Input:
+        accessionID: GEO accession number of a dataset or series
+        registry: SampleRegistry shared by the accessions of a run, so
+            samples they have in common are only fetched once
+        failures: FailureLog samples that fail are added to, leaving them
+            out of the metadata. None raises the first failure
+        refresh: Download the sample documents even when they are cached,
+            e.g. for an accession updated on GEO
+    Return:
+        List with a dictionary containing the metadata for each sample
+
+    """
+
+    samples = getSamples(accessionID)
+
+    # Only fetch metadata if samples existed for the dataset
+    if(not samples):
+        return([])
+
+    if(failures is None):
+        return(getSampleMetadata(samples, registry, refresh=refresh))
+
+    sampleFailures = {}
+    metadata = getSampleMetadata(samples, registry, sampleFailures, refresh)
+    addSampleFailures(failures, accessionID, samples, sampleFailures)
+
+    return(metadata)
+
+def addSampleFailures(failures, accessionID, samples, sampleFailures):
+    """
+    Add the samples of an accession that failed to the dead letter list
+
+    Input:
+        failures: FailureLog of the run
+        accessionID: GEO accession number the samples belong to
+        samples: Sample IDs of the accession, in order
+        sampleFailures: Dictionary of sample ID -> exception of the samples
+            that failed
+
+    """
+
+    for sample in samples:
+        if(sample in sampleFailures):
+            failures.add(accessionID, sampleFailures[sample], sample)
+
+def runSingle(accessionID, directory='.', fileFormat='csv'):
+    """
+    Download the metadata for one accession and write it in long format
+
+    Input:
+        accessionID: GEO accession number of a dataset or series
+        directory: Name of the folder to output data to
+        fileFormat: Output format, either csv or tsv
+    Return:
+        Dataframe holding the written rows, or None if there was no metadata
+
+    """
+
+    print('Getting the metadata for all samples of %s' % accessionID)
+    metadata = getAccessionMetadata(accessionID)
+
+    # Only write to the file if metadata existed for the dataset
+    if(metadata):
+        print('Writing the data to a file')
+        with profiled():
+            return(writeLong(metadata, accessionID, directory, fileFormat))
+
+    return(None)
+
+def runBySample(accessionID, directory='.'):
+    """
+    Download the metadata for one accession and write it in wide format
+
+    Input:
+        accessionID: GEO accession number of a dataset or series
+        directory: Name of the folder to output data to
+
+    """
+
+    print('Getting the metadata for all samples of %s' % accessionID)
+    metadata = getAccessionMetadata(accessionID)
+
+    if(metadata):
+        print('Writing the data to a file')
+        with profiled():
+            writeWide(metadata, accessionID, directory)
+
+def runBatch(accessionIDs, directory, fileFormat='csv', stream=False,
+        schema=None, failures=None, updates=None):
+    """
+    Download the metadata for many accessions and write each in long format
+
+    Input:
+        accessionIDs: List of GEO accession numbers
+        directory: Name of the folder to output data to
+        fileFormat: Output format, either csv or tsv
+        stream: Append each accession's rows to the merged file of the
+            folder as soon as they are written instead of returning them,
+            so memory does not grow with the number of accessions
+        schema: SchemaRegistry the columns of every accession are added to,
+            for writing the merged output in one pass
+        failures: FailureLog accessions and samples that fail are added to
+            while the run goes on. None stops at the first failure
+        updates: UpdateLog of the folder. Accessions not updated on GEO
+            since they were written to it are skipped, and the update date
+            of every accession written is added to it
+    Return:
+        List of dataframes with the rows written for each accession. Empty
+        when streaming
+
+    """
+
+    dataFrameList = []
+
+    # Samples shared by several accessions are fetched and parsed once.
+    # Streaming runs keep memory flat, so only the most recent records are
+    # held on to
+    registry = SampleRegistry(STREAM_REGISTRY_SIZE if stream else None)
+
+    if(stream):
+        startStream(directory)
+
+    if(updates is not None):
+        accessionIDs = getChanged(accessionIDs, updates, directory,
+            fileFormat, failures)
+
+    # Loop through all accession IDs
+    for accessionID in accessionIDs:
+        print('Currently processing %s' % accessionID)
+
+        with isolateFailure(failures, accessionID):
+            failed = len(failures or ())
+            # Accessions updated on GEO may have updated samples, so their
+            # cached documents are not used
+            metadata = getAccessionMetadata(accessionID, registry, failures,
+                updates is not None and updates.wasUpdated(accessionID))
+
+            saveAccession(metadata, accessionID, directory, fileFormat,
+                stream, schema, dataFrameList)
+
+            # Accessions with failed samples are fetched again next time
+            if(updates is not None and len(failures or ()) == failed):
+                updates.add(accessionID)
+
+    return(dataFrameList)
+
+def saveAccession(metadata, accessionID, directory, fileFormat, stream,
+        schema, dataFrameList):
+    """
+    Write the metadata of one accession of a many accession run
+
+    Input:
+        metadata: List with a dictionary containing the metadata for each
+            sample. Nothing is written when it is empty
+        accessionID: GEO accession number of the metadata
+        directory: Name of the folder to output data to
+        fileFormat: Output format, either csv or tsv
+        stream: Append the rows to the merged file of the folder instead of
+            adding the dataframe to dataFrameList
+        schema: SchemaRegistry the columns are added to, or None
+        dataFrameList: List of the dataframes written so far
+
+    """
+
+    # Only write to the file if metadata existed for the dataset
+    if(not metadata):
+        return
+
+    # Write to csv file
+    with profiled():
+        df = writeLong(metadata, accessionID, directory, fileFormat)
+
+        if(schema is not None):
+            schema.addFrame(df)
+
+        if(stream):
+            appendStream(df, directory)
+        else:
+            dataFrameList.append(df)
+
+def getSchedule(accessionIDs, failures=None):
+    """
+    Find the samples of every accession and order them largest first
+
+    The sample lists are looked up with up to workers threads, as each is
+    a single request.
+
+    Input:
+        accessionIDs: List of GEO accession numbers
+        failures: FailureLog accessions whose samples can not be found are
+            added to, leaving them out of the schedule. None raises the
+            first failure
+    Return:
+        List of (accession number, list of sample IDs) tuples, the
+        accessions with the most samples first and accessions of the same
+        size in their original order
+
+    """
+
+    # Accessions listed twice are only scheduled once
+    accessionIDs = list(OrderedDict.fromkeys(accessionIDs))
+
+    if(failures is None):
+        schedule = list(zip(accessionIDs,
+            fetch.mapWorkers(getSamples, accessionIDs)))
+    else:
+        schedule = []
+        for accessionID, samples in zip(accessionIDs,
+                fetch.mapWorkers(partial(tryCall, getSamples),
+                accessionIDs)):
+            if(isinstance(samples, Exception)):
+                failures.add(accessionID, samples)
+            else:
+                schedule.append((accessionID, samples))
+
+    schedule.sort(key=lambda job: len(job[1]), reverse=True)
+
+    return(schedule)
+
+def runScheduled(accessionIDs, directory, fileFormat='csv', stream=False,
+        schema=None, failures=None, updates=None):
+    """
+    Download and write many accessions, the largest first
+
+    Accessions differ in size by orders of magnitude, and fetching them one
+    after another leaves workers idle at the end of each one. Here the
+    samples of every accession are found first. Then the samples of all
+    accessions, largest accession first, are fetched as one list, a window
+    of batchSize samples per worker at a time. Huge series are spread over
+    every worker and small ones share windows. Each accession is written
+    as soon as all of its samples are in, so they are written largest
+    first.
+
+    Input:
+        accessionIDs: List of GEO accession numbers
+        directory: Name of the folder to output data to
+        fileFormat: Output format, either csv or tsv
+        stream: Append each accession's rows to the merged file of the
+            folder as soon as they are written instead of returning them
+        schema: SchemaRegistry the columns of every accession are added to
+        failures: FailureLog accessions and samples that fail are added to
+            while the run goes on. None stops at the first failure
+        updates: UpdateLog of the folder. Accessions not updated on GEO
+            since they were written to it are skipped, and the update date
+            of every accession written is added to it
+    Return:
+        List of dataframes with the rows written for each accession, in the
+        order they were written. Empty when streaming
+
+    """
+
+    dataFrameList = []
+
+    # Records of the samples fetched but not yet written for every
+    # accession they belong to
+    registry = SampleRegistry()
+
+    if(stream):
+        startStream(directory)
+
+    if(updates is not None):
+        accessionIDs = getChanged(accessionIDs, updates, directory,
+            fileFormat, failures)
+
+    print('Finding the samples of %d accessions' % len(accessionIDs))
+    schedule = getSchedule(accessionIDs, failures)
+
+    # Every sample once, in the order of the schedule
+    samples = registry.getMissing([sample for accessionID, accessionSamples
+        in schedule for sample in accessionSamples])
+    print('Scheduled %d samples, the largest accession has %d' % (
+        len(samples), len(schedule[0][1]) if schedule else 0))
+
+    # Sample ID -> accessions still to be written that hold the sample. A
+    # record is dropped from the registry once the last of them is written
+    pending = {}
+    for accessionID, accessionSamples in schedule:
+        for sample in set(accessionSamples):
+            pending[sample] = pending.get(sample, 0) + 1
+
+    # Accessions updated on GEO may have updated samples, so the cached
+    # documents of their samples are not used
+    refreshed = set()
+    if(updates is not None):
+        refreshed = set(sample for accessionID, accessionSamples in schedule
+            if updates.wasUpdated(accessionID)
+            for sample in accessionSamples)
+
+    window = fetch.batchSize * max(1, fetch.workers)
+    position = 0
+
+    # Sample ID -> exception of the samples that failed, which are done too
+    sampleFailures = {}
+
+    # At least one pass, so accessions without samples are still reported
+    for start in range(0, max(len(samples), 1), window):
+        windowSamples = samples[start:start + window]
+        for refresh in (False, True):
+            chosen = [sample for sample in windowSamples
+                if (sample in refreshed) == refresh]
+            if(chosen):
+                getSampleMetadata(chosen, registry, sampleFailures
+                    if failures is not None else None, refresh)
+
+        # Write every accession whose samples are all in. The schedule is
+        # in fetch order, so these are always at its front
+        while(position < len(schedule)):
+            accessionID, accessionSamples = schedule[position]
+            if(not all(sample in registry or sample in sampleFailures
+                    for sample in accessionSamples)):
+                break
+
+            print('Currently processing %s' % accessionID)
+            failed = len(failures or ())
+            if(sampleFailures):
+                addSampleFailures(failures, accessionID, accessionSamples,
+                    sampleFailures)
+
+            with isolateFailure(failures, accessionID):
+                saveAccession([registry.get(sample) for sample in
+                    accessionSamples if sample in registry], accessionID,
+                    directory, fileFormat, stream, schema, dataFrameList)
+
+                # Accessions with failed samples are fetched again next time
+                if(updates is not None and len(failures or ()) == failed):
+                    updates.add(accessionID)
+
+            for sample in set(accessionSamples):
+                pending[sample] -= 1
+                if(not pending[sample]):
+                    registry.remove(sample)
+            position += 1
+
+    return(dataFrameList)
+
+def runArchives(filenames, directory, fileFormat='csv', stream=False,
+        schema=None, workers=1, failures=None):
+    """
+    Read the metadata from local family archives and write each in long
+    format
+
+    Input:
+        filenames: Names of GEO MINiML family archives
+        directory: Name of the folder to output data to
+        fileFormat: Output format, either csv or tsv
+        stream: Append each accession's rows to the merged file of the
+            folder as soon as they are written instead of returning them
+        schema: SchemaRegistry the columns of every accession are added to
+        workers: Processes reading archives at the same time
+        failures: FailureLog archives that fail are added to while the run
+            goes on. None stops at the first failure
+    Return:
+        List of dataframes with the rows written for each accession. Empty
+        when streaming
+
+    """
+
+    # Only needed for runs that read archives
+    from geoMetadata.archive import iterArchives
+
+    dataFrameList = []
+
+    if(stream):
+        startStream(directory)
+
+    for accessionID, metadata, seconds in iterArchives(filenames, workers,
+            failures is not None):
+        # The archives are parsed in other processes, so their work is
+        # recorded here
+        metrics.record('archive', seconds)
+
+        if(isinstance(metadata, Exception)):
+            failures.add(accessionID, metadata)
+            continue
+
+        print('Read %d samples of %s' % (len(metadata), accessionID))
+        metrics.count('samplesParsed', len(metadata))
+
+        with isolateFailure(failures, accessionID):
+            saveAccession(metadata, accessionID, directory, fileFormat,
+                stream, schema, dataFrameList)
+
+    return(dataFrameList)
@@ -0,0 +1,250 @@
+"""
+Optional cProfile hooks around the parse and write stages
+
+The hot sections (lxml parsing, building each sample's record and writing
+each accession's file) run inside profiled(). That does nothing until start
+is called, so normal runs pay no profiling cost. Once started, each thread
+gets its own cProfile.Profile and they are merged when the run finishes.
+
+"""
+
+import cProfile
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from contextlib import contextmanager
+
+from geoMetadata.compat import PY2
+
+# Profiler of the current run. Set by start and cleared by finish
+profiler = None
+
+class Profiler(object):
+    """
+    Collect cProfile data from every thread that enters a profiled section
+
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.profiles = []
+        self.lock = threading.Lock()
+
+    def getProfile(self):
+        """
+        Get the profile of the current thread, creating it on first use
+
+        Return:
+            The cProfile.Profile of the current thread
+
+        """
+
+        profile = getattr(self.local, 'profile', None)
+        if(profile is None):
+            profile = cProfile.Profile()
+            self.local.profile = profile
+            self.local.depth = 0
+            with self.lock:
+                self.profiles.append(profile)
+
+        return(profile)
+
+    @contextmanager
+    def section(self):
+        """
+        Profile the body of a with statement
+
+        Nested sections are only enabled once, by the outermost one.
+
+        """
+
+        profile = self.getProfile()
+        self.local.depth += 1
+        if(self.local.depth == 1):
+            profile.enable()
+
+        try:
+            yield
+        finally:
+            self.local.depth -= 1
+            if(self.local.depth == 0):
+                profile.disable()
+
+    def getStats(self, stream=None):
+        """
+        Merge the profiles of every thread
+
+        Input:
+            stream: Where pstats prints to
+        Return:
+            pstats.Stats of the merged profiles, or None if nothing ran
+
+        """
+
+        with self.lock:
+            profiles = list(self.profiles)
+
+        # Profiles that were never enabled have no stats to load
+        profiles = [profile for profile in profiles if profile.getstats()]
+        if(not profiles):
+            return(None)
+
+        stats = pstats.Stats(profiles[0], stream=stream)
+        for profile in profiles[1:]:
+            stats.add(profile)
+
+        return(stats)
+
+    def write(self, directory, name, top=25):
+        """
+        Write the profile dump and a summary of the hottest functions
+
+        Input:
+            directory: Folder to write the files to
+            name: Name of the run, used for the file names
+            top: Number of functions listed in the summary
+        Return:
+            Tuple of the dump and summary file names, or None if nothing was
+            profiled
+
+        """
+
+        if(not os.path.exists(directory)):
+            os.makedirs(directory)
+
+        baseName = os.path.join(directory, '%s-%s' % (name,
+            time.strftime('%Y%m%d-%H%M%S')))
+        dumpFilename = '%s.prof' % baseName
+        summaryFilename = '%s.txt' % baseName
+
+        # pstats prints bytes on Python 2 and text on Python 3
+        if(PY2):
+            f = open(summaryFilename, 'wb')
+        else:
+            f = open(summaryFilename, 'w')
+
+        with f:
+            stats = self.getStats(stream=f)
+            if(stats is None):
+                f.write('Nothing was profiled\n')
+                return(None)
+
+            stats.dump_stats(dumpFilename)
+
+            f.write('Hottest functions by own time\n')
+            stats.sort_stats('tottime').print_stats(top)
+            f.write('Hottest functions by cumulative time\n')
+            stats.sort_stats('cumulative').print_stats(top)
+
+        return(dumpFilename, summaryFilename)
+
+@contextmanager
+def profiled():
+    """
+    Profile the body of a with statement if profiling was started
+
+    """
+
+    if(profiler is None):
+        yield
+    else:
+        with profiler.section():
+            yield
+
+def start():
+    """
+    Start profiling the profiled sections of this run
+
+    """
+
+    global profiler
+
+    profiler = Profiler()
+
+def finish(directory, name, top=25):
+    """
+    Stop profiling and write the results
+
+    Input:
+        directory: Folder to write the profile dump and summary to
+        name: Name of the run, used for the file names
+        top: Number of functions listed in the summary
+
+    """
+
+    global profiler
+
+    if(profiler is None):
+        return
+
+    filenames = profiler.write(directory, name, top)
+    profiler = None
+
+    if(filenames):
+        sys.stderr.write('Profile written to %s\nSummary written to %s\n' %
+            filenames)
+
+def profileCached(cacheDirectory, repeat=1, wide=False, fields=None):
+    """
+    Parse and write a fixed set of cached sample documents
+
+    Runs the same parse and write code as a normal run over documents that
+    were saved with --cache-dir, so hot spots can be profiled without any
+    network. The output files go to a temporary folder.
+
+    Input:
+        cacheDirectory: Folder holding cached GSM MINiML documents
+        repeat: Number of passes over the documents
+        wide: Write with writeWide instead of writeLong
+        fields: Short tags to keep, as --fields takes them. None keeps
+            every tag
+    Return:
+        Number of samples parsed
+
+    """
+
+    import lxml.etree as ET
+
+    # Load pandas before profiling so its import does not show up as a hot
+    # spot of the first write
+    import pandas
+
+    from geoMetadata.fetch import getParser
+    from geoMetadata.writers import writeLong, writeWide
+
+    filenames = sorted(os.path.join(cacheDirectory, filename)
+        for filename in os.listdir(cacheDirectory)
+        if filename.startswith('GSM') and filename.endswith('.xml'))
+    if(not filenames):
+        raise ValueError('No cached GSM documents in %s' % cacheDirectory)
+
+    if(fields is not None):
+        fields = frozenset(fields)
+
+    parser = getParser()
+    outputDirectory = tempfile.mkdtemp()
+    count = 0
+
+    for i in range(repeat):
+        metadata = []
+        for filename in filenames:
+            with profiled():
+                metadata.append(parser.parseSample(
+                    ET.parse(filename).getroot(), fields))
+
+        with profiled():
+            if(wide):
+                writeWide(metadata, 'profile', outputDirectory)
+            else:
+                writeLong(metadata, 'profile', outputDirectory)
+
+        count += len(metadata)
+
+    shutil.rmtree(outputDirectory)
+
+    return(count)
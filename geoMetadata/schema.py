@@ -0,0 +1,342 @@
+"""
+Union of the columns of every accession written in a run
+
+Every series has its own set of tags, so the per accession files all have
+different columns. Collecting the union of the columns, and the type of each,
+while the files are written (or from their headers afterwards) lets the
+merged output be written in one aligned pass with a stable column order
+instead of realigning frames at every step.
+
+The values written in that pass are also measured per column (longest value,
+how many are filled, distinct values and whether all are numbers), so the
+table uploaded to Synapse gets tight column types and sizes and no empty
+columns.
+
+"""
+
+import re
+
+# Column types from the narrowest to the widest. A column seen with two
+# types takes the wider one
+TYPES = ('INTEGER', 'DOUBLE', 'STRING')
+
+# Distinct values counted per column. Beyond this the cardinality is only
+# known to be larger
+MAX_CARDINALITY = 1000
+
+# Integers as Python writes them, without a plus sign or leading zeros.
+# The patterns are anchored for str.match, which pandas has on every version
+# unlike str.fullmatch. \Z rather than $, which would let a value ending in
+# a line break through
+INTEGER_PATTERN = r'^(?:0|-?[1-9][0-9]*)\Z'
+
+# Floats as Python writes them, e.g. 1.5, 1e-05 or 2.5e+16
+FLOAT_PATTERN = r'^-?[0-9]+(?:\.[0-9]+)?(?:e[-+][0-9]+)?\Z'
+
+# Start of every number as Python writes it
+NUMBER_START = re.compile(r'-?[0-9]')
+
+# Largest positive and negative 64 bit integers, without the sign
+INT64_LIMITS = ('9223372036854775807', '9223372036854775808')
+
+# Digits of the integers a DOUBLE holds exactly
+MAX_DOUBLE_DIGITS = 15
+
+# Characters of STRING columns allowed in one table row. Synapse limits the
+# size of a row, so past this the widest STRING columns are made LARGETEXT,
+# which Synapse keeps outside the row
+ROW_SIZE_BUDGET = 16000
+
+class SchemaRegistry(object):
+    """
+    Ordered union of columns and their types
+
+    """
+
+    def __init__(self):
+        # Column names in the order they were first seen
+        self.columns = []
+
+        # Column name -> position in columns
+        self.positions = {}
+
+        # Column name -> one of TYPES
+        self.types = {}
+
+    def __len__(self):
+        return(len(self.columns))
+
+    def addColumns(self, columns, types=None):
+        """
+        Add the columns of one accession
+
+        Input:
+            columns: Column names in the order of the file
+            types: Type of each column, one of TYPES. STRING when not known
+
+        """
+
+        if(types is None):
+            types = ['STRING'] * len(columns)
+
+        for column, columnType in zip(columns, types):
+            if(column not in self.positions):
+                self.positions[column] = len(self.columns)
+                self.columns.append(column)
+                self.types[column] = columnType
+            elif(TYPES.index(columnType) > TYPES.index(self.types[column])):
+                self.types[column] = columnType
+
+    def addFrame(self, df):
+        """
+        Add the columns of a dataframe, with types from its dtypes
+
+        Input:
+            df: Dataframe of one accession, e.g. as returned by writeLong
+
+        """
+
+        self.addColumns([str(column) for column in df.columns],
+            [getColumnType(dtype) for dtype in df.dtypes])
+
+    def getPositions(self, columns):
+        """
+        Get where the columns of one accession go in the merged output
+
+        Input:
+            columns: Column names, all already added
+        Return:
+            List with the merged position of each column
+
+        """
+
+        return([self.positions[str(column)] for column in columns])
+
+def getColumnType(dtype):
+    """
+    Get the column type of a pandas dtype
+
+    Input:
+        dtype: dtype of a dataframe column
+    Return:
+        One of TYPES
+
+    """
+
+    if(dtype.kind in 'iu'):
+        return('INTEGER')
+
+    if(dtype.kind == 'f'):
+        return('DOUBLE')
+
+    return('STRING')
+
+class ColumnStats(object):
+    """
+    Measurements of the values written to each column of the merged table
+
+    """
+
+    def __init__(self, width):
+        """
+        Input:
+            width: Number of columns in the merged table
+
+        """
+
+        # Rows added so far
+        self.count = 0
+
+        # Per column: longest value, non empty values, distinct non empty
+        # values (up to MAX_CARDINALITY + 1 of them) and the narrowest of
+        # TYPES every value so far fits in
+        self.maxLengths = [0] * width
+        self.filled = [0] * width
+        self.distinct = [set() for i in range(width)]
+        self.types = ['INTEGER'] * width
+
+    def addRows(self, count):
+        """
+        Count the rows of one frame, whichever columns it has
+
+        """
+
+        self.count += count
+
+    def addValues(self, position, values, lengths=None):
+        """
+        Measure the values one frame writes to a column
+
+        Input:
+            position: Position of the column in the merged table
+            values: Series of the values as written, all text, '' for
+                missing ones
+            lengths: Series of the length of each value, when already known
+
+        """
+
+        if(lengths is None):
+            lengths = values.str.len()
+
+        # Lengths are numbers, so finding the filled values costs little
+        filled = lengths.values > 0
+        count = int(filled.sum())
+        if(not count):
+            return
+        if(count < len(values)):
+            values = values[filled]
+
+        self.filled[position] += count
+        self.maxLengths[position] = max(self.maxLengths[position],
+            int(lengths.max()))
+
+        # Only up to one more value than is counted is kept, however many
+        # a frame adds
+        distinct = self.distinct[position]
+        if(len(distinct) <= MAX_CARDINALITY):
+            distinct.update(values.unique()[:MAX_CARDINALITY + 1 -
+                len(distinct)].tolist())
+
+        # Once a column holds text it stays text, so only numeric columns
+        # are checked again
+        if(self.types[position] != 'STRING'):
+            valuesType = getValuesType(values)
+            if(TYPES.index(valuesType) > TYPES.index(self.types[position])):
+                self.types[position] = valuesType
+
+    def getColumnType(self, position):
+        """
+        Get the Synapse column type that fits a column
+
+        Input:
+            position: Position of the column in the merged table
+        Return:
+            INTEGER, DOUBLE or STRING, or None for a column with no values
+
+        """
+
+        if(not self.filled[position]):
+            return(None)
+
+        return(self.types[position])
+
+    def getTableColumns(self, columns):
+        """
+        Choose the type and size of every column of the uploaded table
+
+        Empty columns are left out. Numeric columns become INTEGER or DOUBLE
+        and text columns STRING sized to their longest value. If the STRING
+        columns of a row add up to more than ROW_SIZE_BUDGET characters, the
+        widest are made LARGETEXT until the rest fit.
+
+        Input:
+            columns: Names of the columns of the merged table, in order
+        Return:
+            List of (position, name, type, maximum size) tuples of the
+            columns to upload. The size is None for every type but STRING
+
+        """
+
+        tableColumns = []
+        strings = []
+
+        for position, name in enumerate(columns):
+            columnType = self.getColumnType(position)
+            if(columnType is None):
+                continue
+
+            maximumSize = None
+            if(columnType == 'STRING'):
+                maximumSize = max(1, self.maxLengths[position])
+                strings.append((maximumSize, len(tableColumns)))
+
+            tableColumns.append([position, name, columnType, maximumSize])
+
+        # Move the widest text out of the row until the rest fits
+        rowSize = sum(size for size, index in strings)
+        for size, index in sorted(strings, reverse=True):
+            if(rowSize <= ROW_SIZE_BUDGET):
+                break
+            tableColumns[index][2:] = ['LARGETEXT', None]
+            rowSize -= size
+
+        return([tuple(column) for column in tableColumns])
+
+    def getReport(self, columns):
+        """
+        Summarize the measurements of every column
+
+        Input:
+            columns: Names of the columns of the merged table, in order
+        Return:
+            List with a dictionary per column holding its name, type as
+            chosen by getTableColumns (None when it is empty and dropped),
+            maxLength, nullRatio and cardinality (MAX_CARDINALITY + 1
+            meaning more than MAX_CARDINALITY)
+
+        """
+
+        types = dict((column[0], column[2])
+            for column in self.getTableColumns(columns))
+        report = []
+
+        for position, name in enumerate(columns):
+            report.append({'name': name, 'type': types.get(position),
+                'maxLength': self.maxLengths[position],
+                'nullRatio': 1 - float(self.filled[position]) / self.count
+                    if self.count else 1.0,
+                'cardinality': min(len(self.distinct[position]),
+                    MAX_CARDINALITY + 1)})
+
+        return(report)
+
+def getValuesType(values):
+    """
+    Get the narrowest column type that holds every value exactly
+
+    A value only counts as a number if it is written back the same way from
+    the number, so '007', '+5' and '1.50' keep a STRING column, as do
+    integers beyond 64 bits and ones a DOUBLE can not hold exactly.
+
+    Input:
+        values: Series of values as text, none of them empty
+    Return:
+        One of TYPES
+
+    """
+
+    import numpy as np
+
+    # Most text columns are given away by their first value
+    if(not NUMBER_START.match(values.iloc[0])):
+        return('STRING')
+
+    # Integers without leading zeros, checked for the whole column at once
+    integers = values.str.match(INTEGER_PATTERN).values
+    negative = values.str.startswith('-').values
+    digits = values.str.len().values - negative
+
+    if(integers.all()):
+        # 19 digit numbers only fit in 64 bits up to the limit. Digit
+        # strings of the same length compare like the numbers
+        limits = np.where(negative, INT64_LIMITS[1], INT64_LIMITS[0])
+        fits = (digits < 19) | ((digits == 19) & (np.asarray(
+            values.str.lstrip('-'), dtype=object) <= limits.astype(object)))
+
+        return('INTEGER' if fits.all() else 'STRING')
+
+    # Larger integers are not exact as a DOUBLE
+    if((digits[integers] > MAX_DOUBLE_DIGITS).any()):
+        return('STRING')
+
+    # The rest must be floats written the way Python writes them. astype
+    # parses them exactly, unlike to_numeric, and writing them back shows
+    # any that are not
+    others = values[~integers]
+    if(not others.str.match(FLOAT_PATTERN).all()):
+        return('STRING')
+
+    if(not (others.astype('float64').astype(str) == others).all()):
+        return('STRING')
+
+    return('DOUBLE')
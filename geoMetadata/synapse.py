@@ -0,0 +1,372 @@
+"""
+Merge downloaded metadata and upload it to a Synapse table
+
+"""
+
+import csv
+import os
+
+from geoMetadata.compat import PY2, decodeText, encodeText, openCSV
+from geoMetadata.compression import openInput, stripExtension
+from geoMetadata.metrics import metrics
+from geoMetadata.schema import ColumnStats
+from geoMetadata.writers import CHUNK_ROWS, getStreamFilename
+
+# pandas and synapseclient are imported where they are used, and the client
+# only logs in when something is uploaded, so importing this module is cheap
+# and needs no network
+
+# Synapse client shared by all uploads. Created on first use by getSynapse
+syn = None
+
+# Name of the merged file written next to the per accession files
+MERGED_FILENAME = 'allData.csv'
+
+# Files starting with this hold merged output (allData.csv, allData.jsonl,
+# allData.parquet, ...) and are never read as an accession
+MERGED_PREFIX = 'allData.'
+
+# Synapse string columns are cut down to this many characters
+MAX_COLUMN_LENGTH = 1000
+
+# Values holding any of these are quoted in the merged file, as the csv
+# module does
+QUOTED_CHARACTERS = '[",\r\n]'
+
+def getSynapse():
+    """
+    Get the logged in Synapse client, creating it on first use
+
+    Return:
+        The logged in Synapse client
+
+    """
+
+    global syn
+
+    if(syn is None):
+        import synapseclient
+
+        syn = synapseclient.Synapse()
+        syn.login()
+
+    return(syn)
+
+def getStreamFrames(directory):
+    """
+    Read the merged file of a streaming run for writeMerged
+
+    The columns of the run must already be in the SchemaRegistry, as runBatch
+    adds them while streaming.
+
+    Input:
+        directory: The name of the directory holding the data
+    Return:
+        Iterator of dataframes of up to CHUNK_ROWS rows, all as text
+
+    """
+
+    import pandas as pd
+
+    # Every value was written as text. Keep it that way instead of letting
+    # pandas guess numbers and dates
+    with openInput(getStreamFilename(directory)) as f:
+        reader = pd.read_json(f, orient='records', lines=True, dtype=False,
+            convert_dates=False, chunksize=CHUNK_ROWS)
+        for df in reader:
+            yield(df)
+
+def getFileFrames(directory, schema):
+    """
+    Read every per accession file of a folder for writeMerged
+
+    Only the header of each file is read here, to add its columns to the
+    schema. The rows are read as they are written to the merged file.
+
+    Input:
+        directory: The name of the directory holding the data
+        schema: SchemaRegistry the columns of every file are added to
+    Return:
+        Iterator of dataframes of up to CHUNK_ROWS rows, all as text
+
+    """
+
+    # Delete merged file if it exists
+    try:
+        os.remove(os.path.join(directory, MERGED_FILENAME))
+    except OSError:
+        pass
+
+    return(readFiles(findFiles(directory, schema)))
+
+def findFiles(directory, schema):
+    """
+    Find the per accession files of a folder and add their columns
+
+    Input:
+        directory: The name of the directory holding the data
+        schema: SchemaRegistry the columns of every file are added to
+    Return:
+        List of (file name, separator) tuples for readFiles
+
+    """
+
+    files = []
+    for filename in sorted(os.listdir(directory)):
+        # The merged files repeat the other files, and the dead letter list
+        # of failures is not a table
+        if(filename.startswith(MERGED_PREFIX) or not stripExtension(
+                filename).endswith(('.csv', '.tsv'))):
+            continue
+
+        filename = os.path.join(directory, filename)
+        if os.path.isfile(filename):
+            # Files written with --format tsv are tab separated. Compressed
+            # files are read the same way
+            separator = '\t' if stripExtension(filename).endswith('.tsv') \
+                else ','
+            with openInput(filename) as f:
+                schema.addColumns(next(csv.reader(f, delimiter=separator),
+                    []))
+            files.append((filename, separator))
+
+    return(files)
+
+def readFiles(files):
+    """
+    Read the files found by getFileFrames a chunk at a time
+
+    """
+
+    import pandas as pd
+
+    for filename, separator in files:
+        with openInput(filename) as f:
+            for df in pd.read_csv(f, sep=separator, dtype=str,
+                    keep_default_na=False, chunksize=CHUNK_ROWS):
+                yield(df)
+
+def getText(series):
+    """
+    Get the values of a column as text
+
+    Input:
+        series: Column of a dataframe, of any type
+    Return:
+        Series of the values as text, '' for missing ones, indexed from 0
+
+    """
+
+    # Missing values are left empty. Everything else is written as text
+    if(series.isnull().any()):
+        series = series.astype(object).where(series.notnull(), '')
+
+    # Python 2 columns can mix bytes and unicode, which astype can not
+    if(PY2):
+        series = series.map(decodeText)
+    else:
+        series = series.astype(str)
+
+    return(series.reset_index(drop=True))
+
+def alignFrame(df, schema):
+    """
+    Get the values of each column of a dataframe as text
+
+    Input:
+        df: Dataframe whose columns are all in the schema
+        schema: SchemaRegistry of the merged table
+    Return:
+        Iterator of (position in the merged table, Series of text values)
+        tuples, with '' for missing values
+
+    """
+
+    for column, position in zip(df.columns, schema.getPositions(df.columns)):
+        yield(position, getText(df[column]))
+
+def quoteValues(values):
+    """
+    Quote text values the way the csv module writes them
+
+    Input:
+        values: Series of text values
+    Return:
+        The values, with those holding a comma, quote or line break put in
+        quotes and their quotes doubled
+
+    """
+
+    quoted = values.str.contains(QUOTED_CHARACTERS, regex=True)
+    if(not quoted.any()):
+        return(values)
+
+    return(values.where(~quoted,
+        '"' + values.str.replace('"', '""', regex=False) + '"'))
+
+def joinFrames(frames):
+    """
+    Join consecutive dataframes with the same columns into chunks
+
+    Each pandas call on a column costs about the same for 400 rows as for
+    10000, and the long format frames of most accessions share their
+    columns, so small frames are joined into chunks of up to CHUNK_ROWS
+    rows. Only frames with the same columns of the same types are joined,
+    so no value is upcast, e.g. an integer written as a float.
+
+    Input:
+        frames: Iterable of dataframes
+    Return:
+        Iterator of dataframes, each holding one or more of the frames
+
+    """
+
+    import pandas as pd
+
+    pending = []
+    rows = 0
+
+    for df in frames:
+        if(pending and (rows + len(df) > CHUNK_ROWS or
+                list(df.columns) != list(pending[0].columns) or
+                list(df.dtypes) != list(pending[0].dtypes))):
+            yield(pd.concat(pending, ignore_index=True)
+                if len(pending) > 1 else pending[0])
+            pending = []
+            rows = 0
+
+        pending.append(df)
+        rows += len(df)
+
+    if(pending):
+        yield(pd.concat(pending, ignore_index=True)
+            if len(pending) > 1 else pending[0])
+
+def writeMerged(filename, schema, frames):
+    """
+    Write the merged table in one aligned pass
+
+    The columns of each dataframe are placed straight into the column order
+    of the schema as its rows are written, so frames with different columns
+    are never concatenated, reindexed or upcast against each other. Columns
+    a frame does not have are left empty. Values are converted, cut down,
+    measured and quoted a column at a time with pandas string methods, on
+    chunks of frames joined by joinFrames, and each row is joined without a
+    Python step per value.
+
+    Input:
+        filename: Name of the merged file
+        schema: SchemaRegistry holding every column of the frames
+        frames: Iterable of dataframes, e.g. the list returned by runBatch,
+            getStreamFrames or getFileFrames
+    Return:
+        Tuple of the number of rows written and the ColumnStats of the
+        values written
+
+    """
+
+    width = len(schema)
+    stats = ColumnStats(width)
+    count = 0
+
+    with openCSV(filename, 'w') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow([encodeText(column) for column in schema.columns])
+
+        for df in joinFrames(frames):
+            if(not len(df) or not width):
+                continue
+
+            empty = [''] * len(df)
+            columns = [empty] * width
+
+            for position, values in alignFrame(df, schema):
+                # Some columns are longer than 1000 characters each. Cut
+                # them down to 1000 chars max
+                lengths = values.str.len()
+                if(lengths.max() > MAX_COLUMN_LENGTH):
+                    values = values.str.slice(0, MAX_COLUMN_LENGTH)
+                    lengths = lengths.clip(upper=MAX_COLUMN_LENGTH)
+
+                stats.addValues(position, values, lengths)
+                columns[position] = quoteValues(values).tolist()
+
+            # The csv module quotes the empty field of a single column row,
+            # as an empty line is no row at all
+            if(width == 1):
+                columns[0] = [value or '""' for value in columns[0]]
+
+            f.write(encodeText(u'\n'.join(map(u','.join, zip(*columns))) +
+                u'\n'))
+            stats.addRows(len(df))
+            count += len(df)
+
+    return(count, stats)
+
+def pruneMerged(filename, positions):
+    """
+    Keep only some columns of the merged file
+
+    Input:
+        filename: Name of the merged file
+        positions: Positions of the columns to keep, in order
+
+    """
+
+    temporaryFilename = '%s.tmp' % filename
+
+    with openCSV(filename, 'r') as f, openCSV(temporaryFilename, 'w') as out:
+        writer = csv.writer(out, lineterminator='\n')
+        for row in csv.reader(f):
+            writer.writerow([row[position] for position in positions])
+
+    os.remove(filename)
+    os.rename(temporaryFilename, filename)
+
+def upload(directory, synID, synName, schema, frames):
+    """
+    Upload the data to a Synapse table
+
+    Input:
+        directory: The name of the directory holding the data
+        synID: Synapse ID of the project where the table will be stored
+        synName: Name to be given to the new table
+        schema: SchemaRegistry holding every column of the frames
+        frames: Dataframes of every accession, see writeMerged
+    Return:
+        ColumnStats.getReport of the merged columns, with the empty ones
+        that were dropped having a type of None
+
+    """
+
+    from synapseclient import Column, Schema, Table
+
+    filename = os.path.join(directory, MERGED_FILENAME)
+
+    print("Writing to file")
+    with metrics.timer('merge'):
+        count, stats = writeMerged(filename, schema, frames)
+
+        # Columns with no values at all are not uploaded
+        tableColumns = stats.getTableColumns(schema.columns)
+        if(len(tableColumns) < len(schema)):
+            pruneMerged(filename, [column[0] for column in tableColumns])
+    metrics.count('columnsDropped', len(schema) - len(tableColumns))
+
+    print('Uploading %d of %d columns to Synapse' % (len(tableColumns),
+        len(schema)))
+    with metrics.timer('upload'):
+        # Each column gets the narrowest type that holds its values, and
+        # text columns are sized to the longest value
+        columns = []
+        for position, name, columnType, maximumSize in tableColumns:
+            if(maximumSize is None):
+                columns.append(Column(name=name, columnType=columnType))
+            else:
+                columns.append(Column(name=name, columnType=columnType,
+                    maximumSize=maximumSize))
+        tableSchema = Schema(name=synName, columns=columns, parent=synID)
+        getSynapse().store(Table(tableSchema, filename))
+    metrics.count('rowsUploaded', count)
+
+    return(stats.getReport(schema.columns))
@@ -0,0 +1,471 @@
+"""
+Write parsed sample metadata to files
+
+"""
+
+import os
+import time
+
+# pandas is imported where it is used so that importing this module does
+# not load it
+from geoMetadata import compression, normalize
+from geoMetadata.compat import encodeText, textType
+from geoMetadata.metrics import metrics
+
+# Output format of the long table -> column separator
+SEPARATORS = {'csv': ',', 'tsv': '\t'}
+
+# Name of the merged file streaming runs append every accession's rows to,
+# before any compression extension
+STREAM_FILENAME = 'allData.jsonl'
+
+# Rows formatted and written at a time, and read at a time when merging
+CHUNK_ROWS = 10000
+
+def writeLong(metadata, accessionID, directory, fileFormat='csv'):
+    """
+    Write the metadata to a csv file with one row per characteristic
+
+    Characteristics of channel 2 onwards of two channel samples get their
+    own rows, named '<characteristic> (chN)'.
+
+    Input
+        metadata: List of dictionaries containing all metadata information
+        accessionID: ID of the dataset the data belongs to
+        directory: Name of the folder to output data to
+        fileFormat: Output format, either csv or tsv
+    Return:
+        Dataframe holding the written rows
+
+    """
+
+    start = time.time()
+
+    # Empty dictionary to keep track of header names
+    header = ['Sample ID', 'Accession ID']
+
+    # Empty list to retain all characteristic keys
+    characteristicKeys = []
+
+    # Empty list for final output lists as dataframe
+    allRows = []
+
+    # Go through all metadata and identify all key names.
+    for person in metadata:
+        # Go through all keys for this specific person
+        for key in person.keys():
+            if(key == 'Contact-Ref' or key == 'Sample'):
+                pass
+
+            elif(key != 'Characteristics'):
+                if(key not in header):
+                    header.append(key)
+
+        if('Characteristics' in person.keys()):
+            # Gather all possible characteristics while here
+            # Characteristic can be either a string or dictionary.
+            for i in range(len(person['Characteristics'])):
+                # If the type of the current characteristic is a dict,
+                # add each key to the header if it does not already exist
+                if(type(person['Characteristics'][i]) is dict):
+                    # Go through all indices in characteristics
+                    for characteristic in person['Characteristics'][i].\
+                            keys():
+
+                        # If characteristic is not yet in the
+                        # list of characteristic keys, add it.
+                        if(characteristic not in characteristicKeys):
+                            characteristicKeys.append(characteristic)
+
+                # If the type of the characteristic is not a dict,
+                # it is a string, so add it to the characterList
+                else:
+                    if(not person['Characteristics'][i]):
+                        pass
+                    elif(person['Characteristics'][i] not in characteristicKeys):
+                        characteristicKeys.append(person['Characteristics'][i])
+
+    header.append('Characteristics')
+    header.append('Value')
+
+    # Go through all metadata and write to file
+    for person in metadata:
+        # Empty list that will hold all person lists
+        dataList = []
+        # Empty list to hold each person with just on charactertic
+        # Each will be one row in the final output file
+        personRow = []
+
+        personRow.append(person['Sample'][len(person['Sample'])-1])
+        personRow.append(accessionID)
+
+        # Go through all tags in the header to ensure order
+        for tag in header:
+            if(tag == 'Characteristics' or tag == 'Value' or
+                    tag == 'Sample' or tag == 'Contact-Ref' or
+                    tag == 'Sample ID' or tag == 'Accession ID'):
+                pass
+            # If a tag exists for this person, it must be added to the
+            # dataList
+            elif(tag in person.keys()):
+                featureList = person[tag]
+
+                for feature in featureList:
+                    # Need features to contain 1 element. If there is
+                    # more than 1, just write list for now
+                    if(len(featureList) > 1):
+                        personRow.append(str(featureList))
+                        break
+
+                    elif(type(feature) == textType):
+                        personRow.append(encodeText(feature))
+
+                    elif(type(feature) == dict):
+                        personRow.append(str(feature))
+
+                    else:
+                        personRow.append(feature)
+
+            # If tag isn't one of the blacklisted ones or characteristic
+            # or value, append a comma to the personRow so that it has
+            # same dimensions as the rest
+            else:
+                personRow.append('')
+
+        # Characteristic is a special case so must
+        # create separate loop for it
+        if('Characteristics' in person.keys()):
+            # Find the dictionary in the characteristics list
+            # Initialize variable to -1 so loops don't happen
+            # when dictionary doesn't exist
+            dictIndex = -1
+            for i in range(len(person['Characteristics'])):
+                if(type(person['Characteristics'][i]) is dict):
+                    dictIndex = i
+
+            # save the character list for this specific person
+            personCharList = person['Characteristics']
+
+            # Go through all characteristics possible and find
+            # which this person has
+            for characteristic in characteristicKeys:
+                # First search if the characteristic exists
+                # in the base list. If it does, it is just a
+                # string not attached to a dictionary
+                if(characteristic in personCharList):
+                    tempList = personRow[:]
+                    # Append the characteristic to the new item
+                    tempList.append(characteristic)
+
+                    # Append the characteristic to the tempList
+                    tempList.append('')
+
+                    # Append tempList to the dataList
+                    dataList.append(tempList)
+
+                # If it's not in the list, it either doesn't exist
+                # or is a key in the dictionary.
+                else:
+                    # Check if characteristic exists in the dict
+                    # If it does, add it to the dataList, otherwise
+                    # just skip it
+                    if(dictIndex > -1 and characteristic in
+                            person['Characteristics'][dictIndex].\
+                            keys()):
+
+                        tempList = personRow[:]
+                        # Append the characteristic to the new item
+                        tempList.append(characteristic)
+
+                        tempList.append(person\
+                            ['Characteristics'][dictIndex]\
+                            [characteristic])
+
+                        # Append tempList to the dataList
+                        dataList.append(tempList)
+
+        # If there is no characteristic for the current person
+        # dataList must be updated and blanks must be assigned to
+        # Characteristic and Value
+        else:
+            personRow.extend(['', ''])
+            dataList.append(personRow)
+
+        # Write the sample data to the allRows variable
+        for row in dataList:
+            allRows.append(row)
+
+    import pandas as pd
+
+    # Create a panda dataframe for the allRows
+    df = pd.DataFrame(allRows)
+
+    # Set the columns for the dataframe to header
+    df.columns = header
+
+    # Map the values through the vocabulary tables, each distinct one once
+    if(normalize.normalizer is not None):
+        normalize.normalizer.normalizeFrame(df)
+
+    # Create the directory if it does not exist yet
+    if(directory and not os.path.exists(directory)):
+        os.makedirs(directory)
+
+    # Write the metadata to the file, compressed if configured
+    filename = getLongFilename(accessionID, directory, fileFormat)
+    with compression.openOutput(filename) as f:
+        df.to_csv(f, sep=SEPARATORS[fileFormat], encoding='utf-8',
+            index=False, chunksize=CHUNK_ROWS)
+
+    metrics.record('write', time.time() - start)
+    metrics.count('rowsWritten', len(allRows))
+    metrics.count('filesWritten')
+
+    return df
+
+def getLongFilename(accessionID, directory, fileFormat):
+    """
+    Get the name of the file writeLong writes for an accession
+
+    Input:
+        accessionID: GEO accession number of the metadata
+        directory: Folder the file is written to
+        fileFormat: Output format, either csv or tsv
+    Return:
+        Name of the file, with the extension of the configured compression
+
+    """
+
+    return(compression.getFilename(os.path.join(directory, '%s.%s' %
+        (accessionID, fileFormat))))
+
+def getStreamFilename(directory):
+    """
+    Get the name of the merged file of a streaming run
+
+    Input:
+        directory: Folder the run writes to
+    Return:
+        Name of the merged file, with the extension of the configured
+        compression
+
+    """
+
+    return(compression.getFilename(os.path.join(directory,
+        STREAM_FILENAME)))
+
+def startStream(directory):
+    """
+    Start a new merged file for a streaming run
+
+    Input:
+        directory: Folder the run writes to
+
+    """
+
+    try:
+        os.remove(getStreamFilename(directory))
+    except OSError:
+        pass
+
+def appendStream(df, directory):
+    """
+    Append the rows of one accession to the merged file of a streaming run
+
+    Each row is written as one line of JSON. Accessions with different
+    columns can then be appended as they are written, without keeping
+    earlier accessions in memory or rewriting the file. Values are written
+    as text, the way the merged table is uploaded.
+
+    Input:
+        df: Dataframe returned by writeLong
+        directory: Folder the run writes to
+
+    """
+
+    start = time.time()
+
+    # Create the directory if it does not exist yet
+    if(directory and not os.path.exists(directory)):
+        os.makedirs(directory)
+
+    # Missing values are written empty rather than as 'nan'
+    lines = df.astype(str).mask(df.isnull(), '').to_json(orient='records',
+        lines=True, force_ascii=False)
+    if(lines and not lines.endswith('\n')):
+        lines += '\n'
+
+    # Compressed files are appended to as a new gzip member or zstd frame
+    with compression.openOutput(getStreamFilename(directory), True) as f:
+        f.write(encodeText(lines))
+
+    metrics.record('write', time.time() - start)
+
+def writeWide(metadata, accessionID, directory):
+    """
+    Write the metadata to a tsv file with one row per sample
+
+    Every unique characteristic gets its own column so that each sample
+    only has one entry in the table. Characteristics of channel 2 onwards
+    of two channel samples get their own '<characteristic> (chN)' columns.
+
+    Input
+        metadata: List of dictionaries containing all metadata information
+        accessionID: ID of the dataset the data belongs to
+        directory: Name of the folder to output data to
+
+    """
+
+    start = time.time()
+
+    # Empty dictionary to keep track of header names
+    header = {}
+
+    # Empty list to retain all characteristic keys
+    characteristicKeys = []
+
+    # Create the directory if it does not exist yet
+    if(directory and not os.path.exists(directory)):
+        os.makedirs(directory)
+
+    # Open output file, compressed if configured
+    f = compression.openOutput(compression.getFilename(os.path.join(
+        directory, '%s.tsv' % accessionID)))
+
+    # Write the first two columns as they will not be in the header
+    # dictionary
+    f.write('Sample ID\tAccession ID\t')
+
+    # Go through all metadata and identify all key names.
+    for person in metadata:
+        # Go through all keys for this specific person
+        for key in person.keys():
+            if(key == 'Contact-Ref' or key == 'Sample'):
+                pass
+            elif(key == 'Characteristics'):
+                # If key does not exist yet in header, create empty list for it
+                if(key not in header.keys()):
+                    header[key] = []
+
+                # Characteristic can be either a string or dictionary.
+                for i in range(len(person['Characteristics'])):
+                    # If the type of the current characteristic is a dict,
+                    # add each key to the header if it does not already exist
+                    if(type(person['Characteristics'][i]) is dict):
+                        # Go through all indices in characteristics
+                        for characteristic in person['Characteristics'][i].\
+                                keys():
+                            if(characteristic not in characteristicKeys):
+                                characteristicKeys.append(characteristic)
+                                header[key].append(characteristic)
+
+                    # If the type of the characteristic is not a dict,
+                    # it is a string, so add just it to the header
+                    else:
+                        if(not person['Characteristics'][i]):
+                            pass
+                        elif(person['Characteristics'][i] not in characteristicKeys):
+                            characteristicKeys.append(person['Characteristics'][i])
+                            header[key].append(person['Characteristics'][i])
+
+            else:
+                if(key not in header.keys()):
+                    header[key] = []
+
+    # Go through all headers and give values to each key if
+    # it does not have one yet
+    for key in header.keys():
+        # If key has no value, set value to the key
+        if(not header[key]):
+            header[key].append(key)
+        # Write values to output file
+        for value in header[key]:
+            f.write('%s\t' % value)
+
+    f.write('\n')
+    # Go through all metadata and write to file
+    for person in metadata:
+        f.write('%s\t' % person['Sample'][len(person['Sample'])-1])
+        f.write('%s\t' % accessionID)
+        for tag in header.keys():
+            if(tag in person.keys()):
+                featureList = person[tag]
+
+                # Characteristic is a special case so must
+                # create separate loop for it
+                if(tag == 'Characteristics'):
+                    # Find the dictionary in the characteristics list
+                    # Initialize variable to -1 so loops don't happen
+                    # when dictionary doesn't exist
+                    dictIndex = -1
+                    for i in range(len(person['Characteristics'])):
+                        if(type(person['Characteristics'][i]) is dict):
+                            dictIndex = i
+
+                    # save the character list for this specific person
+                    personCharList = person['Characteristics']
+
+                    # Go through all characteristics possible and find
+                    # which this person has
+                    for characteristic in characteristicKeys:
+
+                        # First search if the characteristic exists
+                        # in the base list. If it does, it is just a
+                        # string not attached to a dictionary
+                        if(characteristic in personCharList):
+                            # Just write yes if it exists
+                            f.write('Yes\t')
+
+                        # If it's not in the list, it either doest exist
+                        # or is a key in the dictionary.
+                        else:
+                            # Check if characteristic exists in the dict
+                            if(dictIndex > -1 and characteristic in
+                                    person['Characteristics'][dictIndex].\
+                                    keys()):
+
+                                value = person['Characteristics']\
+                                    [dictIndex][characteristic]
+                                if(normalize.normalizer is not None):
+                                    value = normalize.normalizer.\
+                                        normalizeValue(characteristic, value)
+
+                                # Write characteristic to file
+                                f.write('%s\t' % value)
+
+                            # If not in either list, it doesn't exist at all
+                            # so just write N/A so it is searchable
+                            else:
+                                f.write('N/A\t')
+
+                else:
+                    for feature in featureList:
+                        #print tag, feature
+                        if(tag == 'Contact-Ref' or tag == 'Sample'):
+                            pass
+
+                        elif(len(featureList) > 1):
+                            f.write('%s\t' % person[tag])
+                            break
+
+                        elif(type(feature) == tuple):
+                            for text in feature:
+                                f.write('%s ' % text)
+                            f.write('\t')
+
+                        elif(type(feature) == textType):
+                            f.write('%s\t' % encodeText(feature))
+
+                        else:
+                            f.write('%s\t' % feature)
+
+            else:
+                f.write('N/A\t')
+
+        f.write('\n')
+
+    f.close()
+
+    metrics.record('write', time.time() - start)
+    metrics.count('rowsWritten', len(metadata))
+    metrics.count('filesWritten')
@@ -0,0 +1,127 @@
+"""
+Local family archives, against the same series fetched from the mock server
+
+"""
+
+import io
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import lxml.etree as ET
+
+from syntheticGEO import CorpusSettings, writeCorpus
+
+from geoMetadata import cli, fetch
+from geoMetadata.archive import ArchiveError, iterArchives
+from geoMetadata.miniml import MINIML_NAMESPACE
+from geoMetadata.mockServer import MockServer
+
+# Data table of every sample in a family document, left out of the brief
+# documents the server sends
+DATA_TABLE = '<Data-Table xmlns="%s"><Column position="1"><Name>ID_REF'\
+    '</Name></Column><External-Data rows="2">GSM.txt</External-Data>'\
+    '</Data-Table>' % MINIML_NAMESPACE
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = dict((name, getattr(fetch, name))
+            for name in fetch.SETTINGS)
+        self.folder = tempfile.mkdtemp()
+        self.fixtures = os.path.join(self.folder, 'fixtures')
+        self.archives = os.path.join(self.folder, 'archives')
+        os.makedirs(self.archives)
+
+        self.series = writeCorpus(self.fixtures, CorpusSettings(samples=12,
+            series=2, keys=5, twoChannelFraction=0.3))
+        for seriesID in self.series:
+            self.writeArchive(seriesID)
+
+    def tearDown(self):
+        fetch.configure(**self.settings)
+        fetch.clearMemo()
+        shutil.rmtree(self.folder)
+
+    def writeArchive(self, seriesID):
+        """
+        Build the family archive of a series from the fixtures of the server
+
+        """
+
+        root = ET.parse(os.path.join(self.fixtures, '%s.xml' %
+            seriesID)).getroot()
+
+        # The brief document lists each sample by its accession only. The
+        # family document holds the whole sample in its place
+        sampleTag = '{%s}Sample' % MINIML_NAMESPACE
+        for element in root.findall(sampleTag):
+            root.remove(element)
+        for sample in self.series[seriesID]:
+            element = ET.parse(os.path.join(self.fixtures, '%s.xml' %
+                sample)).getroot().find(sampleTag)
+            element.append(ET.fromstring(DATA_TABLE))
+            root.append(element)
+        document = ET.tostring(root, xml_declaration=True, encoding='UTF-8')
+
+        filename = os.path.join(self.archives, '%s_family.xml.tgz' %
+            seriesID)
+        with tarfile.open(filename, 'w:gz') as archive:
+            member = tarfile.TarInfo('%s_family.xml' % seriesID)
+            member.size = len(document)
+            archive.addfile(member, io.BytesIO(document))
+
+    def readOutput(self, directory):
+        written = {}
+        for seriesID in self.series:
+            with open(os.path.join(directory, '%s.csv' % seriesID)) as f:
+                written[seriesID] = f.read()
+
+        return(written)
+
+    def testArchivesMatchDownloads(self):
+        downloaded = os.path.join(self.folder, 'downloaded')
+        with MockServer(self.fixtures) as server:
+            cli.main(['batch'] + sorted(self.series) + ['-d', downloaded,
+                '--geo-url', server.geoURL, '--rate-limit', '0'])
+
+        for workers in ('1', '2'):
+            read = os.path.join(self.folder, 'read%s' % workers)
+            cli.main(['archive', self.archives, '-d', read, '-w', workers])
+
+            self.assertEqual(self.readOutput(read),
+                self.readOutput(downloaded))
+
+    def testCorruptArchiveIsIsolated(self):
+        with open(os.path.join(self.archives, 'GSE404_family.xml.tgz'),
+                'wb') as f:
+            f.write(b'not an archive')
+
+        filenames = sorted(os.path.join(self.archives, filename)
+            for filename in os.listdir(self.archives))
+        results = dict((accessionID, metadata) for accessionID, metadata,
+            seconds in iterArchives(filenames, 2, True))
+        self.assertTrue(isinstance(results.pop('GSE404'), ArchiveError))
+        for seriesID, metadata in results.items():
+            self.assertEqual(len(metadata), len(self.series[seriesID]))
+
+        # The run goes on and lists the archive as failed
+        output = os.path.join(self.folder, 'output')
+        cli.main(['archive', self.archives, '-d', output, '-w', '2'])
+        self.assertEqual(sorted(self.readOutput(output)),
+            sorted(self.series))
+        with open(os.path.join(output, 'failed.jsonl')) as f:
+            failures = [json.loads(line) for line in f]
+        self.assertEqual([failure['accession'] for failure in failures],
+            ['GSE404'])
+        self.assertTrue(failures[0]['error'].startswith('ArchiveError: '))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+Synapse column types chosen from the values of the merged table
+
+"""
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd
+
+from geoMetadata.schema import MAX_CARDINALITY, ColumnStats, getValuesType
+
+class ColumnTypesTest(unittest.TestCase):
+    def getType(self, values):
+        return(getValuesType(pd.Series(values, dtype=object)))
+
+    def testIntegers(self):
+        self.assertEqual(self.getType(['1', '-2', '0']), 'INTEGER')
+        self.assertEqual(self.getType(['9223372036854775807',
+            '-9223372036854775808']), 'INTEGER')
+
+    def testLeadingZerosStayText(self):
+        for value in ('007', '-0', '+5', '00'):
+            self.assertEqual(self.getType(['1', value]), 'STRING')
+
+    def testIntegersBeyond64BitsStayText(self):
+        self.assertEqual(self.getType(['9223372036854775808']), 'STRING')
+        self.assertEqual(self.getType(['-9223372036854775809']), 'STRING')
+        self.assertEqual(self.getType(['1', '123456789012345678901']),
+            'STRING')
+
+    def testDoubles(self):
+        self.assertEqual(self.getType(['1.5', '2', '1e-05', '1e+16',
+            '0.30000000000000004']), 'DOUBLE')
+
+    def testInexactDoublesStayText(self):
+        # Written differently from the number, or an integer too long to be
+        # held exactly
+        for value in ('1.50', '1e20', '.5', 'inf', 'nan',
+                '1234567890123456789'):
+            self.assertEqual(self.getType(['1.5', value]), 'STRING')
+
+    def testColumnWidensOverFrames(self):
+        stats = ColumnStats(2)
+        stats.addValues(0, pd.Series(['1', '', '2']))
+        stats.addValues(1, pd.Series(['', '']))
+        self.assertEqual(stats.getColumnType(0), 'INTEGER')
+        self.assertEqual(stats.getColumnType(1), None)
+
+        stats.addValues(0, pd.Series(['2.5']))
+        self.assertEqual(stats.getColumnType(0), 'DOUBLE')
+
+        stats.addValues(0, pd.Series(['007']))
+        self.assertEqual(stats.getColumnType(0), 'STRING')
+
+    def testValuesWithLineBreaksStayText(self):
+        self.assertEqual(self.getType(['5', '6\n']), 'STRING')
+        self.assertEqual(self.getType(['5.5', '6.5\n']), 'STRING')
+
+    def testDistinctValuesAreCapped(self):
+        stats = ColumnStats(1)
+        stats.addValues(0, pd.Series(['a', 'b']))
+        stats.addValues(0, pd.Series(['v%d' % i
+            for i in range(MAX_CARDINALITY * 3)]))
+
+        # One more than is counted, however many one frame adds
+        self.assertEqual(len(stats.distinct[0]), MAX_CARDINALITY + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Compressed output, read back by gzip and by the upload readers
+
+"""
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import lxml.etree as ET
+import pandas as pd
+
+from syntheticGEO import CorpusSettings, makeCorpus
+
+from geoMetadata import compression, synapse, writers
+from geoMetadata.compression import BlockGzipWriter, openInput
+from geoMetadata.miniml import MINiMLParser
+from geoMetadata.schema import SchemaRegistry
+
+class CompressionTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = dict((name, getattr(compression, name))
+            for name in compression.SETTINGS)
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        compression.configure(**self.settings)
+        shutil.rmtree(self.folder)
+
+    def getMetadata(self, samples):
+        parser = MINiMLParser()
+        documents = makeCorpus(CorpusSettings(samples=samples, keys=8))[0]
+
+        return([parser.parseSample(ET.fromstring(documents[sample]))
+            for sample in sorted(documents)])
+
+    def testBlocksRoundTripAndAppend(self):
+        filename = os.path.join(self.folder, 'blocks.gz')
+        first = b''.join(b'row %d,value %d\n' % (i, i * i)
+            for i in range(5000))
+        second = b'appended,row\n' * 300
+
+        # Blocks much smaller than the data, so it is written as many gzip
+        # members by every thread
+        for threads in (1, 4):
+            with BlockGzipWriter(filename, 'wb', threads=threads,
+                    blockSize=1000) as f:
+                for start in range(0, len(first), 777):
+                    f.write(first[start:start + 777])
+            with BlockGzipWriter(filename, 'ab', threads=threads,
+                    blockSize=1000) as f:
+                f.write(second)
+
+            with gzip.open(filename, 'rb') as f:
+                self.assertEqual(f.read(), first + second)
+            with openInput(filename) as f:
+                self.assertEqual(f.read(), (first + second).decode('utf-8'))
+
+    def testLongFilesReadBackForUpload(self):
+        metadata = self.getMetadata(12)
+        plain = os.path.join(self.folder, 'plain')
+        compressed = os.path.join(self.folder, 'compressed')
+
+        expected = writers.writeLong(metadata, 'GSE1', plain)
+        compression.configure(compression='gzip', blockSize=2000)
+        written = writers.writeLong(metadata, 'GSE1', compressed)
+
+        self.assertEqual(os.listdir(compressed), ['GSE1.csv.gz'])
+        pd.testing.assert_frame_equal(written, expected)
+
+        # The upload reads the compressed file as it reads the plain one
+        frames = []
+        for directory in (plain, compressed):
+            schema = SchemaRegistry()
+            frames.append(pd.concat(synapse.getFileFrames(directory,
+                schema)))
+        pd.testing.assert_frame_equal(frames[1], frames[0])
+        self.assertEqual(len(frames[0]), len(expected))
+
+    def testStreamAppendsReadBackForUpload(self):
+        metadata = self.getMetadata(10)
+        frames = [writers.writeLong(metadata[:6], 'GSE1', self.folder),
+            writers.writeLong(metadata[6:], 'GSE2', self.folder)]
+
+        compression.configure(compression='gzip', blockSize=500)
+        writers.startStream(self.folder)
+        for df in frames:
+            writers.appendStream(df, self.folder)
+
+        # One gzip member or more for each accession appended
+        streamed = pd.concat(synapse.getStreamFrames(self.folder),
+            ignore_index=True)
+        expected = pd.concat(frames, ignore_index=True)
+        self.assertEqual(list(streamed.columns), list(expected.columns))
+        self.assertEqual(streamed.astype(str).values.tolist(),
+            expected.astype(str).mask(expected.isnull(), '').values.tolist())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Failed accessions and samples, listed and retried, against the mock server
+
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from syntheticGEO import CorpusSettings, makeSeriesDocument, writeCorpus
+
+from geoMetadata import cli, fetch
+from geoMetadata.mockServer import MockServer
+
+# Series of five samples each, GSE100 holding GSM1 to GSM5 and so on
+SERIES = dict(('GSE%d' % (100 + i), ['GSM%d' % (1 + 5 * i + k)
+    for k in range(5)]) for i in range(4))
+
+class FailuresTest(unittest.TestCase):
+    engine = 'threads'
+    schedule = False
+
+    def setUp(self):
+        self.settings = dict((name, getattr(fetch, name))
+            for name in fetch.SETTINGS)
+        self.folder = tempfile.mkdtemp()
+        self.fixtures = os.path.join(self.folder, 'fixtures')
+        self.backup = os.path.join(self.folder, 'backup')
+        self.output = os.path.join(self.folder, 'output')
+
+        writeCorpus(self.fixtures, CorpusSettings(samples=20, series=1,
+            keys=4))
+        for seriesID, samples in SERIES.items():
+            with open(os.path.join(self.fixtures, '%s.xml' % seriesID),
+                    'wb') as f:
+                f.write(makeSeriesDocument(seriesID, samples))
+        shutil.copytree(self.fixtures, self.backup)
+
+        # A sample that is not on the server, one that does not parse and
+        # a series that is not on the server
+        os.remove(os.path.join(self.fixtures, 'GSM7.xml'))
+        with open(os.path.join(self.fixtures, 'GSM3.xml'), 'w') as f:
+            f.write('<MINiML><broken')
+        os.remove(os.path.join(self.fixtures, 'GSE103.xml'))
+
+        self.server = MockServer(self.fixtures)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        fetch.configure(**self.settings)
+        fetch.clearMemo()
+        shutil.rmtree(self.folder)
+
+    def runBatch(self, directory, arguments):
+        fetch.clearMemo()
+        cli.main(['batch'] + arguments + ['-d', directory, '--geo-url',
+            self.server.geoURL, '--rate-limit', '0', '--retries', '0',
+            '--engine', self.engine] +
+            (['--schedule'] if self.schedule else []))
+
+    def readOutput(self, directory):
+        written = {}
+        for filename in os.listdir(directory):
+            if(filename.endswith('.csv')):
+                with open(os.path.join(directory, filename)) as f:
+                    written[filename] = f.read()
+
+        return(written)
+
+    def readFailures(self):
+        filename = os.path.join(self.output, 'failed.jsonl')
+        if(not os.path.exists(filename)):
+            return([])
+
+        with open(filename) as f:
+            return([json.loads(line) for line in f])
+
+    def testFailuresAreListedAndRetried(self):
+        self.runBatch(self.output, sorted(SERIES))
+
+        self.assertEqual(sorted((failure['accession'], failure['sample'])
+            for failure in self.readFailures()), [('GSE100', 'GSM3'),
+            ('GSE101', 'GSM7'), ('GSE103', None)])
+
+        # The rest of the failed accessions is written
+        written = self.readOutput(self.output)
+        self.assertEqual(sorted(written), ['GSE100.csv', 'GSE101.csv',
+            'GSE102.csv'])
+        for seriesID in ('GSE100', 'GSE101'):
+            samples = set(line.split(',')[0] for line in
+                written['%s.csv' % seriesID].splitlines()[1:])
+            self.assertEqual(len(samples), 4)
+
+        # Once the server is fixed, only the failed accessions are fetched
+        # again: their series documents and five samples each
+        shutil.rmtree(self.fixtures)
+        shutil.copytree(self.backup, self.fixtures)
+        before = self.server.getStats()['requests']
+        self.runBatch(self.output, ['--retry-failed'])
+        self.assertEqual(self.server.getStats()['requests'] - before, 18)
+        self.assertEqual(self.readFailures(), [])
+
+        clean = os.path.join(self.folder, 'clean')
+        self.runBatch(clean, sorted(SERIES))
+        self.assertEqual(self.readOutput(self.output),
+            self.readOutput(clean))
+
+class ScheduledFailuresTest(FailuresTest):
+    schedule = True
+
+@unittest.skipIf(sys.version_info < (3, 7),
+    'the async engine needs Python 3.7')
+class AsyncFailuresTest(FailuresTest):
+    engine = 'async'
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Field selection in the parser and the profile command
+
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import lxml.etree as ET
+
+from syntheticGEO import CorpusSettings, makeCorpus, writeCorpus
+
+from geoMetadata import cli, profiling
+from geoMetadata.miniml import MINiMLParser
+
+class FieldsTest(unittest.TestCase):
+    def testSelectedFieldsMatchFullParse(self):
+        samples, series = makeCorpus(CorpusSettings(samples=20,
+            twoChannelFraction=0.5))
+        parser = MINiMLParser()
+
+        for fields in (['Characteristics'], ['Title', 'Organism'],
+                ['Last-Update-Date', 'Description', 'Label']):
+            for document in samples.values():
+                root = ET.fromstring(document)
+                full = parser.parseSample(root)
+
+                # Only the wanted tags, and the Sample element for the ID
+                self.assertEqual(parser.parseSample(root, fields),
+                    dict((tag, values) for tag, values in full.items()
+                    if tag in fields or tag == 'Sample'))
+
+    def testProfileTakesFields(self):
+        folder = tempfile.mkdtemp()
+        calls = []
+        profileCached = profiling.profileCached
+
+        def recordCall(*args):
+            calls.append(args)
+            return(profileCached(*args))
+
+        profiling.profileCached = recordCall
+        try:
+            writeCorpus(folder, CorpusSettings(samples=5))
+            cli.main(['profile', folder, '--fields',
+                'Characteristics,Organism', '--profile',
+                os.path.join(folder, 'profiles')])
+        finally:
+            profiling.profileCached = profileCached
+            shutil.rmtree(folder)
+
+        self.assertEqual(calls[0][3], ['Characteristics', 'Organism'])
+
+if __name__ == '__main__':
+    unittest.main()
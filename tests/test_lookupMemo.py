@@ -0,0 +1,114 @@
+"""
+The memo of accession lookups, alone and against the mock GEO server
+
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from syntheticGEO import CorpusSettings, writeCorpus
+
+from geoMetadata import fetch
+from geoMetadata.fetch import LookupMemo
+from geoMetadata.mockServer import MockServer
+
+class FakeClock(object):
+    """
+    Stands in for the time module of fetch, moved on by hand
+
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return(self.now)
+
+class LookupMemoTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = dict((name, getattr(fetch, name))
+            for name in fetch.SETTINGS)
+        self.time = fetch.time
+
+    def tearDown(self):
+        fetch.time = self.time
+        fetch.configure(**self.settings)
+        fetch.clearMemo()
+
+    def testLeastRecentlyUsedIsEvicted(self):
+        memo = LookupMemo(2)
+        memo.add('a', 1)
+        memo.add('b', 2)
+        self.assertEqual(memo.get('a'), 1)
+        memo.add('c', 3)
+
+        self.assertEqual(memo.get('b'), None)
+        self.assertEqual((memo.get('a'), memo.get('c')), (1, 3))
+        self.assertEqual(len(memo), 2)
+
+        stats = memo.getStats()
+        self.assertEqual((stats['hits'], stats['misses'],
+            stats['evictions']), (3, 1, 1))
+
+    def testNothingIsKeptWithoutRoom(self):
+        memo = LookupMemo(0)
+        memo.add('a', 1)
+
+        self.assertEqual(memo.get('a'), None)
+        self.assertEqual(len(memo), 0)
+
+    def testLookupsExpire(self):
+        fetch.time = clock = FakeClock()
+        memo = LookupMemo(10, ttl=60)
+        memo.add('a', 1)
+
+        clock.now += 59
+        self.assertEqual(memo.get('a'), 1)
+
+        # Using a lookup does not keep it longer
+        clock.now += 1
+        self.assertEqual(memo.get('a'), None)
+        self.assertEqual(len(memo), 0)
+        self.assertEqual(memo.getStats()['expirations'], 1)
+
+    def testConfigureRebuildsMemo(self):
+        folder = tempfile.mkdtemp()
+        try:
+            series = writeCorpus(folder, CorpusSettings(samples=4,
+                series=1))
+            seriesID, samples = list(series.items())[0]
+
+            with MockServer(folder) as server:
+                fetch.configure(geoURL=server.geoURL, rateLimit=0,
+                    cacheDir=None, memoSize=10, memoTTL=None)
+
+                # The second lookup is remembered
+                for attempt in range(2):
+                    self.assertEqual(fetch.getSamples(seriesID), samples)
+                self.assertEqual(server.getStats()['requests'], 1)
+
+                # Settings unrelated to lookups keep the memo
+                memo = fetch.lookupMemo
+                fetch.configure(workers=3, retries=0)
+                self.assertTrue(fetch.lookupMemo is memo)
+
+                # Changing the memo starts an empty one with the new
+                # settings
+                fetch.configure(memoSize=5, memoTTL=30)
+                self.assertFalse(fetch.lookupMemo is memo)
+                self.assertEqual((fetch.lookupMemo.maxSize,
+                    fetch.lookupMemo.ttl, len(fetch.lookupMemo)), (5, 30, 0))
+                self.assertEqual(fetch.getSamples(seriesID), samples)
+                self.assertEqual(server.getStats()['requests'], 2)
+        finally:
+            shutil.rmtree(folder)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""
+Normalization of characteristic values
+
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+
+from geoMetadata import normalize
+from geoMetadata.normalize import Normalizer, getName, getNormalizer, \
+    readVocabulary
+
+class NormalizeTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        normalize.configure(enabled=False, vocabularies=())
+        shutil.rmtree(self.folder)
+
+    def writeVocabulary(self, tables):
+        filename = os.path.join(self.folder, 'vocabulary%d.json' %
+            len(os.listdir(self.folder)))
+        with open(filename, 'w') as f:
+            json.dump(tables, f)
+
+        return(filename)
+
+    def testBuiltInTables(self):
+        normalizer = getNormalizer()
+        cases = [('Sex', 'M', 'male'), ('gender', ' Female ', 'female'),
+            ('Sex (ch2)', 'woman', 'female'), ('sex', 'unknown', 'unknown'),
+            ('age', '45 yrs', 45.0), ('Age (years)', '61.5 years old', 61.5),
+            ('age', 30.0, 30.0), ('age', 'adult', 'adult'),
+            ('tissue', '  liver   lobe ', 'liver lobe'),
+            ('dose', '2.5', 2.5)]
+
+        for characteristic, value, expected in cases:
+            self.assertEqual(normalizer.normalizeValue(characteristic, value),
+                expected)
+
+    def testVocabularyFiles(self):
+        normalizer = getNormalizer([self.writeVocabulary({'tissue':
+            {'Hepatic': 'liver', '1': 'first'}}), self.writeVocabulary({'sex':
+            {'m': 'M'}})])
+
+        # Matched in any case, numeric keys match numbers too, and later
+        # tables take the place of the built in ones
+        self.assertEqual(normalizer.normalizeValue('Tissue', 'HEPATIC'),
+            'liver')
+        self.assertEqual(normalizer.normalizeValue('tissue', 1.0), 'first')
+        self.assertEqual(normalizer.normalizeValue('sex', 'M'), 'M')
+        self.assertEqual(normalizer.normalizeValue('sex', 'f'), 'female')
+
+        with self.assertRaises(ValueError):
+            readVocabulary(self.writeVocabulary({'sex': ['m', 'f']}))
+
+    def testCustomFunction(self):
+        normalizer = Normalizer()
+        self.assertEqual(normalizer.normalizeValue('Dose', '5 mg'), '5 mg')
+
+        # Adding a function forgets the values normalized before, and the
+        # table of the characteristic still comes first
+        normalizer.addFunction(['dose'], lambda value: 'dose %s' % value)
+        normalizer.addTable(['DOSE'], {'none': 0.0})
+        self.assertEqual(normalizer.normalizeValue('Dose', '5 mg'),
+            'dose 5 mg')
+        self.assertEqual(normalizer.normalizeValue('Dose (ch2)', 'None'),
+            0.0)
+
+    def testFrameMatchesEachValue(self):
+        normalizer = getNormalizer([self.writeVocabulary({'tissue':
+            {'hepatic': 'liver'}})])
+        characteristics = ['Sex', 'age', 'tissue', 'Sex (ch2)', 'other']
+        values = ['M', 'f', ' male ', '45 yrs', 45.0, 'hepatic', 'Hepatic',
+            np.nan, '3.5', 'a  b', 'adult', '']
+        df = pd.DataFrame({'Sample ID': ['GSM%d' % i for i in range(60)],
+            'Characteristics': [characteristics[i % 5] for i in range(60)],
+            'Value': [values[i % len(values)] for i in range(60)]})
+
+        # Every cell on its own, with no memo
+        expected = [np.nan if value is np.nan else Normalizer.normalize(
+            normalizer, getName(characteristic), value) for characteristic,
+            value in zip(df['Characteristics'], df['Value'])]
+
+        normalizer.normalizeFrame(df)
+        self.assertEqual([None if value is np.nan else value
+            for value in df['Value']], [None if value is np.nan else value
+            for value in expected])
+        self.assertEqual(df['Sample ID'].tolist(),
+            ['GSM%d' % i for i in range(60)])
+
+    def testConfigure(self):
+        normalize.configure(enabled=True, vocabularies=[self.writeVocabulary(
+            {'tissue': {'hepatic': 'liver'}})])
+        self.assertEqual(normalize.normalizer.normalizeValue('tissue',
+            'hepatic'), 'liver')
+
+        normalize.configure(enabled=False)
+        self.assertEqual(normalize.normalizer, None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+Retries of throttled and failed requests, against the mock GEO server
+
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from syntheticGEO import CorpusSettings, writeCorpus
+
+from geoMetadata import fetch, pipeline
+from geoMetadata.compat import HTTPError, urlopen
+from geoMetadata.metrics import metrics
+from geoMetadata.mockServer import STATS_PATH, MockServer
+
+class RetriesTest(unittest.TestCase):
+    engine = 'threads'
+
+    def setUp(self):
+        self.settings = dict((name, getattr(fetch, name))
+            for name in fetch.SETTINGS)
+        self.folder = tempfile.mkdtemp()
+        self.fixtures = os.path.join(self.folder, 'fixtures')
+
+        series = writeCorpus(self.fixtures, CorpusSettings(samples=24,
+            series=2, keys=4))
+        self.accessionIDs = sorted(series)
+        self.server = None
+
+    def tearDown(self):
+        if(self.server):
+            self.server.stop()
+        fetch.configure(**self.settings)
+        fetch.clearMemo()
+        shutil.rmtree(self.folder)
+
+    def startServer(self, **options):
+        if(self.server):
+            self.server.stop()
+        self.server = MockServer(self.fixtures, **options)
+        self.server.start()
+
+        # Retries wait for the Retry-After of the server, or a moment
+        fetch.configure(geoURL=self.server.geoURL, rateLimit=0, retries=20,
+            retryDelay=0.01, workers=4, engine=self.engine, cacheDir=None)
+        fetch.clearMemo()
+        metrics.reset()
+
+    def getServerStats(self):
+        usock = urlopen(self.server.baseURL + STATS_PATH)
+        try:
+            return(json.loads(usock.read().decode('utf-8')))
+        finally:
+            usock.close()
+
+    def runBatch(self, name):
+        """
+        Fetch every accession and read back the files written
+
+        """
+
+        directory = os.path.join(self.folder, name)
+        pipeline.runBatch(self.accessionIDs, directory)
+
+        written = {}
+        for accessionID in self.accessionIDs:
+            with open(os.path.join(directory, '%s.csv' % accessionID)) as f:
+                written[accessionID] = f.read()
+
+        return(written)
+
+    def testOutputSurvivesThrottlingAndFailures(self):
+        self.startServer()
+        expected = self.runBatch('expected')
+
+        self.startServer(throttleRate=100, burst=2, retryAfter=0.05,
+            failureRate=0.2, seed=1)
+        self.assertEqual(self.runBatch('throttled'), expected)
+
+        stats = self.getServerStats()
+        counters = metrics.snapshot()['counters']
+        self.assertTrue(stats['throttled'] and stats['failed'])
+
+        # Every request the server turned away was retried, and every
+        # request the client made reached the server
+        self.assertEqual(counters['retries'], stats['throttled'] +
+            stats['failed'])
+        self.assertEqual(counters['throttled'], stats['throttled'])
+        self.assertEqual(counters['requests'], stats['served'])
+        self.assertEqual(counters['requests'] + counters['retries'],
+            stats['requests'])
+
+    def testMissingAccessionIsNotRetried(self):
+        self.startServer()
+
+        with self.assertRaises(HTTPError) as context:
+            fetch.downloadSampleMetadata(['GSM404'])
+
+        self.assertEqual(context.exception.code, 404)
+        self.assertEqual(self.getServerStats()['requests'], 1)
+        self.assertNotIn('retries', metrics.snapshot()['counters'])
+
+@unittest.skipIf(sys.version_info < (3, 7),
+    'the async engine needs Python 3.7')
+class AsyncRetriesTest(RetriesTest):
+    engine = 'async'
+
+if __name__ == '__main__':
+    unittest.main()
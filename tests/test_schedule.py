@@ -0,0 +1,128 @@
+"""
+batch --schedule against plain batch runs, on the mock GEO server
+
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from syntheticGEO import CorpusSettings, makeSeriesDocument, writeCorpus
+
+from geoMetadata import fetch, pipeline
+from geoMetadata.fetch import SampleRegistry
+from geoMetadata.mockServer import MockServer
+
+class KeptRegistry(SampleRegistry):
+    """
+    SampleRegistry the test can look at once the run is over
+
+    """
+
+    instances = []
+
+    def __init__(self, maxSize=None):
+        SampleRegistry.__init__(self, maxSize)
+        KeptRegistry.instances.append(self)
+
+class ScheduleTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = dict((name, getattr(fetch, name))
+            for name in fetch.SETTINGS)
+        self.folder = tempfile.mkdtemp()
+        self.fixtures = os.path.join(self.folder, 'fixtures')
+
+        series = writeCorpus(self.fixtures, CorpusSettings(samples=30,
+            series=3, keys=4))
+        self.series = dict(series)
+        samples = [sample for seriesID in sorted(series)
+            for sample in series[seriesID]]
+
+        # A series sharing samples with the others, a small one and one
+        # as large as the largest, to be written in its original place
+        self.addSeries('GSE9000001', samples[::5])
+        self.addSeries('GSE9000002', samples[-1:])
+        self.addSeries('GSE9000003', samples[3:13])
+        self.accessionIDs = ['GSE9000002'] + sorted(series) + \
+            ['GSE9000003', 'GSE9000001']
+
+        self.server = MockServer(self.fixtures)
+        self.server.start()
+
+        # Windows of a few samples, so accessions span several
+        fetch.configure(geoURL=self.server.geoURL, rateLimit=0, retries=0,
+            cacheDir=None, batchSize=2, workers=2)
+        fetch.clearMemo()
+
+        self.saveAccession = pipeline.saveAccession
+        pipeline.saveAccession = self.recordSave
+        pipeline.SampleRegistry = KeptRegistry
+        KeptRegistry.instances = []
+        self.written = []
+
+    def tearDown(self):
+        pipeline.saveAccession = self.saveAccession
+        pipeline.SampleRegistry = SampleRegistry
+        self.server.stop()
+        fetch.configure(**self.settings)
+        fetch.clearMemo()
+        shutil.rmtree(self.folder)
+
+    def addSeries(self, seriesID, samples):
+        with open(os.path.join(self.fixtures, '%s.xml' % seriesID),
+                'wb') as f:
+            f.write(makeSeriesDocument(seriesID, samples))
+        self.series[seriesID] = samples
+
+    def recordSave(self, metadata, accessionID, *args):
+        # Samples held when each accession is written
+        held = set(KeptRegistry.instances[-1].records)
+        self.written.append((accessionID, held))
+        self.saveAccession(metadata, accessionID, *args)
+
+    def readOutput(self, directory):
+        written = {}
+        for filename in os.listdir(directory):
+            with open(os.path.join(directory, filename)) as f:
+                written[filename] = f.read()
+
+        return(written)
+
+    def testScheduledRunWritesSameFiles(self):
+        batch = os.path.join(self.folder, 'batch')
+        pipeline.runBatch(self.accessionIDs, batch)
+
+        self.written = []
+        fetch.clearMemo()
+        scheduled = os.path.join(self.folder, 'scheduled')
+        pipeline.runScheduled(self.accessionIDs, scheduled)
+
+        self.assertEqual(self.readOutput(scheduled), self.readOutput(batch))
+        self.assertEqual(len(self.readOutput(batch)), len(self.series))
+
+    def testLargestFirstAndRecordsReleased(self):
+        pipeline.runScheduled(self.accessionIDs,
+            os.path.join(self.folder, 'output'))
+
+        # Largest first, accessions of the same size in the given order
+        order = [accessionID for accessionID, held in self.written]
+        self.assertEqual(order, sorted(self.accessionIDs, key=lambda
+            accessionID: -len(self.series[accessionID])))
+
+        # Each record is held until the last accession holding it is
+        # written, and no longer
+        for position, (accessionID, held) in enumerate(self.written):
+            remaining = set(sample for later in order[position:]
+                for sample in self.series[later])
+            self.assertTrue(set(self.series[accessionID]) <= held)
+            self.assertTrue(held <= remaining)
+        self.assertEqual(len(KeptRegistry.instances[-1]), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Sharded batch runs merged back together, against the mock GEO server
+
+"""
+
+import csv
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from syntheticGEO import CorpusSettings, writeCorpus
+
+from geoMetadata import cli, fetch, pipeline
+from geoMetadata.compat import openCSV
+from geoMetadata.merge import SQLITE_TABLE
+from geoMetadata.mockServer import MockServer
+
+# Number of shards the accessions are split over
+SHARDS = 3
+
+class ShardsTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = dict((name, getattr(fetch, name))
+            for name in fetch.SETTINGS)
+        self.folder = tempfile.mkdtemp()
+        self.fixtures = os.path.join(self.folder, 'fixtures')
+
+        series = writeCorpus(self.fixtures, CorpusSettings(samples=36,
+            series=12, keys=6, twoChannelFraction=0.3))
+        self.accessionIDs = sorted(series)
+
+        self.server = MockServer(self.fixtures)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        fetch.configure(**self.settings)
+        fetch.clearMemo()
+        shutil.rmtree(self.folder)
+
+    def runBatch(self, directory, *options):
+        fetch.clearMemo()
+        cli.main(['batch'] + self.accessionIDs + ['-d', directory,
+            '--geo-url', self.server.geoURL, '--rate-limit', '0',
+            '--retries', '0'] + list(options))
+
+    def getWritten(self, directory):
+        """
+        Accession numbers of the files written to an output folder
+
+        """
+
+        return(set(os.path.splitext(filename)[0]
+            for filename in os.listdir(directory)
+            if filename.endswith('.csv')))
+
+    def readMerged(self, directory, outputFormat):
+        """
+        Rows of a merged file as sorted (column, value) tuples
+
+        """
+
+        if(outputFormat == 'sqlite'):
+            connection = sqlite3.connect(os.path.join(directory,
+                'allData.sqlite'))
+            try:
+                cursor = connection.execute('SELECT * FROM %s' %
+                    SQLITE_TABLE)
+                header = [column[0] for column in cursor.description]
+                rows = [list(row) for row in cursor]
+            finally:
+                connection.close()
+        else:
+            with openCSV(os.path.join(directory, 'allData.csv'), 'r') as f:
+                rows = list(csv.reader(f))
+            header = rows.pop(0)
+
+        # Shards add their columns in another order, and missing values are
+        # empty text in the csv file
+        return(sorted(tuple(sorted((column, value) for column, value in
+            zip(header, row) if value not in (None, ''))) for row in rows))
+
+    def testShardsMergeToUnshardedRun(self):
+        whole = os.path.join(self.folder, 'whole')
+        self.runBatch(whole)
+
+        shards = []
+        for index in range(1, SHARDS + 1):
+            shards.append(os.path.join(self.folder, 'shard%d' % index))
+            self.runBatch(shards[-1], '--shard', '%d/%d' % (index, SHARDS))
+
+        # Each accession is written by exactly the shard it belongs to
+        seen = set()
+        for index, directory in enumerate(shards, 1):
+            written = self.getWritten(directory)
+            self.assertFalse(written & seen)
+            seen |= written
+            for accessionID in written:
+                self.assertEqual(pipeline.getShardIndex(accessionID,
+                    SHARDS), index)
+            self.assertTrue(written)
+        self.assertEqual(seen, set(self.accessionIDs))
+
+        for outputFormat in ('csv', 'sqlite'):
+            merged = os.path.join(self.folder, 'merged', outputFormat)
+            cli.main(['merge', '-d', merged, '-f', outputFormat] + shards)
+            unsharded = os.path.join(self.folder, 'unsharded', outputFormat)
+            cli.main(['merge', '-d', unsharded, '-f', outputFormat, whole])
+
+            rows = self.readMerged(unsharded, outputFormat)
+            self.assertTrue(rows)
+            self.assertEqual(self.readMerged(merged, outputFormat), rows)
+
+if __name__ == '__main__':
+    unittest.main()
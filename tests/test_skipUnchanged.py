@@ -0,0 +1,135 @@
+"""
+batch --skip-unchanged against the mock GEO server
+
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from syntheticGEO import CorpusSettings, writeCorpus
+
+from geoMetadata import cli, fetch
+from geoMetadata.mockServer import MockServer
+
+class SkipUnchangedTest(unittest.TestCase):
+    engine = 'threads'
+    schedule = False
+
+    def setUp(self):
+        self.settings = dict((name, getattr(fetch, name))
+            for name in fetch.SETTINGS)
+        self.folder = tempfile.mkdtemp()
+        self.fixtures = os.path.join(self.folder, 'fixtures')
+        self.output = os.path.join(self.folder, 'output')
+        self.cache = os.path.join(self.folder, 'cache')
+
+        series = writeCorpus(self.fixtures, CorpusSettings(samples=4,
+            series=1, keys=4))
+        self.seriesID, self.samples = list(series.items())[0]
+
+        self.server = MockServer(self.fixtures)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        fetch.configure(**self.settings)
+        fetch.clearMemo()
+        shutil.rmtree(self.folder)
+
+    def editFixture(self, accessionID, old, new):
+        filename = os.path.join(self.fixtures, '%s.xml' % accessionID)
+        with open(filename, 'rb') as f:
+            document = f.read()
+        self.assertIn(old, document)
+        with open(filename, 'wb') as f:
+            f.write(document.replace(old, new, 1))
+
+    def runBatch(self, accessionID=None, output=None):
+        accessionID = accessionID or self.seriesID
+        output = output or self.output
+
+        fetch.clearMemo()
+        cli.main(['batch', accessionID, '-d', output, '--cache-dir',
+            self.cache, '--skip-unchanged', '--geo-url', self.server.geoURL,
+            '--entrez-url', self.server.entrezURL, '--rate-limit', '0',
+            '--retries', '0', '--engine', self.engine] +
+            (['--schedule'] if self.schedule else []))
+
+        with open(os.path.join(output, '%s.csv' % accessionID)) as f:
+            return(f.read())
+
+    def getRequests(self, run):
+        """
+        Number of requests the server answered during a run
+
+        """
+
+        before = self.server.getStats().get('requests', 0)
+        run()
+
+        return(self.server.getStats()['requests'] - before)
+
+    def testUpdatedSampleIsFetchedAgain(self):
+        self.assertNotIn('newKey', self.runBatch())
+
+        # A sample gains a characteristic and the series is marked updated
+        self.editFixture(self.samples[0], b'</Characteristics>',
+            b'</Characteristics>\n<Characteristics tag="newKey">fresh'\
+            b'</Characteristics>')
+        self.editFixture(self.seriesID, b'2011-03-01', b'2012-01-01')
+
+        self.assertIn('newKey', self.runBatch())
+
+    def testUnchangedSeriesIsSkipped(self):
+        first = self.runBatch()
+        before = self.server.getStats()
+
+        self.assertEqual(first, self.runBatch())
+
+        # Only the series document was requested again
+        after = self.server.getStats()
+        self.assertEqual(after['requests'] - before['requests'], 1)
+
+    def testNewAccessionUsesCachedSamples(self):
+        self.runBatch()
+
+        # Only the series document is requested to find its update date.
+        # The accession is new to this folder, not updated on GEO
+        self.assertEqual(self.getRequests(lambda: self.runBatch(
+            output=os.path.join(self.folder, 'other'))), 1)
+
+    def testUpdatedSeriesOfGDSIsFetchedAgain(self):
+        with open(os.path.join(self.fixtures, 'GDS1.txt'), 'w') as f:
+            f.write('\n'.join(self.samples + [self.seriesID]))
+
+        first = self.runBatch('GDS1')
+        self.assertIn(self.samples[0], first)
+
+        # The esummary and the series document only
+        self.assertEqual(self.getRequests(lambda: self.runBatch('GDS1')), 2)
+
+        # The series the GDS was curated from is revised
+        self.editFixture(self.samples[0], b'</Characteristics>',
+            b'</Characteristics>\n<Characteristics tag="newKey">fresh'\
+            b'</Characteristics>')
+        self.editFixture(self.seriesID, b'2011-03-01', b'2012-01-01')
+
+        self.assertIn('newKey', self.runBatch('GDS1'))
+
+class ScheduledSkipUnchangedTest(SkipUnchangedTest):
+    schedule = True
+
+@unittest.skipIf(sys.version_info < (3, 7),
+    'the async engine needs Python 3.7')
+class AsyncSkipUnchangedTest(SkipUnchangedTest):
+    engine = 'async'
+
+if __name__ == '__main__':
+    unittest.main()
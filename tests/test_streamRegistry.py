@@ -0,0 +1,142 @@
+"""
+Sample records held by streaming batch runs, against the mock GEO server
+
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from syntheticGEO import CorpusSettings, makeSeriesDocument, writeCorpus
+
+from geoMetadata import fetch, pipeline
+from geoMetadata.fetch import SampleRegistry
+from geoMetadata.mockServer import MockServer
+
+# Series holding the samples of every other series
+SUPER_SERIES = 'GSE9999999'
+
+class RecordingRegistry(SampleRegistry):
+    """
+    SampleRegistry remembering the records it held as each accession was
+    written
+
+    """
+
+    instances = []
+
+    def __init__(self, maxSize=None):
+        SampleRegistry.__init__(self, maxSize)
+        self.written = []
+        RecordingRegistry.instances.append(self)
+
+class StreamRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = dict((name, getattr(fetch, name))
+            for name in fetch.SETTINGS)
+        self.folder = tempfile.mkdtemp()
+        self.fixtures = os.path.join(self.folder, 'fixtures')
+        self.output = os.path.join(self.folder, 'output')
+        os.makedirs(self.output)
+
+        self.series = writeCorpus(self.fixtures, CorpusSettings(samples=12,
+            series=3, keys=4))
+        self.samples = [sample for seriesID in sorted(self.series)
+            for sample in self.series[seriesID]]
+        with open(os.path.join(self.fixtures, '%s.xml' % SUPER_SERIES),
+                'wb') as f:
+            f.write(makeSeriesDocument(SUPER_SERIES, self.samples))
+
+        self.server = MockServer(self.fixtures)
+        self.server.start()
+        fetch.configure(geoURL=self.server.geoURL, rateLimit=0, retries=0,
+            cacheDir=None)
+        fetch.clearMemo()
+
+        # Record what the registry holds as each accession is written
+        self.saveAccession = pipeline.saveAccession
+        self.registrySize = pipeline.STREAM_REGISTRY_SIZE
+        RecordingRegistry.instances = []
+        pipeline.SampleRegistry = RecordingRegistry
+        pipeline.saveAccession = self.recordSave
+
+    def tearDown(self):
+        pipeline.SampleRegistry = SampleRegistry
+        pipeline.saveAccession = self.saveAccession
+        pipeline.STREAM_REGISTRY_SIZE = self.registrySize
+        self.server.stop()
+        fetch.configure(**self.settings)
+        fetch.clearMemo()
+        shutil.rmtree(self.folder)
+
+    def recordSave(self, metadata, accessionID, *args):
+        self.saveAccession(metadata, accessionID, *args)
+        registry = RecordingRegistry.instances[-1]
+        registry.written.append((accessionID, set(registry.records)))
+
+    def getWritten(self):
+        """
+        Sample IDs of every file written to the output folder
+
+        """
+
+        written = {}
+        for seriesID in list(self.series) + [SUPER_SERIES]:
+            filename = os.path.join(self.output, '%s.csv' % seriesID)
+            with open(filename) as f:
+                written[seriesID] = set(line.split(',')[0]
+                    for line in f.read().splitlines()[1:])
+
+        return(written)
+
+    def checkWritten(self):
+        written = self.getWritten()
+        for seriesID, samples in self.series.items():
+            self.assertEqual(written[seriesID], set(samples))
+        self.assertEqual(written[SUPER_SERIES], set(self.samples))
+
+    def testScheduledRunLetsWrittenRecordsGo(self):
+        pipeline.runScheduled(list(self.series) + [SUPER_SERIES],
+            self.output, stream=True)
+        self.checkWritten()
+
+        # The series holding every sample is written first, and each
+        # record goes once the last series holding it is written
+        registry = RecordingRegistry.instances[-1]
+        remaining = set(self.samples)
+        for accessionID, held in registry.written:
+            self.assertEqual(held, remaining)
+            if(accessionID != SUPER_SERIES):
+                remaining -= set(self.series[accessionID])
+        self.assertEqual(len(registry), 0)
+
+    def testStreamingBatchRunKeepsFewRecords(self):
+        pipeline.STREAM_REGISTRY_SIZE = 3
+        pipeline.runBatch(sorted(self.series) + [SUPER_SERIES], self.output,
+            stream=True)
+        self.checkWritten()
+
+        registry = RecordingRegistry.instances[-1]
+        for accessionID, held in registry.written:
+            self.assertTrue(len(held) <= 3)
+
+    def testBoundedRegistryDropsLeastRecentlyUsed(self):
+        registry = SampleRegistry(2)
+        registry.add('GSM1', {'Sample ID': 'GSM1'})
+        registry.add('GSM2', {'Sample ID': 'GSM2'})
+        registry.get('GSM1')
+        registry.add('GSM3', {'Sample ID': 'GSM3'})
+
+        self.assertIn('GSM1', registry)
+        self.assertNotIn('GSM2', registry)
+        self.assertEqual(registry.getMissing(['GSM1', 'GSM2', 'GSM3']),
+            ['GSM2'])
+
+if __name__ == '__main__':
+    unittest.main()
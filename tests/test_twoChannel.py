@@ -0,0 +1,48 @@
+"""
+Characteristics of two channel samples, parsed from a fixture document
+
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lxml.etree as ET
+
+from geoMetadata import writers
+from geoMetadata.miniml import MINiMLParser
+
+# Sample with a tumor in channel 1 and its matched normal in channel 2
+FIXTURE = os.path.join(ROOT, 'tests', 'fixtures', 'GSM1000001.xml')
+
+class TwoChannelTest(unittest.TestCase):
+    def setUp(self):
+        self.sample = MINiMLParser().parseSample(ET.parse(
+            FIXTURE).getroot())
+
+    def testOnlyNamesOfChannel2GetSuffix(self):
+        # Values are kept as they are, numbers included, and characteristics
+        # without a value are the same name on any channel
+        self.assertEqual(self.sample['Characteristics'], [{'age': 5.0,
+            'sex': 'male', 'tissue': 'tumor', 'age (ch2)': 7.5,
+            'sex (ch2)': 'female'}, 'reference', 'untreated'])
+
+    def testLongFileHasRowPerChannel(self):
+        folder = tempfile.mkdtemp()
+        try:
+            df = writers.writeLong([self.sample], 'GSE1000001', folder)
+        finally:
+            shutil.rmtree(folder)
+
+        self.assertEqual([tuple(row) for row in df[['Characteristics',
+            'Value']].astype(str).values], [('age', '5.0'), ('sex', 'male'),
+            ('tissue', 'tumor'), ('age (ch2)', '7.5'),
+            ('sex (ch2)', 'female'), ('reference', ''), ('untreated', '')])
+
+if __name__ == '__main__':
+    unittest.main()
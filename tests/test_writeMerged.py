@@ -0,0 +1,86 @@
+"""
+The merged file written before an upload, read back with the csv module
+
+"""
+
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+
+from geoMetadata.compat import openCSV
+from geoMetadata.schema import SchemaRegistry
+from geoMetadata.synapse import MAX_COLUMN_LENGTH, writeMerged
+
+class WriteMergedTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filename = os.path.join(self.folder, 'allData.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def writeRows(self, frames):
+        """
+        Write the frames and read the merged file back
+
+        """
+
+        schema = SchemaRegistry()
+        for df in frames:
+            schema.addFrame(df)
+
+        count, stats = writeMerged(self.filename, schema, frames)
+        with openCSV(self.filename, 'r') as f:
+            rows = list(csv.reader(f))
+
+        self.assertEqual(count, len(rows) - 1)
+        return(rows, stats)
+
+    def testValuesNeedingQuotesReadBack(self):
+        values = ['plain', 'a, b', 'say "hi"', 'two\nlines',
+            'carriage\rreturn', '', '"', ',']
+        rows, stats = self.writeRows([pd.DataFrame({'Value': values,
+            'Sample ID': ['GSM%d' % i for i in range(len(values))]})])
+
+        self.assertEqual(rows[0], ['Value', 'Sample ID'])
+        self.assertEqual([row[0] for row in rows[1:]], values)
+
+    def testFramesWithDifferentColumnsAreAligned(self):
+        first = pd.DataFrame({'Sample ID': ['GSM1', 'GSM2'], 'age': [4, 5]})
+        second = pd.DataFrame({'Sample ID': ['GSM3'], 'age': [1.5],
+            'tissue': ['liver']})
+        third = pd.DataFrame({'Sample ID': ['GSM4'], 'age': [np.nan]})
+        rows, stats = self.writeRows([first, second, third])
+
+        # Integers stay integers next to a frame of floats, and missing
+        # values and columns are left empty
+        self.assertEqual(rows, [['Sample ID', 'age', 'tissue'],
+            ['GSM1', '4', ''], ['GSM2', '5', ''], ['GSM3', '1.5', 'liver'],
+            ['GSM4', '', '']])
+        self.assertEqual(stats.filled, [4, 3, 1])
+
+    def testLongValuesAreCut(self):
+        rows, stats = self.writeRows([pd.DataFrame({'Description':
+            ['x' * (MAX_COLUMN_LENGTH + 500), 'y, ' * MAX_COLUMN_LENGTH]})])
+
+        self.assertEqual([row[0] for row in rows[1:]],
+            ['x' * MAX_COLUMN_LENGTH, ('y, ' * MAX_COLUMN_LENGTH)[
+            :MAX_COLUMN_LENGTH]])
+        self.assertEqual(stats.maxLengths, [MAX_COLUMN_LENGTH])
+
+    def testEmptyValueOfSingleColumnIsKept(self):
+        rows, stats = self.writeRows([pd.DataFrame({'Value': ['a', '']})])
+
+        self.assertEqual(rows, [['Value'], ['a'], ['']])
+
+if __name__ == '__main__':
+    unittest.main()